@@ -1,16 +1,40 @@
+import datetime
 import streamlit as st
-import pandas as pd
-from utils.gsheets import load_data
-from utils.email_sender import send_email
+# Only Streamlit and the stdlib are imported up front, so the login screen
+# renders without loading pandas, Google or SMTP: data modules are imported
+# past the password check, the email stack when a send is shown or queued.
+from utils.timing import begin_rerun, phase, rerun_records, rolling_percentiles, prometheus_text, write_textfile
 
 # Page configuration
 st.set_page_config(page_title="Calendario - Smart working", page_icon="📅", layout="wide")
+begin_rerun()
 
 # Secrets
 MAGIC_WORD = st.secrets.get("MAGIC_WORD", "password")
 # You can put the sheet URL in secrets or hardcode it here if it's constant
 # For now, let's try to get it from secrets, or ask user input if missing
 SHEET_URL = st.secrets.get("SHEET_URL", "")
+# Several spreadsheets/worksheets, e.g. [[sheets]] url = "..." worksheets = ["Team A", "Team B"];
+# when set, SHEET_URL is ignored
+SHEETS = st.secrets.get("sheets", [])
+# Overlap rule, e.g. {rule = "fewer_than", status = "Casa", count = 2}; default: nobody at home
+OVERLAP_RULE_CONFIG = st.secrets.get("overlap_rule", None)
+# Per-phase timings: DIAGNOSTICS shows them in an expander, METRICS_TEXTFILE
+# is rewritten after every run for a Prometheus textfile collector
+DIAGNOSTICS = st.secrets.get("DIAGNOSTICS", False)
+METRICS_TEXTFILE = st.secrets.get("METRICS_TEXTFILE", "")
+# Large calendars are shown PAGE_SIZE persons at a time, and from
+# COMPACT_VIEW_ROWS rows with symbols instead of colored cells
+PAGE_SIZE = st.secrets.get("PAGE_SIZE", 50)
+# Email -> persons whose changes it receives ("*" for everybody), e.g.
+# [change_subscribers] "mario@example.com" = ["Mario Rossi"]
+CHANGE_SUBSCRIBERS = st.secrets.get("change_subscribers", {})
+# Desks in the office: days with more people at "Ufficio" are flagged (0: no limit)
+DESK_CAPACITY = st.secrets.get("DESK_CAPACITY", 0)
+COMPACT_VIEW_ROWS = st.secrets.get("COMPACT_VIEW_ROWS", 200)
+# Lets users edit a person's month from the app and write it back to the
+# shared sheet: off unless enabled, since every user of the app gets it
+EDITING = st.secrets.get("EDITING", False)
 
 def check_password():
     """Returns `True` if the user had the correct password."""
@@ -40,122 +64,242 @@ def check_password():
         # Password correct.
         return True
 
-import datetime
+@st.fragment(run_every=2)
+def poll_send_status(job_id):
+    """Shows the progress of a queued send, refreshing every 2 seconds."""
+    from utils.outbox import get_outbox, summarize_job
 
-def format_month_name(ym_str):
-    """Formats 'YYYY-MM' string to 'Month Year' in Italian."""
-    if not ym_str:
-        return ""
-    try:
-        from datetime import datetime
-        month_obj = datetime.strptime(ym_str, "%Y-%m")
-        month_name = month_obj.strftime("%B %Y")
-        month_names_it = {
-            "January": "Gennaio", "February": "Febbraio", "March": "Marzo",
-            "April": "Aprile", "May": "Maggio", "June": "Giugno",
-            "July": "Luglio", "August": "Agosto", "September": "Settembre",
-            "October": "Ottobre", "November": "Novembre", "December": "Dicembre"
-        }
-        for en, it in month_names_it.items():
-            month_name = month_name.replace(en, it)
-        return month_name
-    except:
-        return ym_str
-
-# ... (imports)
+    progress = summarize_job(get_outbox().status(job_id))
+    if not progress["pending"]:
+        st.rerun()  # Done: the full rerun shows the final result
+
+    done = len(progress["successful"]) + len(progress["failed"])
+    total = done + len(progress["pending"])
+    retrying = [r for r in progress["pending"] if r["attempts"]]
+    st.info(f"📤 Invio email in corso: {done}/{total}")
+    for row in retrying:
+        st.caption(f"🔁 {row['recipient']}: nuovo tentativo ({row['attempts']}) dopo errore: {row['last_error']}")
+
+def show_send_status(job_id):
+    """Shows the outcome of a queued send, polling while deliveries are pending."""
+    from utils.email_sender import summarize_results
+    from utils.outbox import get_outbox, summarize_job
+
+    progress = summarize_job(get_outbox().status(job_id))
+    if progress["pending"]:
+        poll_send_status(job_id)
+        return
+
+    # Final result, shown once
+    del st.session_state["outbox_job"]
+    if not progress["successful"] and not progress["failed"]:
+        st.error("Errore durante l'invio: Nessun indirizzo email valido trovato.")
+        st.warning(f"Indirizzi non validi: {', '.join(progress['invalid'])}")
+        return
+
+    success, message, results = summarize_results(progress["successful"], progress["failed"], progress["invalid"])
+    if success:
+        st.balloons()
+        st.success(message)
+        
+        # Show detailed results if there were any issues
+        if results.get("failed") or results.get("invalid"):
+            with st.expander("📋 Dettagli invio"):
+                if results.get("successful"):
+                    st.write("✅ **Inviate con successo:**")
+                    for email in results["successful"]:
+                        st.write(f"  - {email}")
+                
+                if results.get("failed"):
+                    st.write("❌ **Invio fallito:**")
+                    for email, error in results["failed"]:
+                        st.write(f"  - {email}: {error}")
+                
+                if results.get("invalid"):
+                    st.write("⚠️ **Indirizzi non validi:**")
+                    for email in results["invalid"]:
+                        st.write(f"  - {email}")
+    else:
+        st.error(f"Errore durante l'invio: {message}")
+        
+        # Show what went wrong
+        if results.get("invalid"):
+            st.warning(f"Indirizzi non validi: {', '.join(results['invalid'])}")
+
+def send_change_digests(changes):
+    """Queues a digest of `changes` to every subscriber following a changed person.
+
+    Returns the number of subscribers notified.
+    """
+    from calendar_core.diff import subscriber_changes
+    from calendar_core.report import change_digest
+    from utils.outbox import get_outbox
+
+    recipient_names = {}
+    if "recipient_emails" in st.secrets:
+        recipient_names = {email: name for name, email in st.secrets["recipient_emails"].items()}
+
+    notified = 0
+    for emails, subscriber_diff in subscriber_changes(changes, dict(CHANGE_SUBSCRIBERS)):
+        subject, body_html = change_digest(subscriber_diff)
+        get_outbox().enqueue(emails, subject, body_html, recipient_names=recipient_names)
+        notified += len(emails)
+    return notified
+
+def show_diagnostics():
+    """Shows the phase timings of this run and the rolling percentiles."""
+    import pandas as pd
+
+    with st.expander("🩺 Diagnostica"):
+        st.write("**Fasi di questa esecuzione**")
+        st.dataframe(pd.DataFrame(rerun_records()), hide_index=True)
+        st.write("**Percentili (ms) sulle ultime esecuzioni**")
+        st.dataframe(pd.DataFrame.from_dict(rolling_percentiles(), orient="index"))
+        st.code(prometheus_text(), language="text")
 
 if check_password():
+    import numpy as np
+    from calendar_core.months import find_month_column, format_month_name, selectable_months
+    from calendar_core.overlaps import rule_from_config
+    from calendar_core.report import format_days, month_email, parse_days
+    from calendar_core.stats import smart_working_stats
+    from calendar_core.styles import chart_color, compact_rows, css_matrix, legend, style_rows, symbol_matrix
+    from calendar_core.view import person_pages
+    from calendar_core.export import xlsx_available
+    from calendar_core.occupancy import OCCUPANCY_LABELS, occupancy_summary
+    from calendar_core.model import STATUS_LABELS, TEAM_COLUMN
+    from utils.gsheets import (
+        load_calendar, refresh_data, cache_stats, calendar_model, monthly_aggregates, overlaps_by_month,
+        cached_per_revision, team_frame, export_file, holiday_calendar, occupancy_frame,
+        calendar_changes, last_changes, save_row_edits, OFFLINE_MODE,
+    )
+    from utils.sheet_sync import RevisionConflict, SheetSource, sources_from_config
+
+    OVERLAP_RULE = rule_from_config(OVERLAP_RULE_CONFIG)
+
     st.title("📅 Calendario - Smart working")
     
-    if not SHEET_URL:
+    if not SHEET_URL and not SHEETS:
         st.warning("URL del foglio Google non trovato nei secrets. Inseriscilo qui sotto:")
         SHEET_URL = st.text_input("Google Sheet URL")
+
+    if SHEETS:
+        sources = sources_from_config(SHEETS)
+    else:
+        sources = [SheetSource(SHEET_URL)] if SHEET_URL else []
     
-    if SHEET_URL:
+    if sources:
+        # Manual invalidation of the shared sheet cache
+        if st.button("🔄 Aggiorna dati", help="Scarica di nuovo il foglio Google ignorando la cache."):
+            refresh_data(sources)
+
         with st.spinner("Caricamento calendario..."):
-            df = load_data(SHEET_URL)
+            df = load_calendar(sources)
+
+        stats = cache_stats()
+        st.caption(
+            f"Cache foglio: {stats['hits']} hit / {stats['misses']} miss / "
+            f"{stats['coalesced']} condivisi / {stats['stale_hits']} non aggiornati"
+        )
         
         if df is not None:
             st.toast("Calendario caricato!", icon="✅")
+
+            # --- Change Notifications ---
+            # Each new revision is diffed once per process against the previous
+            # one; subscribers get only the cells that changed for their persons
+            changes = calendar_changes(df, sources)
+            if changes is not None and len(changes) and CHANGE_SUBSCRIBERS:
+                try:
+                    with phase("enqueue_digest", changes=len(changes)):
+                        notified = send_change_digests(changes)
+                    if notified:
+                        st.toast(f"Calendario aggiornato: modifiche inviate a {notified} iscritti", icon="📨")
+                except Exception as e:
+                    st.warning(f"Impossibile inviare le notifiche delle modifiche: {e}")
+
+            recent_changes = last_changes(sources)
+            if recent_changes is not None and len(recent_changes):
+                with st.expander(f"🔔 Ultime modifiche ({len(recent_changes)})"):
+                    st.dataframe(recent_changes, hide_index=True)
+
+            # --- Team Filter ---
+            # Present when several worksheets are loaded: one team keeps only its
+            # rows, and every derived table is computed on them
+            # Revision of the whole calendar, before any filter: edits are checked against it
+            loaded_revision = df.attrs.get("revision")
+            selected_team = None
+            if TEAM_COLUMN in df.columns:
+                teams = cached_per_revision(df, "teams", lambda: list(df[TEAM_COLUMN].unique()))
+                selected_team = st.selectbox("Team", ["Tutti i team"] + teams)
+                if selected_team != "Tutti i team":
+                    df = team_frame(df, selected_team)
+
+            model = calendar_model(df)
             
             # --- Month Filtering Logic ---
-            # Assume the column containing 'yyyy-mm' is named 'mese' based on user context.
-            # If not found, try to guess or fallback.
-            month_col = 'mese'
-            if month_col not in df.columns:
-                # Fallback: try to find a column that looks like a date or 'month'
-                potential_cols = [c for c in df.columns if 'mese' in c.lower() or 'month' in c.lower() or 'date' in c.lower()]
-                if potential_cols:
-                    month_col = potential_cols[0]
-                else:
-                    st.error(f"Colonna '{month_col}' non trovata nel foglio. Colonne disponibili: {list(df.columns)}")
-                    month_col = None
+            # The column containing 'yyyy-mm' is 'mese', or the first one that
+            # looks like a month/date
+            month_col = find_month_column(list(df.columns))
+            if month_col is None:
+                st.error(f"Colonna 'mese' non trovata nel foglio. Colonne disponibili: {list(df.columns)}")
 
             if month_col:
                 # Get current year-month
                 now = datetime.datetime.now()
                 current_ym = now.strftime("%Y-%m")
                 
-                # Get unique months from dataframe
-                # Ensure they are strings and sort them
-                available_months = sorted([str(m) for m in df[month_col].unique() if pd.notna(m)])
-                
-                # Filter for future months only (>= current_ym)
-                future_months = [m for m in available_months if m >= current_ym]
-                
-                if not future_months:
+                # Future months only (>= current_ym), or all of them if none is left
+                future_months, no_future = selectable_months(list(model.months), current_ym)
+                if no_future:
                     st.warning(f"Nessun mese futuro trovato (>= {current_ym}). Mostro tutti i mesi disponibili.")
-                    future_months = available_months
 
                 # Dropdown for selection
                 selected_month = st.selectbox("Seleziona il mese", future_months, format_func=format_month_name)
                 
                 # Filter DataFrame
-                filtered_df = df[df[month_col] == selected_month]
+                with phase("filter", month=selected_month) as timing:
+                    month_rows = model.month_rows(selected_month)
+                    filtered_df = df.iloc[month_rows]
+                    timing["rows"], timing["cols"] = filtered_df.shape
             else:
+                month_rows = np.arange(len(df))
                 filtered_df = df # Fallback if column not found
 
+            # --- Large calendars ---
+            # Only one page of persons is sent to the browser, optionally searched
+            # by name; the compact view replaces the per-cell CSS with symbols
+            page_positions = np.arange(len(month_rows))
+            compact_view = False
+            if len(np.unique(model.row_person[month_rows])) > PAGE_SIZE:
+                c1, c2, c3 = st.columns([3, 1, 1], vertical_alignment="bottom")
+                with c1:
+                    person_query = st.text_input("Cerca persona", placeholder="Nome o parte del nome")
+                pages = person_pages(model, month_rows, person_query.strip(), PAGE_SIZE)
+                with c2:
+                    page_number = st.number_input("Pagina", min_value=1, max_value=len(pages), value=1)
+                with c3:
+                    compact_view = st.toggle("Vista compatta", value=len(month_rows) > COMPACT_VIEW_ROWS)
+                page_positions = pages[page_number - 1]
+                if len(page_positions):
+                    st.caption(f"Pagina {page_number} di {len(pages)}")
+                else:
+                    st.info(f"Nessuna persona trovata per \"{person_query.strip()}\".")
+
+            page_rows = month_rows[page_positions]
+            page_df = df.iloc[page_rows]
+
             # Styling
-            # Color all columns except 'persona' and 'mese' with unique colors for each value
-            columns_to_color = [col for col in filtered_df.columns if col.lower() not in ['persona', 'mese']]
-            
-            # Get all unique values from these columns to assign a consistent color map
-            unique_values = pd.unique(filtered_df[columns_to_color].values.ravel('K'))
-            
-            # Generate a color palette with fixed colors for specific values
-            def get_color_for_value(val):
-                if pd.isna(val) or str(val).strip() == "" or str(val).strip().upper() == "X":
-                    return ""
-                
-                # Fixed colors for specific values
-                color_map_fixed = {
-                    "Ferie": "background-color: #90EE90",  # Verde chiaro
-                    "Casa": "background-color: #ADD8E6",   # Blu chiaro
-                    "Ufficio": "background-color: #FFA500", # Arancione
-                    "Offsite": "background-color: #DAA520",  # Giallo scuro (goldenrod)
-                    "Trasferta": "background-color: #FF6B6B"  # Rosso chiaro
-                }
-                
-                val_stripped = str(val).strip()
-                if val_stripped in color_map_fixed:
-                    return color_map_fixed[val_stripped]
-                
-                # For other values, use hash-based colors
-                import hashlib
-                hash_object = hashlib.md5(str(val).encode())
-                hex_hash = hash_object.hexdigest()
-                hue = (int(hex_hash[0:8], 16) * 137) % 360
-                saturation = 60 + (int(hex_hash[8:10], 16) % 20)
-                lightness = 70 + (int(hex_hash[10:12], 16) % 10)
-                return f'background-color: hsl({hue}, {saturation}%, {lightness}%)'
-
-            # Create a map of value -> style string
-            color_map = {val: get_color_for_value(val) for val in unique_values}
-
-            def apply_color(val):
-                return color_map.get(val, "")
-
-            styled_df = filtered_df.style.map(apply_color, subset=columns_to_color)
+            # Color every day column from the coded statuses: one lookup per cell,
+            # cached per (month, data revision), then sliced to the page shown
+            month_key = selected_month if month_col else None
+            with phase("style", rows=len(page_df), compact=compact_view):
+                if compact_view:
+                    cell_symbols = cached_per_revision(df, ("symbols", month_key), lambda: symbol_matrix(model, month_rows))
+                    styled_df = compact_rows(page_df, model, cell_symbols[page_positions])
+                else:
+                    cell_css = cached_per_revision(df, ("css", month_key), lambda: css_matrix(model, month_rows))
+                    styled_df = style_rows(page_df, model, cell_css[page_positions])
             
             # Configure columns to hide headers for 'persona' and 'mese'/'data'
             # We try to match 'persona' and the identified month column
@@ -179,20 +323,77 @@ if check_password():
                 hide_index=True,
                 column_config=col_config
             )
-            
+            if compact_view:
+                st.caption(" · ".join(f"{symbol} {label}" for symbol, label in legend(model, page_rows)))
+
+            # Holidays are left out of the overlaps and stats, like weekends
+            if month_col:
+                dimension = holiday_calendar(df)
+                month_holidays = dimension.month_holidays(selected_month) if dimension else []
+                if month_holidays:
+                    st.caption("🎉 Festività: " + ", ".join(f"{day} {name}" for day, name in month_holidays))
+
+            # --- Editing ---
+            # The edits stay in the editor until "Salva": they are then written
+            # with one batch update and shown at once from the cached copy,
+            # unless the calendar changed since the editor was opened
+            if EDITING and not OFFLINE_MODE and month_col and "persona" in df.columns and len(month_rows):
+                with st.expander("✏️ Modifica calendario"):
+                    month_persons = model.persons[np.unique(model.row_person[month_rows])]
+                    edit_person = st.selectbox("Persona", list(month_persons), key="edit_person")
+                    person_rows = month_rows[model.row_person[month_rows] == model.persons.get_loc(edit_person)]
+                    edit_row = df.iloc[person_rows[-1:]][list(model.days)]
+                    edit_row = edit_row.astype(object).where(edit_row.notna(), "").astype(str)
+
+                    # The revision and values the edit starts from are kept until it
+                    # is saved or discarded, whatever reruns and syncs happen meanwhile
+                    edit_key = f"edit_{selected_month}_{edit_person}_{st.session_state.get('edit_saves', 0)}"
+                    if f"{edit_key}_base" not in st.session_state:
+                        st.session_state[f"{edit_key}_base"] = (loaded_revision, edit_row.iloc[0].to_dict())
+                    base_revision, base_values = st.session_state[f"{edit_key}_base"]
+
+                    options = [""] + list(dict.fromkeys(STATUS_LABELS[2:] + model.labels[2:]))
+                    edited_row = st.data_editor(
+                        edit_row,
+                        hide_index=True,
+                        column_config={day: st.column_config.SelectboxColumn(options=options) for day in edit_row.columns},
+                        key=edit_key,
+                    )
+                    if st.button("💾 Salva modifiche", key="save_edits"):
+                        changed = {
+                            day: edited_row.iloc[0][day]
+                            for day in edit_row.columns
+                            if edited_row.iloc[0][day] != base_values.get(day)
+                        }
+                        if TEAM_COLUMN in df.columns:
+                            edit_team = df.iloc[person_rows[-1]][TEAM_COLUMN]
+                        else:
+                            edit_team = selected_team
+                        try:
+                            written = save_row_edits(
+                                sources, base_revision, selected_month, edit_person, base_values, changed, edit_team
+                            )
+                        except RevisionConflict:
+                            # Start over from the current calendar
+                            del st.session_state[f"{edit_key}_base"]
+                            st.session_state["edit_saves"] = st.session_state.get("edit_saves", 0) + 1
+                            st.error("Il calendario è stato modificato nel frattempo: premi \"🔄 Aggiorna dati\" e ripeti la modifica.")
+                        except Exception as e:
+                            st.error(f"Errore nel salvataggio delle modifiche: {e}")
+                        else:
+                            if written:
+                                del st.session_state[f"{edit_key}_base"]
+                                st.session_state["edit_saves"] = st.session_state.get("edit_saves", 0) + 1
+                                st.toast(f"Salvate {written} celle", icon="💾")
+                                st.rerun()
+                            st.info("Nessuna modifica da salvare.")
+
             # --- Overlap Warning ---
-            # Check for days where ALL present values are in the target set
-            target_values = {"Trasferta", "Offsite", "Ufficio"}
-            overlap_days = []
-            
-            for col in columns_to_color:
-                # Get values for this column (day)
-                col_values = filtered_df[col].dropna().astype(str).values
-                
-                # Check if we have values and if ALL of them are in the target set
-                # We use strip() to handle potential whitespace
-                if len(col_values) > 0 and all(val.strip() in target_values for val in col_values):
-                    overlap_days.append(col)
+            # Days matching the overlap rule, evaluated for all months at once
+            # and cached per data revision
+            with phase("overlaps", rule=str(OVERLAP_RULE.key)) as timing:
+                overlap_days = list(overlaps_by_month(df, OVERLAP_RULE).get(selected_month if month_col else None, []))
+                timing["days"] = len(overlap_days)
             
             # Manual overlap addition
             st.write("**Gestione Sovrapposizioni**")
@@ -202,7 +403,7 @@ if check_password():
             )
             
             if manual_overlap_input:
-                manual_days = [d.strip() for d in manual_overlap_input.split(',') if d.strip()]
+                manual_days = parse_days(manual_overlap_input)
                 # Merge with automatic, avoiding duplicates
                 # We use a set to avoid duplicates, then convert back to list
                 current_overlaps = set(overlap_days)
@@ -210,17 +411,7 @@ if check_password():
                 overlap_days = list(current_overlaps)
             
             if overlap_days:
-                # Try to convert to integers for sorting and clean display (no decimals)
-                try:
-                    # Convert to int (handling potential floats like '1.0')
-                    int_days = sorted([int(float(x)) for x in overlap_days])
-                    # Join with comma
-                    days_str = ", ".join(map(str, int_days))
-                except ValueError:
-                    # Fallback if conversion fails
-                    days_str = ", ".join(sorted(overlap_days))
-                
-                st.warning(f"⚠️ Attenzione! Dog-sitting rahelistico necessario nei giorni: {days_str}.")
+                st.warning(f"⚠️ Attenzione! Dog-sitting rahelistico necessario nei giorni: {format_days(overlap_days)}.")
             # --- Smart Working Statistics ---
             st.subheader("📊 Statistiche Smart Working")
             
@@ -232,16 +423,18 @@ if check_password():
                 label_visibility="collapsed"
             )
             
-            stats_df_source = None
+            # Month ranges are answered from per-month prefix sums; without a
+            # month column the counts are computed over all rows.
+            stats_range = None
             
             if stats_mode == "Mese Selezionato":
-                stats_df_source = filtered_df
+                stats_range = (selected_month, selected_month) if month_col else "all"
                 current_range_label = f"Mese: {format_month_name(selected_month)}" if month_col else "Tutti i dati"
             else:
                 # Cumulative mode
                 if month_col:
                     # Get all available months sorted
-                    all_months = sorted([str(m) for m in df[month_col].unique() if pd.notna(m)])
+                    all_months = list(model.months)
                     
                     if all_months:
                         c1, c2 = st.columns(2)
@@ -253,64 +446,28 @@ if check_password():
                         
                         if start_month > end_month:
                             st.error("Il mese di inizio deve essere precedente o uguale al mese di fine.")
-                            stats_df_source = None
+                            stats_range = None
                         else:
                             # Filter by range
-                            stats_df_source = df[(df[month_col] >= start_month) & (df[month_col] <= end_month)]
+                            stats_range = (start_month, end_month)
                             current_range_label = f"Intervallo: {format_month_name(start_month)} - {format_month_name(end_month)}"
                     else:
                         st.warning("Nessun dato sui mesi trovato.")
-                        stats_df_source = df
+                        stats_range = "all"
                 else:
                     st.info("Colonna mese non trovata, uso tutti i dati.")
-                    stats_df_source = df
+                    stats_range = "all"
                     current_range_label = "Tutti i dati"
 
-            if stats_df_source is not None:
-                # Accumulate counts per person
-                person_stats = {}
-                
-                for index, row in stats_df_source.iterrows():
-                    person_name = row.get('persona', f"Persona {index+1}")
-                    
-                    # Get values for this row (excluding metadata columns)
-                    # We re-evaluate columns to exclude for every row to be safe, or just use the list we defined earlier
-                    # But columns_to_color was based on filtered_df which might have different columns if structure varies (unlikely)
-                    # Let's use a robust exclusion list
-                    exclude_cols = ['persona', 'mese', 'data']
-                    if month_col:
-                        exclude_cols.append(month_col)
-                        
-                    person_values = [str(val).strip() for col, val in row.items() 
-                                   if col.lower() not in [c.lower() for c in exclude_cols] and pd.notna(val) and str(val).strip() != ""]
-                    
-                    casa_count = person_values.count("Casa")
-                    ufficio_count = person_values.count("Ufficio")
-                    
-                    if person_name not in person_stats:
-                        person_stats[person_name] = {'casa': 0, 'ufficio': 0}
-                    
-                    person_stats[person_name]['casa'] += casa_count
-                    person_stats[person_name]['ufficio'] += ufficio_count
-                
-                # Build final stats list
-                stats_data = []
-                for person, counts in person_stats.items():
-                    total_relevant = counts['casa'] + counts['ufficio']
-                    if total_relevant > 0:
-                        sw_percentage = (counts['casa'] / total_relevant) * 100
+            if stats_range is not None:
+                with phase("stats", range=str(stats_range)) as timing:
+                    if stats_range == "all":
+                        stats_df = smart_working_stats(model, np.arange(len(df)))
                     else:
-                        sw_percentage = 0.0
-                        
-                    stats_data.append({
-                        "Persona": person,
-                        "Giorni Casa": counts['casa'],
-                        "Giorni Ufficio": counts['ufficio'],
-                        "% Smart Working": sw_percentage  # Use 0-100 scale
-                    })
+                        stats_df = monthly_aggregates(df).sw_stats(*stats_range)
+                    timing["rows"] = len(stats_df)
                 
-                if stats_data:
-                    stats_df = pd.DataFrame(stats_data)
+                if not stats_df.empty:
                     st.caption(f"Statistiche calcolate su: **{current_range_label}**")
                     st.dataframe(
                         stats_df,
@@ -329,6 +486,99 @@ if check_password():
                 else:
                     st.info("Nessun dato rilevante trovato per il calcolo delle statistiche.")
 
+            # --- Office Occupancy ---
+            # People per status on every working day of a month range, from
+            # per-day counts computed once per data revision
+            if month_col and len(model.months):
+                st.divider()
+                st.subheader("🏢 Occupazione ufficio")
+                all_months = list(model.months)
+                c1, c2 = st.columns(2)
+                with c1:
+                    occupancy_start = st.selectbox(
+                        "Da", all_months, index=all_months.index(selected_month),
+                        format_func=format_month_name, key="occupancy_start",
+                    )
+                with c2:
+                    occupancy_end = st.selectbox(
+                        "A", all_months, index=all_months.index(selected_month),
+                        format_func=format_month_name, key="occupancy_end",
+                    )
+
+                if occupancy_start > occupancy_end:
+                    st.error("Il mese di inizio deve essere precedente o uguale al mese di fine.")
+                else:
+                    with phase("occupancy", range=f"{occupancy_start}..{occupancy_end}") as timing:
+                        occupancy_df = occupancy_frame(df, occupancy_start, occupancy_end, DESK_CAPACITY or None)
+                        summary = occupancy_summary(occupancy_df, DESK_CAPACITY)
+                        timing["days"] = len(occupancy_df)
+
+                    if occupancy_df.empty:
+                        st.info("Nessun giorno lavorativo nell'intervallo selezionato.")
+                    else:
+                        m1, m2, m3 = st.columns(3)
+                        m1.metric("Picco in ufficio", summary["peak"], help=f"Il {summary['peak_date']:%d/%m/%Y}")
+                        m2.metric("Media in ufficio", f"{occupancy_df['Ufficio'].mean():.1f}")
+                        if DESK_CAPACITY:
+                            m3.metric("Giorni oltre capienza", summary["over_capacity"], help=f"Capienza: {DESK_CAPACITY} posti")
+
+                        st.bar_chart(
+                            occupancy_df[list(OCCUPANCY_LABELS)],
+                            color=[chart_color(label) for label in OCCUPANCY_LABELS],
+                            y_label="Persone",
+                        )
+                        if DESK_CAPACITY and summary["over_capacity"]:
+                            over = occupancy_df[occupancy_df["Oltre capienza"]]
+                            st.warning(
+                                f"⚠️ Più persone in ufficio dei {DESK_CAPACITY} posti disponibili in "
+                                f"{len(over)} giorni: {', '.join(f'{d:%d/%m/%Y}' for d in over.index[:20])}"
+                                + (" e altri." if len(over) > 20 else ".")
+                            )
+
+            # --- Exports ---
+            # Built on click (in a separate thread) and cached per month range,
+            # person and data revision
+            if month_col and len(model.months):
+                st.divider()
+                st.subheader("📥 Esporta")
+                all_months = list(model.months)
+                c1, c2, c3 = st.columns(3)
+                with c1:
+                    export_start = st.selectbox(
+                        "Da", all_months, index=all_months.index(selected_month),
+                        format_func=format_month_name, key="export_start",
+                    )
+                with c2:
+                    export_end = st.selectbox(
+                        "A", all_months, index=len(all_months) - 1,
+                        format_func=format_month_name, key="export_end",
+                    )
+                with c3:
+                    export_person = st.selectbox("Persona", ["Tutte le persone"] + list(model.persons), key="export_person")
+                export_person = None if export_person == "Tutte le persone" else export_person
+
+                export_formats = {"CSV": ("csv", "text/csv")}
+                if xlsx_available():
+                    export_formats["Excel"] = ("xlsx", "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet")
+                export_formats["Calendario (ICS)"] = ("ics", "text/calendar")
+                export_format = st.radio("Formato", list(export_formats), horizontal=True)
+                kind, mime = export_formats[export_format]
+
+                if export_start > export_end:
+                    st.error("Il mese di inizio deve essere precedente o uguale al mese di fine.")
+                elif kind == "ics" and export_person is None:
+                    st.info("Scegli una persona per esportare il suo calendario ICS.")
+                else:
+                    name = "_".join(filter(None, ["calendario", export_person, export_start, export_end])).replace(" ", "_")
+                    st.download_button(
+                        "Scarica",
+                        data=lambda: export_file(df, kind, export_start, export_end, export_person),
+                        file_name=f"{name}.{kind}",
+                        mime=mime,
+                        on_click="ignore",
+                        icon="📥",
+                    )
+
             st.divider()
             st.subheader("Invia Calendario")
             
@@ -362,67 +612,10 @@ if check_password():
             
             if st.button("Invia Email"):
                 if selected_recipients:
-                    # Format month name for email (e.g., "2025-12" -> "Dicembre 2025")
-                    try:
-                        from datetime import datetime
-                        month_obj = datetime.strptime(selected_month if month_col else "", "%Y-%m")
-                        month_name = month_obj.strftime("%B %Y")  # e.g., "December 2025"
-                        # Translate to Italian
-                        month_names_it = {
-                            "January": "Gennaio", "February": "Febbraio", "March": "Marzo",
-                            "April": "Aprile", "May": "Maggio", "June": "Giugno",
-                            "July": "Luglio", "August": "Agosto", "September": "Settembre",
-                            "October": "Ottobre", "November": "Novembre", "December": "Dicembre"
-                        }
-                        for en, it in month_names_it.items():
-                            month_name = month_name.replace(en, it)
-                    except:
-                        month_name = selected_month if month_col else "questo mese"
-                    
-                    # Build overlap message if any
-                    overlap_message = ""
-                    if overlap_days:
-                        try:
-                            int_days = sorted([int(float(x)) for x in overlap_days])
-                            days_str = ", ".join(map(str, int_days))
-                        except:
-                            days_str = ", ".join(sorted(overlap_days))
-                        overlap_message = f"<p><strong>⚠️ Attenzione:</strong> Sono state rilevate delle sovrapposizioni nei giorni: {days_str}.</p>"
-                    
-                    # Create HTML table from dataframe
-                    # Remove 'persona' and 'mese' column names for email/CSV
-                    email_df = filtered_df.copy()
-                    rename_map = {}
-                    if 'persona' in email_df.columns:
-                        rename_map['persona'] = ''
-                    if month_col and month_col in email_df.columns:
-                        rename_map[month_col] = ''
-                    if rename_map:
-                        email_df = email_df.rename(columns=rename_map)
-                    
-                    html_table = email_df.to_html(index=False, border=1)
-                    
-                    # Build personalized email body
-                    body_html = f"""
-                    <html>
-                    <body style="font-family: Tahoma, Geneva, sans-serif; font-size: 20px; line-height: 1.6; color: #333;">
-                        <p>Gentile {{recipient_name}},</p>
-                        
-                        <p>Di seguito puoi trovare il calendario di smart working aggiornato per il mese di <strong>{month_name}</strong>.</p>
-                        
-                        {overlap_message}
-                        
-                        <br>
-                        {html_table}
-                        
-                        <br>
-                        <p>In allegato anche il relativo file CSV.</p>
-            
-                        <p>Grazie mille,<br>
-                        Martino</p>
-                    </body>
-                    </html>
-                    """
+                    # Subject, body and CSV attachment for the selected month
+                    subject, body_html, email_df = month_email(
+                        filtered_df, month_col, selected_month if month_col else None, overlap_days
+                    )
                     
                     # Create a mapping of email -> name from predefined recipients
                     recipient_names_map = {}
@@ -431,41 +624,34 @@ if check_password():
                         for name, email in predefined_recipients.items():
                             recipient_names_map[email] = name
                     
-                    with st.spinner("Invio email in corso..."):
-                        success, message, results = send_email(
-                            selected_recipients, 
-                            f"Calendario {month_name} - Smart Working", 
-                            body_html, 
-                            attachment_df=email_df,
-                            recipient_names=recipient_names_map
-                        )
-                    
-                    if success:
-                        st.balloons()
-                        st.success(message)
-                        
-                        # Show detailed results if there were any issues
-                        if results.get("failed") or results.get("invalid"):
-                            with st.expander("📋 Dettagli invio"):
-                                if results.get("successful"):
-                                    st.write("✅ **Inviate con successo:**")
-                                    for email in results["successful"]:
-                                        st.write(f"  - {email}")
-                                
-                                if results.get("failed"):
-                                    st.write("❌ **Invio fallito:**")
-                                    for email, error in results["failed"]:
-                                        st.write(f"  - {email}: {error}")
-                                
-                                if results.get("invalid"):
-                                    st.write("⚠️ **Indirizzi non validi:**")
-                                    for email in results["invalid"]:
-                                        st.write(f"  - {email}")
-                    else:
-                        st.error(f"Errore durante l'invio: {message}")
-                        
-                        # Show what went wrong
-                        if results.get("invalid"):
-                            st.warning(f"Indirizzi non validi: {', '.join(results['invalid'])}")
+                    from utils.outbox import get_outbox
+
+                    # Queued in the durable outbox: the background worker sends it
+                    # and retries transient failures, the status is polled below
+                    try:
+                        with phase("enqueue_email", recipients=len(selected_recipients)):
+                            st.session_state["outbox_job"] = get_outbox().enqueue(
+                                selected_recipients, 
+                                subject, 
+                                body_html, 
+                                attachment_df=email_df,
+                                recipient_names=recipient_names_map
+                            )
+                    except Exception as e:
+                        # Missing or incomplete [email] settings, unwritable outbox
+                        st.error(f"Errore durante l'invio: Errore di connessione: {str(e)}")
                 else:
                     st.warning("Seleziona o inserisci almeno un indirizzo email.")
+
+            job_id = st.session_state.get("outbox_job")
+            if job_id:
+                show_send_status(job_id)
+
+    if DIAGNOSTICS:
+        show_diagnostics()
+
+if METRICS_TEXTFILE:
+    try:
+        write_textfile(METRICS_TEXTFILE)
+    except OSError as e:
+        st.warning(f"Impossibile scrivere le metriche in {METRICS_TEXTFILE}: {e}")
@@ -0,0 +1 @@
+"""Offline benchmarks for the calendar pipeline (run from the repo root)."""
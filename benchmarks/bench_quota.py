@@ -0,0 +1,52 @@
+"""Many sessions loading at once against a fake Sheets endpoint with a quota.
+
+Usage: python -m benchmarks.bench_quota [sessions] [quota_per_second]
+
+Compares plain gspread clients, which fail with 429 errors once the quota is
+used up, with clients sharing the RateLimiter of utils.rate_limit.
+"""
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from gspread.http_client import HTTPClient
+
+from benchmarks.fake_gspread import FakeSheetsAPI, FakeSpreadsheet
+from benchmarks.generator import make_calendar
+from utils.rate_limit import RateLimiter, limited_http_client
+from utils.sheet_sync import full_sync
+
+
+def run(sessions, quota_per_second, http_client, label):
+    spreadsheet = FakeSpreadsheet.from_frame(make_calendar(30, 12))
+    api = FakeSheetsAPI(spreadsheet, latency=0.02, quota=(quota_per_second, 1.0))
+
+    def load(_):
+        start = time.perf_counter()
+        try:
+            full_sync(api.client(http_client), spreadsheet.url)
+            return "ok", time.perf_counter() - start
+        except Exception as e:
+            return type(e).__name__, time.perf_counter() - start
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=sessions) as pool:
+        results = list(pool.map(load, range(sessions)))
+    elapsed = time.perf_counter() - start
+
+    ok = sum(1 for outcome, _ in results if outcome == "ok")
+    slowest = max(duration for _, duration in results)
+    print(f"{label:>12}: {ok}/{sessions} loaded in {elapsed:.2f} s (slowest {slowest:.2f} s), requests {api.calls}")
+
+
+def main():
+    sessions = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    quota = int(sys.argv[2]) if len(sys.argv) > 2 else 10
+    run(sessions, quota, HTTPClient, "plain")
+    limiter = RateLimiter(rate=quota, burst=1, base_delay=0.2)
+    run(sessions, quota, limited_http_client(limiter), "rate limited")
+    print(f"{'limiter':>12}: {limiter.stats()}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+"""Compares the vectorized SW statistics with the original iterrows loop.
+
+Usage: python -m benchmarks.bench_stats [n_people] [n_months]
+"""
+import sys
+import time
+
+import pandas as pd
+
+from benchmarks.generator import make_calendar
+from calendar_core.model import build_calendar_model
+from calendar_core.stats import MonthlyAggregates, smart_working_stats
+
+
+def legacy_stats(stats_df_source, month_col):
+    """The per-row loop previously inlined in app.py, kept as reference."""
+    person_stats = {}
+    for index, row in stats_df_source.iterrows():
+        person_name = row.get('persona', f"Persona {index+1}")
+        exclude_cols = ['persona', 'mese', 'data']
+        if month_col:
+            exclude_cols.append(month_col)
+        person_values = [str(val).strip() for col, val in row.items()
+                         if col.lower() not in [c.lower() for c in exclude_cols] and pd.notna(val) and str(val).strip() != ""]
+        casa_count = person_values.count("Casa")
+        ufficio_count = person_values.count("Ufficio")
+        if person_name not in person_stats:
+            person_stats[person_name] = {'casa': 0, 'ufficio': 0}
+        person_stats[person_name]['casa'] += casa_count
+        person_stats[person_name]['ufficio'] += ufficio_count
+
+    stats_data = []
+    for person, counts in person_stats.items():
+        total_relevant = counts['casa'] + counts['ufficio']
+        sw_percentage = (counts['casa'] / total_relevant) * 100 if total_relevant > 0 else 0.0
+        stats_data.append({
+            "Persona": person,
+            "Giorni Casa": counts['casa'],
+            "Giorni Ufficio": counts['ufficio'],
+            "% Smart Working": sw_percentage,
+        })
+    return pd.DataFrame(stats_data)
+
+
+def main(n_people=50, n_months=36):
+    df = make_calendar(n_people, n_months)
+    model = build_calendar_model(df, "mese")
+    rows = model.month_rows(model.months[0], model.months[-1])
+
+    start = time.perf_counter()
+    expected = legacy_stats(df, "mese")
+    legacy_s = time.perf_counter() - start
+
+    start = time.perf_counter()
+    actual = smart_working_stats(model, rows)
+    vectorized_s = time.perf_counter() - start
+
+    start = time.perf_counter()
+    aggregates = MonthlyAggregates(model)
+    build_s = time.perf_counter() - start
+    start = time.perf_counter()
+    from_prefix = aggregates.sw_stats(model.months[0], model.months[-1])
+    prefix_s = time.perf_counter() - start
+
+    pd.testing.assert_frame_equal(actual, expected, check_dtype=False)
+    pd.testing.assert_frame_equal(from_prefix, expected, check_dtype=False)
+    print(f"{len(df)} rows x {len(model.days)} days")
+    print(f"iterrows loop: {legacy_s * 1000:.1f} ms")
+    print(f"vectorized:    {vectorized_s * 1000:.1f} ms ({legacy_s / vectorized_s:.0f}x)")
+    print(f"prefix sums:   {prefix_s * 1000:.2f} ms per range (built once in {build_s * 1000:.1f} ms)")
+
+
+if __name__ == "__main__":
+    main(*map(int, sys.argv[1:]))
@@ -0,0 +1,307 @@
+import json
+import threading
+import time
+from collections import deque
+from urllib.parse import parse_qs, unquote, urlsplit
+
+import gspread
+import requests
+from gspread.http_client import HTTPClient
+from gspread.utils import a1_range_to_grid_range, numericise_all, to_records
+
+
+def _cell(value):
+    """Renders a value the way the Sheets API returns formatted cells."""
+    return "" if value is None else str(value)
+
+
+class FakeSpreadsheet:
+    """In-memory spreadsheet: worksheets are lists of rows of formatted strings.
+
+    Every edit bumps `revision`, reported as the Drive modifiedTime.
+    """
+
+    def __init__(self, sheet_id, worksheets):
+        self.id = sheet_id
+        self.worksheets = worksheets  # title -> rows (header first)
+        self.revision = 1
+
+    @classmethod
+    def from_frame(cls, df, sheet_id="fake-sheet", title="Foglio1"):
+        return cls.from_frames({title: df}, sheet_id)
+
+    @classmethod
+    def from_frames(cls, frames, sheet_id="fake-sheet"):
+        """Builds a spreadsheet with one worksheet per {title: DataFrame} entry."""
+        worksheets = {}
+        for title, df in frames.items():
+            rows = [[str(c) for c in df.columns]]
+            rows += [[_cell(v) for v in row] for row in df.itertuples(index=False)]
+            worksheets[title] = rows
+        return cls(sheet_id, worksheets)
+
+    @property
+    def url(self):
+        return f"https://docs.google.com/spreadsheets/d/{self.id}/edit"
+
+    def _put(self, rows, row, col, value):
+        while len(rows) < row:
+            rows.append([])
+        rows[row - 1] += [""] * (col - len(rows[row - 1]))
+        rows[row - 1][col - 1] = _cell(value)
+
+    def set_cell(self, row, col, value, title=None):
+        """Edits a cell (1-based, header is row 1) and bumps the revision."""
+        self._put(self.worksheets[title or next(iter(self.worksheets))], row, col, value)
+        self.revision += 1
+
+    def _parse_range(self, a1_range):
+        """Splits an A1 range into (title, grid range); a bare title is the whole worksheet."""
+        if "!" in a1_range:
+            title, a1 = a1_range.rsplit("!", 1)
+        elif a1_range.startswith("'") or a1_range in self.worksheets:
+            title, a1 = a1_range, None  # a whole worksheet
+        else:
+            title, a1 = next(iter(self.worksheets)), a1_range
+        if title.startswith("'"):
+            title = title[1:-1].replace("''", "'")
+        return title, a1_range_to_grid_range(a1) if a1 else {}
+
+    def write_ranges(self, value_ranges):
+        """Writes [{"range", "values"}] like a values batch update: one revision for all of them.
+
+        Returns the number of cells written.
+        """
+        cells = 0
+        for value_range in value_ranges:
+            title, grid = self._parse_range(value_range["range"])
+            rows = self.worksheets[title]
+            for i, values in enumerate(value_range.get("values", [])):
+                for j, value in enumerate(values):
+                    self._put(rows, grid.get("startRowIndex", 0) + i + 1, grid.get("startColumnIndex", 0) + j + 1, value)
+                    cells += 1
+        self.revision += 1
+        return cells
+
+    def read_range(self, a1_range):
+        """Returns the values of an A1 range, trimmed like the API does."""
+        title, grid = self._parse_range(a1_range)
+        rows = self.worksheets[title]
+        rows = rows[grid.get("startRowIndex", 0):grid.get("endRowIndex", len(rows))]
+        values = [row[grid.get("startColumnIndex", 0):grid.get("endColumnIndex", len(row))] for row in rows]
+        values = [list(row) for row in values]
+        for row in values:
+            while row and row[-1] == "":
+                row.pop()
+        while values and not values[-1]:
+            values.pop()
+        return values
+
+
+class FakeWorksheet:
+    def __init__(self, spreadsheet, title):
+        self.spreadsheet = spreadsheet
+        self.title = title
+
+    def get_all_records(self):
+        self.spreadsheet.client.log("get_all_records")
+        rows = self.spreadsheet.worksheets[self.title]
+        if not rows:
+            return []
+        header = rows[0]
+        values = [row + [""] * (len(header) - len(row)) for row in rows[1:]]
+        return to_records(header, [numericise_all(row) for row in values])
+
+
+class _FakeSpreadsheetHandle:
+    """What `client.open_by_url` returns."""
+
+    def __init__(self, spreadsheet, client):
+        self._spreadsheet = spreadsheet
+        spreadsheet.client = client
+
+    def get_worksheet(self, index):
+        return FakeWorksheet(self._spreadsheet, list(self._spreadsheet.worksheets)[index])
+
+    def worksheet(self, title):
+        return FakeWorksheet(self._spreadsheet, title)
+
+
+class FakeHTTPClient:
+    """The subset of `gspread.http_client.HTTPClient` used by utils.sheet_sync."""
+
+    def __init__(self, client):
+        self.client = client
+
+    def get_file_drive_metadata(self, sheet_id):
+        self.client.log("drive_metadata")
+        return {"id": sheet_id, "modifiedTime": str(self.client.spreadsheets[sheet_id].revision)}
+
+    def fetch_sheet_metadata(self, sheet_id, params=None):
+        self.client.log("spreadsheet_metadata")
+        return _spreadsheet_metadata(self.client.spreadsheets[sheet_id])
+
+    def values_batch_get(self, sheet_id, ranges, params=None):
+        self.client.log("values_batch_get")
+        spreadsheet = self.client.spreadsheets[sheet_id]
+        return {"valueRanges": [{"range": r, "values": spreadsheet.read_range(r)} for r in ranges]}
+
+    def values_batch_update(self, sheet_id, body=None):
+        self.client.log("values_batch_update")
+        cells = self.client.spreadsheets[sheet_id].write_ranges(body["data"])
+        return {"spreadsheetId": sheet_id, "totalUpdatedCells": cells}
+
+
+class FakeClient:
+    """Stand-in for an authorized gspread client, with no network access.
+
+    `calls` counts the API requests made, by kind; `latency` (seconds) is
+    added to each of them to simulate the round trip to Google.
+    """
+
+    def __init__(self, *spreadsheets, latency=0.0):
+        self.spreadsheets = {s.id: s for s in spreadsheets}
+        self.http_client = FakeHTTPClient(self)
+        self.latency = latency
+        self.calls = {}
+        self._lock = threading.Lock()
+
+    def log(self, kind):
+        with self._lock:
+            self.calls[kind] = self.calls.get(kind, 0) + 1
+        if self.latency:
+            time.sleep(self.latency)
+
+    def open_by_key(self, key):
+        self.log("open")
+        return _FakeSpreadsheetHandle(self.spreadsheets[key], self)
+
+    def open_by_url(self, url):
+        return self.open_by_key(url.split("/d/")[1].split("/")[0])
+
+
+class FakeSheetsAPI(requests.adapters.BaseAdapter):
+    """Local HTTP endpoint for the Sheets and Drive REST calls made by the app.
+
+    Mounted on a requests session, it lets a real gspread client (and its HTTP
+    client class, e.g. a rate-limited one) run against FakeSpreadsheets.
+    `fail_next(count, status)` makes the next requests fail with that status,
+    429 quota errors by default, and `quota=(requests, seconds)` answers 429 to
+    requests over that rate like Google does. `calls` counts requests by
+    endpoint and error status.
+    """
+
+    def __init__(self, *spreadsheets, latency=0.0, quota=None):
+        super().__init__()
+        self.spreadsheets = {s.id: s for s in spreadsheets}
+        self.latency = latency
+        self.quota = quota
+        self.calls = {}
+        self._failures = deque()
+        self._recent = deque()  # times of the requests within the quota window
+        self._lock = threading.Lock()
+
+    def fail_next(self, count=1, status=429, retry_after=None):
+        with self._lock:
+            self._failures.extend([(status, retry_after)] * count)
+
+    def client(self, http_client=HTTPClient):
+        """Returns a gspread Client whose requests are served by this endpoint."""
+        session = requests.Session()
+        session.mount("https://", self)
+        return gspread.Client(None, session=session, http_client=http_client)
+
+    def _log(self, kind):
+        with self._lock:
+            self.calls[kind] = self.calls.get(kind, 0) + 1
+
+    def send(self, request, **kwargs):
+        if self.latency:
+            time.sleep(self.latency)
+        with self._lock:
+            failure = self._failures.popleft() if self._failures else None
+            if failure is None and self.quota:
+                limit, window = self.quota
+                now = time.monotonic()
+                while self._recent and now - self._recent[0] > window:
+                    self._recent.popleft()
+                if len(self._recent) >= limit:
+                    failure = (429, None)
+                else:
+                    self._recent.append(now)
+        if failure:
+            status, retry_after = failure
+            self._log(status)
+            headers = {"Retry-After": str(retry_after)} if retry_after is not None else {}
+            error = {"code": status, "message": "Quota exceeded (fake)", "status": "RESOURCE_EXHAUSTED"}
+            return self._response(request, status, {"error": error}, headers)
+
+        url = urlsplit(request.url)
+        query = parse_qs(url.query)
+        path = unquote(url.path)
+        if path.startswith("/drive/v3/files/"):
+            spreadsheet = self.spreadsheets.get(path.rsplit("/", 1)[1])
+            self._log("drive_metadata")
+            body = spreadsheet and {"id": spreadsheet.id, "name": spreadsheet.id,
+                                    "modifiedTime": str(spreadsheet.revision)}
+        elif path.endswith("/values:batchGet"):
+            spreadsheet = self.spreadsheets.get(path.split("/")[-2])
+            self._log("values_batch_get")
+            body = spreadsheet and {"spreadsheetId": spreadsheet.id, "valueRanges": [
+                _value_range(r, spreadsheet.read_range(r)) for r in query.get("ranges", [])
+            ]}
+        elif path.endswith("/values:batchUpdate"):
+            spreadsheet = self.spreadsheets.get(path.split("/")[-2])
+            self._log("values_batch_update")
+            body = spreadsheet and {"spreadsheetId": spreadsheet.id, "totalUpdatedCells": spreadsheet.write_ranges(
+                json.loads(request.body)["data"]
+            )}
+        elif "/values/" in path:
+            sheet_id, a1_range = path[len("/v4/spreadsheets/"):].split("/values/", 1)
+            spreadsheet = self.spreadsheets.get(sheet_id)
+            self._log("values_get")
+            body = spreadsheet and _value_range(a1_range, spreadsheet.read_range(a1_range))
+        elif path.startswith("/v4/spreadsheets/"):
+            spreadsheet = self.spreadsheets.get(path.rsplit("/", 1)[1])
+            self._log("spreadsheet_metadata")
+            body = spreadsheet and _spreadsheet_metadata(spreadsheet)
+        else:
+            body = None
+        if body is None:
+            return self._response(request, 404, {"error": {"code": 404, "message": "Not found", "status": "NOT_FOUND"}})
+        return self._response(request, 200, body)
+
+    @staticmethod
+    def _response(request, status, body, headers=None):
+        response = requests.Response()
+        response.status_code = status
+        response.reason = "OK" if status == 200 else "Error"
+        response._content = json.dumps(body).encode()
+        response.headers["Content-Type"] = "application/json"
+        response.headers.update(headers or {})
+        response.url = request.url
+        response.request = request
+        return response
+
+    def close(self):
+        pass
+
+
+def _value_range(a1_range, values):
+    value_range = {"range": a1_range, "majorDimension": "ROWS"}
+    if values:
+        value_range["values"] = values
+    return value_range
+
+
+def _spreadsheet_metadata(spreadsheet):
+    sheets = []
+    for index, (title, rows) in enumerate(spreadsheet.worksheets.items()):
+        sheets.append({"properties": {
+            "sheetId": index,
+            "title": title,
+            "index": index,
+            "sheetType": "GRID",
+            "gridProperties": {"rowCount": max(len(rows), 1000), "columnCount": max(map(len, rows), default=26)},
+        }})
+    return {"spreadsheetId": spreadsheet.id, "properties": {"title": spreadsheet.id}, "sheets": sheets}
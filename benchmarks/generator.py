@@ -0,0 +1,56 @@
+import calendar
+
+import numpy as np
+import pandas as pd
+
+DEFAULT_STATUS_MIX = {
+    "Casa": 0.40,
+    "Ufficio": 0.35,
+    "Ferie": 0.08,
+    "Trasferta": 0.07,
+    "Offsite": 0.05,
+    "": 0.05,
+}
+
+
+def month_labels(n_months, start="2024-01"):
+    """Returns `n_months` consecutive 'YYYY-MM' labels starting at `start`."""
+    year, month = map(int, start.split("-"))
+    labels = []
+    for _ in range(n_months):
+        labels.append(f"{year:04d}-{month:02d}")
+        month += 1
+        if month > 12:
+            year, month = year + 1, 1
+    return labels
+
+
+def make_calendar(n_people=30, n_months=12, start="2024-01", status_mix=None, seed=0):
+    """Builds a synthetic sheet frame with the same layout as the real one.
+
+    One row per (mese, persona), one column per day "1".."31". Weekends hold
+    "X", days past the end of the month are empty, and working days are drawn
+    from `status_mix` (label -> probability).
+    """
+    status_mix = status_mix or DEFAULT_STATUS_MIX
+    labels = np.array(list(status_mix), dtype=object)
+    probs = np.array(list(status_mix.values()), dtype=float)
+    probs /= probs.sum()
+    rng = np.random.default_rng(seed)
+    days = [str(d) for d in range(1, 32)]
+
+    blocks = []
+    for ym in month_labels(n_months, start):
+        year, month = map(int, ym.split("-"))
+        n_days = calendar.monthrange(year, month)[1]
+        values = rng.choice(labels, size=(n_people, 31), p=probs)
+        for day in range(1, 32):
+            if day > n_days:
+                values[:, day - 1] = ""
+            elif calendar.weekday(year, month, day) >= 5:
+                values[:, day - 1] = "X"
+        block = pd.DataFrame(values, columns=days)
+        block.insert(0, "persona", [f"Persona {i + 1:03d}" for i in range(n_people)])
+        block.insert(0, "mese", ym)
+        blocks.append(block)
+    return pd.concat(blocks, ignore_index=True)
@@ -0,0 +1,245 @@
+"""Times every stage of the calendar pipeline on a synthetic sheet, offline.
+
+Usage: python -m benchmarks.run [--people N] [--months N] [--repeat N] [--output FILE]
+
+Results are printed (or written) as JSON so runs of different versions can be
+compared.
+"""
+import argparse
+import json
+import platform
+import statistics
+import subprocess
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+from streamlit.elements.arrow import marshall
+from streamlit.proto.ArrowData_pb2 import ArrowData
+
+from benchmarks.fake_gspread import FakeClient, FakeSpreadsheet
+from benchmarks.generator import make_calendar
+from benchmarks.smtp_sink import SMTPSink
+from calendar_core.diff import calendar_diff
+from calendar_core.dimension import calendar_dimension, working_days
+from calendar_core.export import export_rows, iter_csv, iter_ics
+from calendar_core.model import build_calendar_model, day_columns
+from calendar_core.occupancy import Occupancy
+from calendar_core.overlaps import overlap_index
+from calendar_core.report import change_digest, month_email
+from calendar_core.stats import MonthlyAggregates
+from calendar_core.styles import compact_rows, css_matrix, style_rows, symbol_matrix
+from calendar_core.view import person_pages
+from utils.email_sender import BatchMessageBuilder, send_email
+from utils.sheet_sync import full_sync, incremental_sync, sync_worksheets, write_cells
+
+
+def timed(repeat, func):
+    """Runs `func` `repeat` times; returns (last result, timings in ms)."""
+    timings = []
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        timings.append((time.perf_counter() - start) * 1000)
+    return result, timings
+
+
+def summary(timings, **extra):
+    return {
+        "min_ms": round(min(timings), 3),
+        "median_ms": round(statistics.median(timings), 3),
+        "max_ms": round(max(timings), 3),
+        "runs": len(timings),
+        **extra,
+    }
+
+
+def render(data):
+    """Serializes a frame or Styler as `st.dataframe` does; returns the payload bytes."""
+    proto = ArrowData()
+    marshall(proto, data, default_uuid="benchmark")
+    return proto.ByteSize()
+
+
+def peak_kb(func):
+    """Runs `func` once; returns the peak memory it allocated, in KB."""
+    tracemalloc.start()
+    try:
+        func()
+        return round(tracemalloc.get_traced_memory()[1] / 1024)
+    finally:
+        tracemalloc.stop()
+
+
+def drain(chunks):
+    """Consumes an export generator like a file writer would; returns the bytes written."""
+    return sum(len(chunk) for chunk in chunks)
+
+
+def git_revision():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except Exception:
+        return None
+
+
+def run(people=50, months=36, repeat=5, recipients=20, smtp_delay_ms=20):
+    df = make_calendar(people, months)
+    spreadsheet = FakeSpreadsheet.from_frame(df)
+    client = FakeClient(spreadsheet)
+    stages = {}
+
+    # Load / parse through utils.sheet_sync against the fake gspread backend
+    data, t = timed(repeat, lambda: full_sync(client, spreadsheet.url))
+    stages["load_full"] = summary(t, rows=len(data.df), columns=len(data.df.columns))
+    _, t = timed(repeat, lambda: incremental_sync(client, spreadsheet.url, data))
+    stages["load_incremental_unchanged"] = summary(t)
+
+    def edit_and_sync():
+        spreadsheet.set_cell(len(df) + 1, 3, "Ferie")  # last month, first day
+        return incremental_sync(client, spreadsheet.url, data)
+    _, t = timed(repeat, edit_and_sync)
+    stages["load_incremental_one_edit"] = summary(t)
+
+    # Ten team worksheets of one spreadsheet, read with one batch request
+    teams = FakeSpreadsheet.from_frames({f"Team {i}": df for i in range(10)}, "fake-teams")
+    teams_client = FakeClient(teams)
+    _, t = timed(repeat, lambda: sync_worksheets(teams_client, teams.url, list(teams.worksheets)))
+    stages["load_10_worksheets"] = summary(t, api_calls=dict(teams_client.calls))
+
+    # Saving one person's month from the app: every day cell in one batch
+    # update; the sync between saves is not timed
+    editable = FakeSpreadsheet.from_frame(df, "fake-edit")
+    edit_client = FakeClient(editable)
+    current = full_sync(edit_client, editable.url)
+    days = day_columns(current.header, current.month_col)
+    t = []
+    for i in range(repeat):
+        current = incremental_sync(edit_client, editable.url, current)
+        edits = {(len(df) - 1, day): ("Casa", "Ufficio")[i % 2] for day in days}
+        before = dict(edit_client.calls)
+        start = time.perf_counter()
+        write_cells(edit_client, editable.url, current, edits)
+        t.append((time.perf_counter() - start) * 1000)
+    save_calls = {kind: count - before.get(kind, 0) for kind, count in edit_client.calls.items() if count != before.get(kind, 0)}
+    stages["save_person_month"] = summary(t, cells=len(days), api_calls=save_calls)
+
+    model, t = timed(repeat, lambda: build_calendar_model(data.df, data.month_col))
+    stages["normalize"] = summary(t, model_bytes=model.nbytes, frame_bytes=int(data.df.memory_usage(deep=True).sum()))
+
+    month = model.months[-1]
+    rows, t = timed(repeat, lambda: model.month_rows(month))
+    month_df = data.df.iloc[rows]
+    stages["filter_month"] = summary(t, rows=len(rows))
+
+    def style():
+        styler = style_rows(month_df, model, css_matrix(model, rows))
+        styler._compute()
+        return styler
+    _, t = timed(repeat, style)
+    stages["style_month"] = summary(t)
+
+    # What st.dataframe sends for the month: inline CSS per cell, compact
+    # symbols, and one compact page of 50 persons
+    css = css_matrix(model, rows)
+    payload, t = timed(repeat, lambda: render(style_rows(month_df, model, css)))
+    stages["render_month_styled"] = summary(t, payload_bytes=payload)
+    symbols = symbol_matrix(model, rows)
+    payload, t = timed(repeat, lambda: render(compact_rows(month_df, model, symbols)))
+    stages["render_month_compact"] = summary(t, payload_bytes=payload)
+
+    def render_page():
+        page = person_pages(model, rows, persons_per_page=50)[0]
+        return render(compact_rows(data.df.iloc[rows[page]], model, symbols[page]))
+    payload, t = timed(repeat, render_page)
+    stages["render_page_compact"] = summary(t, payload_bytes=payload, persons=min(50, len(rows)))
+
+    # Exports of every month: streamed in chunks vs built in one string
+    all_rows = export_rows(model)
+    size, t = timed(repeat, lambda: drain(iter_csv(data.df, all_rows)))
+    stages["export_csv_streamed"] = summary(
+        t, bytes=size, peak_kb=peak_kb(lambda: drain(iter_csv(data.df, all_rows))),
+    )
+    _, t = timed(repeat, lambda: data.df.iloc[all_rows].to_csv(index=False))
+    stages["export_csv_to_csv"] = summary(t, peak_kb=peak_kb(lambda: data.df.iloc[all_rows].to_csv(index=False)))
+    person = model.persons[0]
+    size, t = timed(repeat, lambda: drain(iter_ics(model, person)))
+    stages["export_ics_person"] = summary(t, bytes=size)
+
+    calendar_dimension.cache_clear()
+    working, t = timed(repeat, lambda: working_days(model))
+    stages["working_days"] = summary(t, non_working=int((~working).sum()))
+
+    _, t = timed(repeat, lambda: overlap_index(model, working=working))
+    stages["overlaps_all_months"] = summary(t, months=len(model.months))
+
+    occupancy, t = timed(repeat, lambda: Occupancy(model, working))
+    stages["occupancy_build"] = summary(t)
+    days, t = timed(repeat, lambda: occupancy.frame(model.months[0], model.months[-1], capacity=people // 2))
+    stages["occupancy_full_range"] = summary(t, days=len(days))
+
+    aggregates, t = timed(repeat, lambda: MonthlyAggregates(model, working))
+    stages["stats_build_aggregates"] = summary(t)
+    _, t = timed(repeat, lambda: aggregates.sw_stats(model.months[0], model.months[-1]))
+    stages["stats_full_range"] = summary(t)
+
+    # One edited cell: diff of the whole calendar, and the digest sent instead
+    # of the month table
+    edited = data.df.copy()
+    edited.iloc[-1, -1] = "Ferie" if edited.iloc[-1, -1] != "Ferie" else "Casa"
+    edited_model = build_calendar_model(edited, data.month_col)
+    changes, t = timed(repeat, lambda: calendar_diff(model, edited_model))
+    stages["diff_one_edit"] = summary(t, cells=int(model.codes.size), changes=len(changes))
+    _, month_body, _ = month_email(month_df, data.month_col, month, [])
+    stages["digest_email"] = {"digest_bytes": len(change_digest(changes)[1]), "month_email_bytes": len(month_body)}
+
+    body = "<p>Gentile {recipient_name},</p>" + month_df.to_html(index=False)
+    addresses = [f"persona{i}@example.com" for i in range(recipients)]
+
+    def assemble():
+        builder = BatchMessageBuilder("calendario@example.com", "Calendario", body, month_df)
+        return [builder.build(a, recipient_name="Utente") for a in addresses]
+    _, t = timed(repeat, assemble)
+    stages["email_assembly"] = summary(t, messages=recipients)
+
+    with SMTPSink(delay=smtp_delay_ms / 1000) as sink:
+        config = sink.smtp_config(max_connections=4)
+        _, t = timed(repeat, lambda: send_email(addresses, "Calendario", body, month_df, smtp_config=config))
+    stages["email_delivery"] = summary(t, messages=recipients, smtp_delay_ms=smtp_delay_ms)
+
+    return {
+        "revision": git_revision(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "pandas": pd.__version__,
+        "numpy": np.__version__,
+        "params": {"people": people, "months": months, "repeat": repeat, "recipients": recipients},
+        "api_calls": client.calls,
+        "stages": stages,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--people", type=int, default=50)
+    parser.add_argument("--months", type=int, default=36)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--recipients", type=int, default=20)
+    parser.add_argument("--smtp-delay-ms", type=int, default=20)
+    parser.add_argument("--output", help="write the JSON results to this file")
+    args = parser.parse_args()
+
+    results = run(args.people, args.months, args.repeat, args.recipients, args.smtp_delay_ms)
+    text = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+    print(text)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,135 @@
+import socketserver
+import threading
+import time
+
+
+class _SMTPHandler(socketserver.StreamRequestHandler):
+    """Minimal SMTP dialogue: EHLO, AUTH (any credentials), MAIL, RCPT, DATA, QUIT."""
+
+    def reply(self, line):
+        self.wfile.write((line + "\r\n").encode())
+
+    def handle(self):
+        sink = self.server.sink
+        with sink.lock:
+            sink.sessions += 1
+            refused = sink.max_sessions and sink.sessions > sink.max_sessions
+        try:
+            if refused:
+                self.reply("421 Too many concurrent connections")
+                return
+            self.dialogue(sink)
+        finally:
+            with sink.lock:
+                sink.sessions -= 1
+
+    def dialogue(self, sink):
+        self.reply("220 localhost SMTP sink")
+        sent_here = 0
+        recipients = []
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            command = line.decode(errors="replace").strip()
+            verb = command.split(" ", 1)[0].upper()
+            if verb == "EHLO":
+                self.reply("250-localhost")
+                self.reply("250-AUTH PLAIN LOGIN")
+                self.reply("250 8BITMIME")
+            elif verb == "HELO":
+                self.reply("250 localhost")
+            elif verb == "AUTH":
+                self.reply("235 Authentication successful")
+            elif verb == "MAIL":
+                recipients = []
+                self.reply("250 OK")
+            elif verb == "RCPT":
+                recipient = command.split(":", 1)[1].strip().strip("<>")
+                if recipient in sink.reject:
+                    self.reply("550 No such user")
+                    continue
+                with sink.lock:
+                    deferred = sink.defer.get(recipient, 0)
+                    if deferred:
+                        sink.defer[recipient] = deferred - 1
+                if deferred:
+                    self.reply("451 Try again later")
+                    continue
+                recipients.append(recipient)
+                self.reply("250 OK")
+            elif verb == "DATA":
+                self.reply("354 End data with <CR><LF>.<CR><LF>")
+                chunks = []
+                while True:
+                    data_line = self.rfile.readline()
+                    if data_line in (b".\r\n", b".\n", b""):
+                        break
+                    chunks.append(data_line)
+                if sink.delay:
+                    time.sleep(sink.delay)
+                with sink.lock:
+                    sink.messages.append((list(recipients), b"".join(chunks)))
+                sent_here += 1
+                if sink.drop_after and sent_here >= sink.drop_after:
+                    self.reply("250 OK")
+                    return  # drop the session, the client must reconnect
+                self.reply("250 OK")
+            elif verb in ("RSET", "NOOP"):
+                self.reply("250 OK")
+            elif verb == "QUIT":
+                self.reply("221 Bye")
+                return
+            else:
+                self.reply("502 Command not implemented")
+
+
+class SMTPSink:
+    """Local SMTP stand-in that accepts and records every message.
+
+    `delay` simulates a slow relay (seconds per message), `drop_after` closes
+    each session after that many messages, `reject` lists recipients refused
+    with a permanent 550 error and `defer` maps recipients to the number of
+    temporary 451 refusals they get before being accepted. With
+    `max_sessions`, connections beyond that many concurrent sessions are
+    refused with 421, like relays limiting connections per client.
+    """
+
+    def __init__(self, delay=0.0, drop_after=None, reject=(), defer=None, max_sessions=None):
+        self.delay = delay
+        self.drop_after = drop_after
+        self.max_sessions = max_sessions
+        self.sessions = 0
+        self.reject = set(reject)
+        self.defer = dict(defer or {})
+        self.messages = []
+        self.lock = threading.Lock()
+        self._server = socketserver.ThreadingTCPServer(("127.0.0.1", 0), _SMTPHandler)
+        self._server.daemon_threads = True
+        self._server.sink = self
+        self._thread = None
+
+    @property
+    def port(self):
+        return self._server.server_address[1]
+
+    def smtp_config(self, **overrides):
+        """Returns an [email] secrets section pointing at this sink."""
+        config = {
+            "smtp_server": "127.0.0.1",
+            "smtp_port": self.port,
+            "sender_email": "calendario@example.com",
+            "sender_password": "secret",
+            "starttls": False,
+        }
+        config.update(overrides)
+        return config
+
+    def __enter__(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._server.shutdown()
+        self._server.server_close()
@@ -0,0 +1,107 @@
+"""Checks the import cost of the login screen against a time budget.
+
+Usage: python -m benchmarks.startup [--budget-ms N] [--repeat N]
+
+The app is run up to its password prompt in a fresh interpreter with
+`python -X importtime`. The script fails (exit code 1) when the modules imported
+by the app take longer than the budget, or when any heavy dependency (pandas,
+Google, SMTP...) is loaded before the login.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Must not be imported to render the login screen
+HEAVY_MODULES = (
+    "numpy", "pandas", "pyarrow", "gspread", "google.auth", "google.oauth2",
+    "smtplib", "email.mime", "sqlite3",
+)
+
+# Median import time allowed to the login screen, also enforced by tests/test_startup.py
+BUDGET_MS = 250.0
+
+MARKER = "--- app start ---"
+
+_CHILD = f"""
+import sys
+from streamlit.testing.v1 import AppTest
+
+at = AppTest.from_file("app.py", default_timeout=60)
+at.secrets["MAGIC_WORD"] = "benchmark"
+print({MARKER!r}, file=sys.stderr, flush=True)
+at.run()
+if at.exception:
+    sys.exit("app error: " + at.exception[0].message)
+"""
+
+
+def parse_importtime(stderr):
+    """Returns [(module, cumulative_us, depth)] of the imports after MARKER."""
+    _, found, tail = stderr.partition(MARKER)
+    if not found:
+        raise RuntimeError(f"benchmark child failed:\n{stderr[-2000:]}")
+    imports = []
+    for line in tail.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        if not cumulative.strip().isdigit():
+            continue  # header line
+        depth = (len(name) - len(name.lstrip())) // 2
+        imports.append((name.strip(), int(cumulative), depth))
+    return imports
+
+
+def measure():
+    """Runs the login screen once; returns (app import ms, heavy modules loaded, slowest imports)."""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", _CHILD],
+        cwd=ROOT, capture_output=True, text=True,
+    )
+    if result.returncode:
+        raise RuntimeError(result.stderr[-2000:])
+    imports = parse_importtime(result.stderr)
+    top_level = [(name, us) for name, us, depth in imports if depth == 0]
+    total_ms = sum(us for _, us in top_level) / 1000
+    heavy = sorted({
+        h for name, _, _ in imports for h in HEAVY_MODULES
+        if name == h or name.startswith(h + ".")
+    })
+    slowest = sorted(top_level, key=lambda item: -item[1])[:10]
+    return total_ms, heavy, [(name, round(us / 1000, 1)) for name, us in slowest]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--budget-ms", type=float, default=BUDGET_MS,
+                        help="maximum import time of the login screen (median)")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    runs = [measure() for _ in range(args.repeat)]
+    median_ms = statistics.median(total for total, _, _ in runs)
+    heavy = sorted({name for _, names, _ in runs for name in names})
+    print(json.dumps({
+        "import_ms": [round(total, 1) for total, _, _ in runs],
+        "median_ms": round(median_ms, 1),
+        "budget_ms": args.budget_ms,
+        "heavy_modules": heavy,
+        "slowest": runs[-1][2],
+    }, indent=2))
+
+    if heavy:
+        print(f"FAIL: the login screen imports {', '.join(heavy)}", file=sys.stderr)
+        return 1
+    if median_ms > args.budget_ms:
+        print(f"FAIL: login imports take {median_ms:.0f} ms, budget {args.budget_ms:.0f} ms", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1 @@
+"""Calendar logic with no Streamlit dependency, shared by the app and the CLI."""
@@ -0,0 +1,86 @@
+import numpy as np
+import pandas as pd
+from calendar_core.model import BLANK, NA
+
+# Column names of the changes frame
+CHANGE_COLUMNS = ("Mese", "Persona", "Giorno", "Prima", "Dopo")
+
+# Subscribers following every person
+ALL_PERSONS = "*"
+
+
+def _as_slice(positions):
+    """Returns `positions` as a slice when they are consecutive, else None."""
+    if len(positions) and np.array_equal(positions, np.arange(positions[0], positions[0] + len(positions))):
+        return slice(positions[0], positions[0] + len(positions))
+    return None
+
+
+def _aligned_cube(model, months, persons, days, lut):
+    """Returns the model's (month, person, day) cube on the given axes, in the codes of `lut`."""
+    cube = np.full((len(months), len(persons), len(days)), NA, dtype=lut.dtype)
+    positions = [months.get_indexer(model.months), persons.get_indexer(model.persons), days.get_indexer(model.days)]
+    slices = [_as_slice(p) for p in positions]
+    if all(s is not None for s in slices):
+        # Usual case (same layout, months or persons added at the end): no fancy indexing
+        index = tuple(slices)
+    else:
+        index = np.ix_(*positions)
+    cube[index] = np.take(lut, model.cube())
+    return cube
+
+
+def calendar_diff(old, new):
+    """Returns the cells that differ between two CalendarModels, one row per change.
+
+    Cells are matched by (month, person, day column), so rows moved or added
+    in the sheet are not changes by themselves; missing and empty cells are
+    the same. Columns are CHANGE_COLUMNS, the statuses as labels ("" when
+    empty), sorted by month, person (order of `new`) and day column.
+    """
+    # NA and BLANK share the label "": both are matched by position, as NA,
+    # and every other label of `old` is looked up in the labels of `new`
+    labels = list(new.labels)
+    index = {label: code for code, label in enumerate(labels) if code not in (NA, BLANK)}
+    for label in old.labels[BLANK + 1:]:
+        if label not in index:
+            index[label] = len(labels)
+            labels.append(label)
+    dtype = np.int8 if len(labels) <= np.iinfo(np.int8).max else np.int16
+    new_lut = np.arange(len(new.labels), dtype=dtype)
+    old_lut = np.array([NA, NA] + [index[label] for label in old.labels[BLANK + 1:]], dtype=dtype)
+    new_lut[[NA, BLANK]] = NA
+
+    months = new.months.union(old.months)
+    persons = new.persons.append(old.persons.difference(new.persons, sort=False))
+    days = pd.Index(new.days).append(pd.Index(old.days).difference(new.days, sort=False))
+    old_cube = _aligned_cube(old, months, persons, days, old_lut)
+    new_cube = _aligned_cube(new, months, persons, days, new_lut)
+
+    m, p, d = np.unravel_index(np.flatnonzero(old_cube != new_cube), old_cube.shape)
+    labels = np.asarray(labels, dtype=object)
+    return pd.DataFrame(dict(zip(CHANGE_COLUMNS, (
+        np.asarray(months, dtype=object)[m],
+        np.asarray(persons, dtype=object)[p],
+        np.asarray(days, dtype=object)[d],
+        labels[old_cube[m, p, d]],
+        labels[new_cube[m, p, d]],
+    ))))
+
+
+def subscriber_changes(changes, subscribers):
+    """Groups the changes by the subscribers they concern.
+
+    `subscribers` maps an email address to the persons it follows (a list, or
+    ALL_PERSONS). Returns [(emails, changes)] with one entry per distinct set
+    of changes, so that identical digests are sent as one job.
+    """
+    groups = {}
+    for email, persons in subscribers.items():
+        if persons == ALL_PERSONS or ALL_PERSONS in persons:
+            mask = np.ones(len(changes), dtype=bool)
+        else:
+            mask = changes["Persona"].isin([persons] if isinstance(persons, str) else list(persons)).to_numpy()
+        if mask.any():
+            groups.setdefault(mask.tobytes(), (mask, []))[1].append(email)
+    return [(emails, changes[mask]) for mask, emails in groups.values()]
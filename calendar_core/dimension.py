@@ -0,0 +1,186 @@
+import datetime
+from functools import lru_cache
+
+import numpy as np
+from calendar_core.months import parse_month
+
+# Italian national holidays on fixed dates; Easter and Easter Monday are added per year
+NATIONAL_HOLIDAYS = {
+    (1, 1): "Capodanno",
+    (1, 6): "Epifania",
+    (4, 25): "Festa della Liberazione",
+    (5, 1): "Festa del Lavoro",
+    (6, 2): "Festa della Repubblica",
+    (8, 15): "Ferragosto",
+    (11, 1): "Ognissanti",
+    (12, 8): "Immacolata Concezione",
+    (12, 25): "Natale",
+    (12, 26): "Santo Stefano",
+}
+
+LOCAL_HOLIDAY_NAME = "Festa locale"
+
+
+def easter_sunday(year):
+    """Returns the date of Easter Sunday (Gregorian calendar)."""
+    a, b, c = year % 19, year // 100, year % 100
+    d, e = divmod(b, 4)
+    g = (8 * b + 13) // 25
+    h = (19 * a + b - d - g + 15) % 30
+    i, k = divmod(c, 4)
+    l = (2 * e + 2 * i - h - k + 32) % 7
+    m = (a + 11 * h + 22 * l) // 451
+    month, day = divmod(h + l - 7 * m + 114, 31)
+    return datetime.date(year, month, day + 1)
+
+
+def parse_local_holidays(config):
+    """Parses the LOCAL_HOLIDAYS setting into ((year or None, month, day, name), ...).
+
+    Entries are "MM-DD" (every year, e.g. the patron saint), "YYYY-MM-DD" (that
+    day only), or tables such as {date = "06-24", name = "San Giovanni"}.
+    """
+    holidays = []
+    for entry in config or []:
+        if isinstance(entry, str):
+            entry = {"date": entry}
+        text = str(entry["date"]).strip()
+        parts = text.split("-")
+        try:
+            numbers = [int(part) for part in parts]
+            if len(numbers) == 2:
+                year, (month, day) = None, numbers
+                datetime.date(2000, month, day)  # leap year: accepts 02-29
+            elif len(numbers) == 3:
+                year, month, day = numbers
+                datetime.date(year, month, day)
+            else:
+                raise ValueError
+        except ValueError:
+            raise ValueError(f"Invalid local holiday {text!r}: use MM-DD or YYYY-MM-DD") from None
+        holidays.append((year, month, day, entry.get("name", LOCAL_HOLIDAY_NAME)))
+    return tuple(holidays)
+
+
+def italian_holidays(year, local_holidays=()):
+    """Returns {date: name} of the holidays of one year (national and local)."""
+    holidays = {}
+    for (month, day), name in NATIONAL_HOLIDAYS.items():
+        holidays[datetime.date(year, month, day)] = name
+    easter = easter_sunday(year)
+    holidays[easter] = "Pasqua"
+    holidays[easter + datetime.timedelta(days=1)] = "Lunedì dell'Angelo"
+    for local_year, month, day, name in local_holidays:
+        if local_year in (None, year):
+            try:
+                holidays.setdefault(datetime.date(year, month, day), name)
+            except ValueError:  # 02-29 in a non-leap year
+                pass
+    return holidays
+
+
+class CalendarDimension:
+    """Day table of whole years: date, weekday, holiday name and working flag.
+
+    Columns are numpy arrays aligned with `dates` (datetime64[D]), so a grid
+    of dates is classified with one positional lookup (see `working_days`).
+    """
+
+    def __init__(self, first_year, last_year, local_holidays=()):
+        self.first_year = first_year
+        self.last_year = last_year
+        self.start = np.datetime64(f"{first_year:04d}-01-01", "D")
+        self.dates = np.arange(self.start, np.datetime64(f"{last_year + 1:04d}-01-01", "D"))
+        # 1970-01-01 was a Thursday; 0 is Monday
+        self.weekday = ((self.dates.astype(np.int64) + 3) % 7).astype(np.int8)
+        self.holiday = np.full(len(self.dates), "", dtype=object)
+        for year in range(first_year, last_year + 1):
+            for date, name in italian_holidays(year, local_holidays).items():
+                self.holiday[(np.datetime64(date, "D") - self.start).astype(np.int64)] = name
+        self.working = (self.weekday < 5) & (self.holiday == "")
+
+    def __len__(self):
+        return len(self.dates)
+
+    def positions(self, dates):
+        """Returns the row of each date (datetime64), -1 for NaT or dates outside the table."""
+        dates = np.asarray(dates, dtype="datetime64[D]")
+        positions = (dates - self.start).astype(np.int64)
+        inside = ~np.isnat(dates) & (positions >= 0) & (positions < len(self.dates))
+        return np.where(inside, positions, -1)
+
+    def month_holidays(self, ym):
+        """Returns [(day of month, holiday name)] of a 'YYYY-MM' month."""
+        parsed = parse_month(ym)
+        if parsed is None or not self.first_year <= parsed[0] <= self.last_year:
+            return []
+        first = np.datetime64(f"{parsed[0]:04d}-{parsed[1]:02d}", "M")
+        lo, hi = self.positions([first, first + 1])
+        hi = len(self.dates) if hi < 0 else hi
+        days = lo + np.flatnonzero(self.holiday[lo:hi] != "")
+        return [(int(day - lo) + 1, self.holiday[day]) for day in days]
+
+
+@lru_cache(maxsize=16)
+def calendar_dimension(first_year, last_year, local_holidays=()):
+    """Returns the CalendarDimension of a year range, built once per process."""
+    return CalendarDimension(first_year, last_year, local_holidays)
+
+
+def month_starts(months):
+    """Returns the first day (datetime64[M]) of each 'YYYY-MM...' label, NaT if it is not a month."""
+    starts = []
+    for month in months:
+        parsed = parse_month(str(month)[:7])
+        starts.append(f"{parsed[0]:04d}-{parsed[1]:02d}" if parsed else "NaT")
+    return np.array(starts, dtype="datetime64[M]")
+
+
+def day_numbers(days):
+    """Returns the day of month of each day column ("5", "5.0"...), 0 if it is not a number."""
+    numbers = []
+    for day in days:
+        try:
+            number = int(float(day))
+        except (TypeError, ValueError):
+            number = 0
+        numbers.append(number if 1 <= number <= 31 else 0)
+    return np.array(numbers, dtype=np.int64)
+
+
+def day_dates(model):
+    """Returns the (month, day column) grid of dates of a CalendarModel, NaT where there is none.
+
+    Days that do not exist in their month (e.g. "30" in February) are NaT too.
+    """
+    starts = month_starts(model.months)
+    numbers = day_numbers(model.days)
+    offsets = np.where(numbers > 0, numbers - 1, 0).astype("timedelta64[D]")
+    dates = starts.astype("datetime64[D]")[:, None] + offsets[None, :]
+    valid = (numbers > 0)[None, :] & (dates.astype("datetime64[M]") == starts[:, None])
+    return np.where(valid, dates, np.datetime64("NaT", "D"))
+
+
+def dimension_for(model, local_holidays=()):
+    """Returns the CalendarDimension covering the months of a CalendarModel, or None."""
+    starts = month_starts(model.months)
+    years = starts[~np.isnat(starts)].astype("datetime64[Y]").astype(np.int64) + 1970
+    if not len(years):
+        return None
+    return calendar_dimension(int(years.min()), int(years.max()), tuple(local_holidays))
+
+
+def working_days(model, local_holidays=()):
+    """Returns the (month, day column) mask of working days of a CalendarModel.
+
+    Weekends, holidays and days missing from their month are False. Months
+    and columns that are not dates cannot be classified and stay True.
+    """
+    mask = np.ones((len(model.months), len(model.days)), dtype=bool)
+    dimension = dimension_for(model, local_holidays)
+    if dimension is None:
+        return mask
+    known = ~np.isnat(month_starts(model.months))[:, None] & (day_numbers(model.days) > 0)[None, :]
+    positions = dimension.positions(day_dates(model))
+    mask[known] = (positions[known] >= 0) & dimension.working[positions[known]]
+    return mask
@@ -0,0 +1,108 @@
+import datetime
+import hashlib
+import importlib.util
+import tempfile
+
+import numpy as np
+from calendar_core.dimension import day_dates
+from calendar_core.model import CASA, TRASFERTA, UFFICIO
+
+# Statuses exported as calendar events, one all-day event per day
+ICS_STATUSES = (CASA, UFFICIO, TRASFERTA)
+
+# Sheet rows converted per chunk by the CSV/XLSX writers
+CHUNK_ROWS = 500
+
+
+def xlsx_available():
+    """True if the optional openpyxl dependency of `iter_xlsx` is installed."""
+    return importlib.util.find_spec("openpyxl") is not None
+
+
+def export_rows(model, start_month=None, end_month=None, person=None):
+    """Returns the sheet rows of an inclusive month range (default: all months), optionally of one person."""
+    if start_month is None:
+        rows = np.flatnonzero(model.row_month >= 0)
+    else:
+        rows = model.month_rows(start_month, end_month)
+    if person is not None:
+        code = model.persons.get_indexer([person])[0]
+        rows = rows[model.row_person[rows] == code]
+    return rows
+
+
+def _ics_text(text):
+    return str(text).replace("\\", "\\\\").replace(";", "\\;").replace(",", "\\,").replace("\n", "\\n")
+
+
+def _ics_event(person, date, label):
+    # UID and DTSTAMP only depend on the person and the day, so that the feed
+    # is identical for the same data and calendar apps update events in place
+    uid = hashlib.sha1(f"{person}|{date.isoformat()}".encode()).hexdigest()[:20]
+    return (
+        "BEGIN:VEVENT\r\n"
+        f"UID:{uid}@smart-working-calendar\r\n"
+        f"DTSTAMP:{date:%Y%m%d}T000000Z\r\n"
+        f"DTSTART;VALUE=DATE:{date:%Y%m%d}\r\n"
+        f"DTEND;VALUE=DATE:{date + datetime.timedelta(days=1):%Y%m%d}\r\n"
+        f"SUMMARY:{_ics_text(label)}\r\n"
+        "TRANSP:TRANSPARENT\r\n"
+        "END:VEVENT\r\n"
+    )
+
+
+def iter_ics(model, person, start_month=None, end_month=None):
+    """Yields the iCalendar feed of one person, one chunk per sheet row.
+
+    Every Casa/Ufficio/Trasferta day becomes an all-day event; days that do not
+    exist in their month are skipped.
+    """
+    yield (
+        "BEGIN:VCALENDAR\r\n"
+        "VERSION:2.0\r\n"
+        "PRODID:-//smart-working-calendar//IT\r\n"
+        "CALSCALE:GREGORIAN\r\n"
+        f"X-WR-CALNAME:{_ics_text(f'Smart working - {person}')}\r\n"
+    )
+    dates = day_dates(model)
+    exported = np.isin(model.codes, ICS_STATUSES)
+    for row in export_rows(model, start_month, end_month, person):
+        month_dates = dates[model.row_month[row]]
+        events = [
+            _ics_event(person, month_dates[d].astype(datetime.date), model.labels[model.codes[row, d]])
+            for d in np.flatnonzero(exported[row] & ~np.isnat(month_dates))
+        ]
+        if events:
+            yield "".join(events)
+    yield "END:VCALENDAR\r\n"
+
+
+def iter_csv(df, rows, chunk_rows=CHUNK_ROWS):
+    """Yields the given sheet rows as CSV text, header first, `chunk_rows` rows at a time."""
+    yield df.iloc[:0].to_csv(index=False)
+    for start in range(0, len(rows), chunk_rows):
+        yield df.iloc[rows[start:start + chunk_rows]].to_csv(index=False, header=False)
+
+
+def iter_xlsx(df, rows, chunk_rows=CHUNK_ROWS, read_size=64 * 1024):
+    """Yields the given sheet rows as an Excel workbook, in chunks of bytes.
+
+    Needs openpyxl (see `xlsx_available`). The workbook is written in
+    write-only mode, which streams rows to a temporary file instead of keeping
+    them in memory.
+    """
+    from openpyxl import Workbook
+
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet("Calendario")
+    sheet.append([str(column) for column in df.columns])
+    for start in range(0, len(rows), chunk_rows):
+        block = df.iloc[rows[start:start + chunk_rows]]
+        for values in block.astype(object).where(block.notna(), None).itertuples(index=False, name=None):
+            sheet.append(list(values))
+
+    with tempfile.TemporaryFile() as f:
+        workbook.save(f)
+        f.seek(0)
+        while chunk := f.read(read_size):
+            yield chunk
@@ -0,0 +1,167 @@
+import numpy as np
+import pandas as pd
+
+# Fixed status vocabulary. Codes are stable: any other value found in the
+# sheet gets the next free code, in order of first appearance.
+NA = 0          # missing cell (no row for that person/month, or NaN)
+BLANK = 1       # empty string
+X = 2           # "X", day not applicable
+CASA = 3
+UFFICIO = 4
+FERIE = 5
+OFFSITE = 6
+TRASFERTA = 7
+
+STATUS_LABELS = ("", "", "X", "Casa", "Ufficio", "Ferie", "Offsite", "Trasferta")
+
+# Columns that describe a row rather than a day
+TEAM_COLUMN = "team"  # added when several worksheets are loaded together
+METADATA_COLUMNS = ("persona", "mese", "data", TEAM_COLUMN)
+
+
+class CalendarModel:
+    """Compact, integer-coded view of the calendar sheet.
+
+    `codes[r, d]` is the status code of sheet row `r` on day column `days[d]`
+    (int8, or int16 if the sheet holds more than 127 distinct values).
+    `row_month`/`row_person` map each row to its position in `months` (sorted
+    month labels, -1 when the row has none) and `persons` (first appearance).
+    """
+
+    def __init__(self, codes, labels, days, month_col, months, persons, row_month, row_person):
+        self.codes = codes
+        self.labels = labels
+        self.days = days
+        self.month_col = month_col
+        self.months = months
+        self.persons = persons
+        self.row_month = row_month
+        self.row_person = row_person
+
+    def code_of(self, label):
+        """Returns the code of a status label, or None if it never appears."""
+        try:
+            return self.labels.index(label)
+        except ValueError:
+            return None
+
+    def month_rows(self, start_month, end_month=None):
+        """Returns the row positions of a month, or of an inclusive month range."""
+        if end_month is None:
+            end_month = start_month
+        lo = self.months.searchsorted(start_month, side="left")
+        hi = self.months.searchsorted(end_month, side="right")
+        return np.flatnonzero((self.row_month >= lo) & (self.row_month < hi))
+
+    def working_codes(self, rows, working=None):
+        """Returns `codes[rows]`, with the days outside `working` coded X.
+
+        `working` is a (month, day) mask such as `dimension.working_days`;
+        rows without a month are left as they are.
+        """
+        codes = self.codes[rows]
+        if working is None:
+            return codes
+        row_month = self.row_month[rows]
+        keep = np.ones(codes.shape, dtype=bool)
+        has_month = row_month >= 0
+        keep[has_month] = working[row_month[has_month]]
+        return np.where(keep, codes, X).astype(codes.dtype)
+
+    def cube(self):
+        """Returns the dense (month, person, day) code array, NA where no row exists.
+
+        Rows without a month are left out; if a person has several rows in the
+        same month, the last one wins.
+        """
+        cube = np.full((len(self.months), len(self.persons), len(self.days)), NA, dtype=self.codes.dtype)
+        has_month = self.row_month >= 0
+        cube[self.row_month[has_month], self.row_person[has_month]] = self.codes[has_month]
+        return cube
+
+    @property
+    def nbytes(self):
+        return self.codes.nbytes + self.row_month.nbytes + self.row_person.nbytes
+
+
+def combine_teams(frames):
+    """Concatenates (team, DataFrame) pairs into one frame with a leading team column."""
+    df = pd.concat([frame.assign(**{TEAM_COLUMN: team}) for team, frame in frames], ignore_index=True)
+    return df[[TEAM_COLUMN] + [c for c in df.columns if c != TEAM_COLUMN]]
+
+
+def day_columns(columns, month_col=None):
+    """Returns the columns holding one day each (everything but row metadata)."""
+    exclude = {c.lower() for c in METADATA_COLUMNS}
+    if month_col:
+        exclude.add(str(month_col).lower())
+    return [c for c in columns if str(c).lower() not in exclude]
+
+
+def _normalize(value):
+    """Maps a raw cell value to its status label (None for missing)."""
+    if value is None or (isinstance(value, float) and np.isnan(value)):
+        return None
+    text = str(value).strip()
+    if text.upper() == "X":
+        return "X"
+    return text
+
+
+def encode_values(values, labels):
+    """Encodes a 2D array of raw cells, appending unseen labels to `labels`.
+
+    Only the distinct raw values go through Python; the cells themselves are
+    mapped with one vectorized lookup.
+    """
+    raw_codes, uniques = pd.factorize(values.ravel(), use_na_sentinel=True)
+    index = {label: code for code, label in enumerate(labels)}
+    lut = []
+    for value in uniques:
+        label = _normalize(value)
+        if label is None:
+            lut.append(NA)
+        elif label == "":
+            lut.append(BLANK)
+        else:
+            if label not in index:
+                index[label] = len(labels)
+                labels.append(label)
+            lut.append(index[label])
+    lut.append(NA)  # raw code -1 (NaN) picks the last entry
+    dtype = np.int8 if len(labels) <= np.iinfo(np.int8).max else np.int16
+    lut = np.asarray(lut, dtype=dtype)
+    return lut[raw_codes].reshape(values.shape)
+
+
+def build_calendar_model(df, month_col=None):
+    """Normalizes the raw sheet DataFrame into a CalendarModel."""
+    days = day_columns(df.columns, month_col)
+    labels = list(STATUS_LABELS)
+    codes = encode_values(df[days].to_numpy(dtype=object), labels)
+
+    if month_col and month_col in df.columns:
+        month_values = df[month_col]
+        month_labels = month_values.where(month_values.isna(), month_values.astype(str))
+        months = pd.Index(sorted(month_labels.dropna().unique()))
+        row_month = months.get_indexer(month_labels)
+    else:
+        months = pd.Index([])
+        row_month = np.full(len(df), -1)
+
+    if "persona" in df.columns:
+        person_values = df["persona"].fillna("").astype(str).to_numpy()
+    else:
+        person_values = np.array([f"Persona {i + 1}" for i in range(len(df))], dtype=object)
+    row_person, persons = pd.factorize(person_values)
+
+    return CalendarModel(
+        codes,
+        tuple(labels),
+        days,
+        month_col,
+        months,
+        pd.Index(persons),
+        row_month.astype(np.int32),
+        row_person.astype(np.int32),
+    )
@@ -0,0 +1,62 @@
+from functools import lru_cache
+
+MONTH_COLUMN_HINTS = ("mese", "month", "date")
+
+MONTH_NAMES_IT = (
+    "Gennaio", "Febbraio", "Marzo", "Aprile", "Maggio", "Giugno",
+    "Luglio", "Agosto", "Settembre", "Ottobre", "Novembre", "Dicembre",
+)
+
+
+def find_month_column(columns):
+    """Returns the 'mese' column, or the first one that looks like a month/date."""
+    if "mese" in columns:
+        return "mese"
+    for col in columns:
+        if any(hint in str(col).lower() for hint in MONTH_COLUMN_HINTS):
+            return col
+    return None
+
+
+def parse_month(ym_str):
+    """Returns (year, month) of a 'YYYY-MM' string, or None if it is not one."""
+    if not isinstance(ym_str, str):
+        return None
+    year, _, month = ym_str.partition("-")
+    if len(year) != 4 or not year.isdigit() or not month.isdigit() or not 1 <= int(month) <= 12:
+        return None
+    return int(year), int(month)
+
+
+@lru_cache(maxsize=1024)
+def _month_name(ym_str):
+    parsed = parse_month(ym_str)
+    if parsed is None:
+        return ym_str
+    year, month = parsed
+    return f"{MONTH_NAMES_IT[month - 1]} {year}"
+
+
+def format_month_name(ym_str):
+    """Formats 'YYYY-MM' string to 'Month Year' in Italian.
+
+    Labels are computed once per month and then looked up, since selectboxes
+    format every option on every rerun.
+    """
+    if not ym_str:
+        return ""
+    try:
+        return _month_name(ym_str)
+    except TypeError:  # unhashable
+        return ym_str
+
+
+def selectable_months(months, current_ym):
+    """Returns the months from `current_ym` on, or all of them if none is left.
+
+    The second value tells whether the fallback to all months was used.
+    """
+    future_months = [m for m in months if m >= current_ym]
+    if not future_months:
+        return list(months), True
+    return future_months, False
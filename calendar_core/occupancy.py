@@ -0,0 +1,62 @@
+import numpy as np
+import pandas as pd
+from calendar_core.dimension import day_dates
+from calendar_core.model import CASA, FERIE, OFFSITE, STATUS_LABELS, TRASFERTA, UFFICIO
+from calendar_core.overlaps import day_status_counts
+
+# Statuses counted per day, desks first
+OCCUPANCY_STATUSES = (UFFICIO, CASA, TRASFERTA, OFFSITE, FERIE)
+OCCUPANCY_LABELS = tuple(STATUS_LABELS[code] for code in OCCUPANCY_STATUSES)
+
+
+class Occupancy:
+    """Headcount per (month, day, status) of the whole calendar.
+
+    Built with the single counting pass of `day_status_counts`; any month range
+    is then a slice of it.
+    """
+
+    def __init__(self, model, working=None):
+        self.model = model
+        self.months = model.months
+        _, counts = day_status_counts(model)
+        if not len(model.months):  # no month column: days cannot be dated
+            counts = counts[:0]
+        self.counts = counts[..., list(OCCUPANCY_STATUSES)]
+        self.dates = day_dates(model)
+        self.working = np.ones(self.dates.shape, dtype=bool) if working is None else working
+
+    def frame(self, start_month, end_month, capacity=None, working_only=True):
+        """Returns the headcount per day of an inclusive month range.
+
+        One row per date, sorted, with one column per status of
+        `OCCUPANCY_LABELS`. With a desk `capacity`, "Posti liberi" and
+        "Oltre capienza" compare it with the people in the office.
+        """
+        lo = self.months.searchsorted(start_month, side="left")
+        hi = max(lo, self.months.searchsorted(end_month, side="right"))
+        dates = self.dates[lo:hi]
+        keep = ~np.isnat(dates)
+        if working_only:
+            keep &= self.working[lo:hi]
+        order = np.argsort(dates[keep], kind="stable")
+
+        frame = pd.DataFrame(self.counts[lo:hi][keep][order], columns=list(OCCUPANCY_LABELS))
+        frame.index = pd.DatetimeIndex(dates[keep][order], name="Data")
+        if capacity:
+            office = frame[STATUS_LABELS[UFFICIO]]
+            frame["Posti liberi"] = capacity - office
+            frame["Oltre capienza"] = office > capacity
+        return frame
+
+
+def occupancy_summary(frame, capacity=None):
+    """Returns the peak office headcount, its date and the days over `capacity` of an occupancy frame."""
+    office = frame[STATUS_LABELS[UFFICIO]]
+    if office.empty:
+        return {"peak": 0, "peak_date": None, "over_capacity": 0}
+    return {
+        "peak": int(office.max()),
+        "peak_date": office.idxmax().date(),
+        "over_capacity": int((office > capacity).sum()) if capacity else 0,
+    }
@@ -0,0 +1,86 @@
+import numpy as np
+from calendar_core.model import NA
+
+# Default rule: a day is an overlap when nobody is at home
+DEFAULT_OVERLAP_STATUSES = ("Trasferta", "Offsite", "Ufficio")
+
+
+class AllInRule:
+    """Flags days where every filled-in cell has one of `statuses`."""
+
+    def __init__(self, statuses=DEFAULT_OVERLAP_STATUSES):
+        self.statuses = tuple(statuses)
+
+    @property
+    def key(self):
+        return ("all_in", self.statuses)
+
+    def mask(self, model, counts):
+        present = counts.sum(axis=-1) - counts[..., NA]
+        codes = [c for c in map(model.code_of, self.statuses) if c is not None]
+        matching = counts[..., codes].sum(axis=-1)
+        return (present > 0) & (matching == present)
+
+
+class FewerThanRule:
+    """Flags days where fewer than `count` people have `status` (e.g. "Casa")."""
+
+    def __init__(self, status="Casa", count=1):
+        self.status = status
+        self.count = count
+
+    @property
+    def key(self):
+        return ("fewer_than", self.status, self.count)
+
+    def mask(self, model, counts):
+        present = counts.sum(axis=-1) - counts[..., NA]
+        code = model.code_of(self.status)
+        matching = counts[..., code] if code is not None else np.zeros_like(present)
+        return (present > 0) & (matching < self.count)
+
+
+def rule_from_config(config):
+    """Builds a rule from a secrets entry such as {"rule": "fewer_than", "status": "Casa", "count": 2}."""
+    if not config:
+        return AllInRule()
+    config = dict(config)
+    if config.get("rule") == "fewer_than":
+        return FewerThanRule(config.get("status", "Casa"), int(config.get("count", 1)))
+    return AllInRule(config.get("statuses", DEFAULT_OVERLAP_STATUSES))
+
+
+def day_status_counts(model):
+    """Counts rows per (month, day, status code) in one pass over the calendar.
+
+    Returns (month keys, counts); without a month column every row falls in a
+    single group whose key is None.
+    """
+    n_days, n_codes = len(model.days), len(model.labels)
+    if len(model.months):
+        keys = list(model.months)
+        has_month = model.row_month >= 0
+        group = model.row_month[has_month].astype(np.int64)
+        codes = model.codes[has_month]
+    else:
+        keys = [None]
+        group = np.zeros(len(model.codes), dtype=np.int64)
+        codes = model.codes
+    cell_key = (group[:, None] * n_days + np.arange(n_days)) * n_codes
+    counts = np.bincount((cell_key + codes).ravel(), minlength=len(keys) * n_days * n_codes)
+    return keys, counts.reshape(len(keys), n_days, n_codes)
+
+
+def overlap_index(model, rule=None, working=None):
+    """Evaluates `rule` for every month at once.
+
+    Returns a dict month -> list of overlapping day columns, in column order.
+    Only the days in the `working` (month, day) mask can overlap.
+    """
+    rule = rule or AllInRule()
+    keys, counts = day_status_counts(model)
+    mask = rule.mask(model, counts)
+    if working is not None and len(model.months):
+        mask &= working
+    days = np.asarray(model.days, dtype=object)
+    return {key: list(days[mask[i]]) for i, key in enumerate(keys)}
@@ -0,0 +1,109 @@
+from calendar_core.months import format_month_name
+
+
+def parse_days(text):
+    """Splits a comma-separated list of days, e.g. "5, 12"."""
+    return [d.strip() for d in text.split(",") if d.strip()]
+
+
+def format_days(days):
+    """Joins day labels sorted as numbers ("1.0" -> "1"), or as text if they are not numeric."""
+    try:
+        return ", ".join(map(str, sorted(int(float(x)) for x in days)))
+    except ValueError:
+        return ", ".join(sorted(map(str, days)))
+
+
+def month_title(month):
+    """Returns the month as written in emails; "questo mese" without a month column."""
+    return format_month_name(month) if month else "questo mese"
+
+
+def email_frame(frame, month_col):
+    """Returns the calendar table for email/CSV, without 'persona' and month headers."""
+    rename_map = {}
+    if "persona" in frame.columns:
+        rename_map["persona"] = ""
+    if month_col and month_col in frame.columns:
+        rename_map[month_col] = ""
+    return frame.rename(columns=rename_map) if rename_map else frame.copy()
+
+
+def email_subject(month_name):
+    return f"Calendario {month_name} - Smart Working"
+
+
+def email_body(month_name, overlap_days, table_html):
+    """Builds the monthly email; `{recipient_name}` is filled per recipient."""
+    overlap_message = ""
+    if overlap_days:
+        overlap_message = f"<p><strong>⚠️ Attenzione:</strong> Sono state rilevate delle sovrapposizioni nei giorni: {format_days(overlap_days)}.</p>"
+
+    return f"""
+                    <html>
+                    <body style="font-family: Tahoma, Geneva, sans-serif; font-size: 20px; line-height: 1.6; color: #333;">
+                        <p>Gentile {{recipient_name}},</p>
+
+                        <p>Di seguito puoi trovare il calendario di smart working aggiornato per il mese di <strong>{month_name}</strong>.</p>
+
+                        {overlap_message}
+
+                        <br>
+                        {table_html}
+
+                        <br>
+                        <p>In allegato anche il relativo file CSV.</p>
+
+                        <p>Grazie mille,<br>
+                        Martino</p>
+                    </body>
+                    </html>
+                    """
+
+
+def month_email(frame, month_col, month, overlap_days):
+    """Returns (subject, body_html, attachment_df) of the email for one month."""
+    month_name = month_title(month)
+    attachment_df = email_frame(frame, month_col)
+    body_html = email_body(month_name, overlap_days, attachment_df.to_html(index=False, border=1))
+    return email_subject(month_name), body_html, attachment_df
+
+
+def change_digest(changes):
+    """Returns (subject, body_html) of the email listing calendar changes (see `diff.calendar_diff`).
+
+    The body only holds the changed cells; `{recipient_name}` is filled per recipient.
+    """
+    count = len(changes)
+    subject = f"Calendario Smart Working - {count} {'modifica' if count == 1 else 'modifiche'}"
+    table = changes.assign(
+        Giorno=[f"{day} {month_title(month)}" for month, day in zip(changes["Mese"], changes["Giorno"])],
+        Prima=changes["Prima"].replace("", "—"),
+        Dopo=changes["Dopo"].replace("", "—"),
+    ).drop(columns="Mese")
+    body_html = f"""
+                    <html>
+                    <body style="font-family: Tahoma, Geneva, sans-serif; font-size: 20px; line-height: 1.6; color: #333;">
+                        <p>Gentile {{recipient_name}},</p>
+
+                        <p>Il calendario di smart working è stato aggiornato. Ecco le modifiche:</p>
+
+                        {table.to_html(index=False, border=1)}
+
+                        <p>Grazie mille,<br>
+                        Martino</p>
+                    </body>
+                    </html>
+                    """
+    return subject, body_html
+
+
+def month_report(aggregates, overlaps, month):
+    """Returns the JSON-serializable stats and overlap days of one month."""
+    stats = aggregates.sw_stats(month, month)
+    return {
+        "month": month,
+        "label": format_month_name(month),
+        "overlaps": [str(day) for day in overlaps.get(month, [])],
+        "stats": stats.to_dict(orient="records"),
+    }
@@ -0,0 +1,123 @@
+import numpy as np
+import pandas as pd
+from calendar_core.model import CASA, UFFICIO
+
+
+def status_counts(model, rows, working=None):
+    """Counts days per (person, status code) over the given sheet rows.
+
+    Returns a (person, code) int64 matrix aligned with `model.persons` and
+    `model.labels`. Days outside the `working` (month, day) mask count as X.
+    """
+    n_codes = len(model.labels)
+    persons = np.repeat(model.row_person[rows], len(model.days))
+    flat = persons.astype(np.int64) * n_codes + model.working_codes(rows, working).ravel()
+    counts = np.bincount(flat, minlength=len(model.persons) * n_codes)
+    return counts.reshape(len(model.persons), n_codes)
+
+
+def sw_stats_frame(model, persons, counts):
+    """Builds the "Statistiche Smart Working" table from per-person status counts."""
+    casa = counts[:, CASA]
+    ufficio = counts[:, UFFICIO]
+    total = casa + ufficio
+    with np.errstate(invalid="ignore", divide="ignore"):
+        sw_percentage = np.where(total > 0, casa / total * 100, 0.0)
+    return pd.DataFrame({
+        "Persona": model.persons[persons],
+        "Giorni Casa": casa,
+        "Giorni Ufficio": ufficio,
+        "% Smart Working": sw_percentage,  # Use 0-100 scale
+    })
+
+
+def smart_working_stats(model, rows, working=None):
+    """Per-person Casa/Ufficio days and SW% over the given sheet rows.
+
+    People are listed in order of first appearance among `rows`, like the
+    table computed by the app before. With a `working` (month, day) mask,
+    weekends and holidays are left out.
+    """
+    persons = pd.unique(model.row_person[rows])
+    return sw_stats_frame(model, persons, status_counts(model, rows, working)[persons])
+
+
+class MonthlyAggregates:
+    """Day counts per (month, person, status) with prefix sums over months.
+
+    Built once per data revision; afterwards the counts of any month range are
+    the difference of two prefix rows, whatever the length of the range. Days
+    outside the `working` (month, day) mask are counted as X.
+    """
+
+    def __init__(self, model, working=None):
+        self.model = model
+        n_months, n_persons, n_codes = len(model.months), len(model.persons), len(model.labels)
+
+        has_month = model.row_month >= 0
+        row_month = model.row_month[has_month].astype(np.int64)
+        row_person = model.row_person[has_month].astype(np.int64)
+        cell_key = (row_month * n_persons + row_person) * n_codes
+        flat = (cell_key[:, None] + model.working_codes(has_month, working)).ravel()
+        counts = np.bincount(flat, minlength=n_months * n_persons * n_codes)
+        counts = counts.reshape(n_months, n_persons, n_codes)
+
+        self.prefix = np.zeros((n_months + 1, n_persons, n_codes), dtype=np.int32)
+        np.cumsum(counts, axis=0, out=self.prefix[1:])
+
+        rows_per_cell = np.bincount(row_month * n_persons + row_person, minlength=n_months * n_persons)
+        self.row_prefix = np.zeros((n_months + 1, n_persons), dtype=np.int32)
+        np.cumsum(rows_per_cell.reshape(n_months, n_persons), axis=0, out=self.row_prefix[1:])
+
+        # next_row[m, p]: first sheet row of person p in month m or later, used
+        # to list people in order of appearance within a range.
+        no_row = np.iinfo(np.int64).max
+        first_row = np.full(n_months * n_persons, no_row, dtype=np.int64)
+        np.minimum.at(first_row, row_month * n_persons + row_person, np.flatnonzero(has_month))
+        self.next_row = np.minimum.accumulate(first_row.reshape(n_months, n_persons)[::-1], axis=0)[::-1]
+
+    def _bounds(self, start_month, end_month):
+        lo = self.model.months.searchsorted(start_month, side="left")
+        hi = self.model.months.searchsorted(end_month, side="right")
+        return lo, max(lo, hi)
+
+    def range_counts(self, start_month, end_month, persons=None, codes=None):
+        """Returns (person positions, counts) over an inclusive month range.
+
+        Only people with at least one row in the range are returned, in order
+        of appearance. `persons` (names) and `codes` (status codes) restrict the
+        people and the count columns.
+        """
+        lo, hi = self._bounds(start_month, end_month)
+        present = self.row_prefix[hi] - self.row_prefix[lo] > 0
+        if persons is not None:
+            present &= self.model.persons.isin(persons)
+        positions = np.flatnonzero(present)
+        if lo < hi:
+            positions = positions[np.argsort(self.next_row[lo, positions], kind="stable")]
+        counts = self.prefix[hi, positions] - self.prefix[lo, positions]
+        if codes is not None:
+            counts = counts[:, codes]
+        return positions, counts
+
+    def sw_stats(self, start_month, end_month, persons=None):
+        """The "Statistiche Smart Working" table for an inclusive month range."""
+        positions, counts = self.range_counts(start_month, end_month, persons)
+        return sw_stats_frame(self.model, positions, counts)
+
+    def group_counts(self, start_month, end_month, groups, codes=None):
+        """Sums status counts per group of people (e.g. teams) over a month range.
+
+        `groups` maps a group name to a list of person names. Returns a frame
+        with one row per group and one column per status label.
+        """
+        codes = list(range(len(self.model.labels))) if codes is None else list(codes)
+        lo, hi = self._bounds(start_month, end_month)
+        totals = self.prefix[hi] - self.prefix[lo]
+        data = {
+            name: totals[self.model.persons.isin(members)][:, codes].sum(axis=0)
+            for name, members in groups.items()
+        }
+        return pd.DataFrame.from_dict(
+            data, orient="index", columns=[self.model.labels[c] or "(vuoto)" for c in codes]
+        )
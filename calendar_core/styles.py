@@ -0,0 +1,95 @@
+import hashlib
+from functools import lru_cache
+
+import numpy as np
+from calendar_core.model import BLANK, NA, X
+
+# Fixed colors for specific values
+FIXED_COLORS = {
+    "Ferie": "background-color: #90EE90",  # Verde chiaro
+    "Casa": "background-color: #ADD8E6",   # Blu chiaro
+    "Ufficio": "background-color: #FFA500", # Arancione
+    "Offsite": "background-color: #DAA520",  # Giallo scuro (goldenrod)
+    "Trasferta": "background-color: #FF6B6B"  # Rosso chiaro
+}
+
+
+def chart_color(label):
+    """Returns the fixed color of a status label for charts, or None if it has none."""
+    css = FIXED_COLORS.get(label)
+    return css.split(":", 1)[1].strip() if css else None
+
+
+@lru_cache(maxsize=1024)
+def css_for_label(label):
+    """Returns the cell CSS of a status label; cached for the whole process."""
+    if label in FIXED_COLORS:
+        return FIXED_COLORS[label]
+
+    # For other values, use hash-based colors
+    hex_hash = hashlib.md5(label.encode()).hexdigest()
+    hue = (int(hex_hash[0:8], 16) * 137) % 360
+    saturation = 60 + (int(hex_hash[8:10], 16) % 20)
+    lightness = 70 + (int(hex_hash[10:12], 16) % 10)
+    return f'background-color: hsl({hue}, {saturation}%, {lightness}%)'
+
+
+def css_lookup(labels):
+    """Returns an array mapping each status code to its CSS (empty, blank and X uncolored)."""
+    lut = np.array([css_for_label(label) if label else "" for label in labels], dtype=object)
+    lut[[NA, BLANK, X]] = ""
+    return lut
+
+
+def css_matrix(model, rows):
+    """Returns the CSS of every day cell of the given sheet rows in one lookup."""
+    return css_lookup(model.labels)[model.codes[rows]]
+
+
+def style_rows(frame, model, css):
+    """Applies a precomputed CSS matrix (see `css_matrix`) to the day columns of `frame`."""
+    return frame.style.apply(lambda _: css, axis=None, subset=model.days)
+
+
+# Compact rendering: one short symbol per cell instead of inline CSS, with the
+# same colors as FIXED_COLORS; explained by `legend`
+FIXED_SYMBOLS = {
+    "Ferie": "🟩",
+    "Casa": "🟦",
+    "Ufficio": "🟧",
+    "Offsite": "🟨",
+    "Trasferta": "🟥",
+}
+
+
+def symbol_for_label(label):
+    """Returns the compact symbol of a status label (its first letters if it has no color)."""
+    return FIXED_SYMBOLS.get(label, label[:3])
+
+
+def symbol_lookup(labels):
+    """Returns an array mapping each status code to its symbol (missing and empty cells blank)."""
+    lut = np.array([symbol_for_label(label) for label in labels], dtype=object)
+    lut[[NA, BLANK]] = ""
+    return lut
+
+
+def symbol_matrix(model, rows):
+    """Returns the symbol of every day cell of the given sheet rows in one lookup."""
+    return symbol_lookup(model.labels)[model.codes[rows]]
+
+
+def compact_rows(frame, model, symbols):
+    """Returns `frame` with its day columns replaced by a precomputed symbol matrix."""
+    compact = frame.copy(deep=False)
+    compact[model.days] = symbols
+    return compact
+
+
+def legend(model, rows):
+    """Returns [(symbol, label)] of the statuses found in the given sheet rows."""
+    present = np.unique(model.codes[rows])
+    return [
+        (symbol_for_label(model.labels[code]), model.labels[code])
+        for code in present if code not in (NA, BLANK, X)
+    ]
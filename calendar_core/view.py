@@ -0,0 +1,26 @@
+import numpy as np
+
+
+def person_pages(model, rows, query="", persons_per_page=50):
+    """Splits the given sheet rows into pages of whole persons.
+
+    Only the persons whose name contains `query` (case-insensitive) are kept.
+    Returns a list of arrays of positions into `rows`, each holding the rows of
+    at most `persons_per_page` persons in sheet order.
+    """
+    rows = np.asarray(rows)
+    row_person = model.row_person[rows]
+    positions = np.arange(len(rows))
+    if query:
+        matches = np.asarray(model.persons.str.contains(query, case=False, regex=False), dtype=bool)
+        keep = matches[row_person]
+        positions, row_person = positions[keep], row_person[keep]
+
+    # Persons in order of first appearance among the rows, then their page number
+    persons, first = np.unique(row_person, return_index=True)
+    rank = np.empty(len(persons), dtype=np.int64)
+    rank[np.argsort(first, kind="stable")] = np.arange(len(persons))
+    page_of_row = rank[np.searchsorted(persons, row_person)] // persons_per_page
+
+    n_pages = max(1, -(-len(persons) // persons_per_page))
+    return [positions[page_of_row == page] for page in range(n_pages)]
@@ -0,0 +1,222 @@
+"""Batch jobs on the smart working calendar, without the web app.
+
+Usage:
+    python cli.py report [--month YYYY-MM ...] [--output DIR]
+    python cli.py overlaps [--month YYYY-MM ...]
+    python cli.py email [--month YYYY-MM ...] [--to EMAIL ...]
+    python cli.py export {csv,xlsx,ics} [--from YYYY-MM] [--to YYYY-MM] [--person NAME] [--output FILE]
+
+Settings (SHEET_URL or [[sheets]], service account, [email], recipient_emails,
+overlap_rule, LOCAL_HOLIDAYS) are read from the app secrets file. With --offline
+the last local snapshot saved by the app is used instead of Google Sheets.
+"""
+import argparse
+import datetime
+import json
+import os
+import sys
+
+try:
+    import tomllib
+
+    def _read_toml(path):
+        with open(path, "rb") as f:
+            return tomllib.load(f)
+except ImportError:  # Python < 3.11: toml comes with streamlit
+    from toml import load as _read_toml
+
+from calendar_core.dimension import parse_local_holidays, working_days
+from calendar_core.model import TEAM_COLUMN, build_calendar_model, combine_teams
+from calendar_core.months import find_month_column, selectable_months
+from calendar_core.overlaps import overlap_index, rule_from_config
+from calendar_core.report import format_days, month_email, month_report
+from calendar_core.stats import MonthlyAggregates
+from utils.sheet_sync import SheetSource, sources_from_config, team_names
+
+DEFAULT_SECRETS = os.path.join(".streamlit", "secrets.toml")
+
+
+def read_secrets(path):
+    """Returns the secrets file as a dict, empty if it does not exist."""
+    return _read_toml(path) if os.path.exists(path) else {}
+
+
+def load_frame(secrets, sources, offline):
+    """Downloads the sources, or reads their latest snapshots when `offline`.
+
+    Several worksheets are combined with a team column, like in the app.
+    """
+    tabs = []
+    if offline:
+        from utils.snapshot_store import SnapshotStore
+
+        store = SnapshotStore(secrets.get("SNAPSHOT_PATH", ".cache/snapshots.sqlite3"))
+        for source in sources:
+            for title in source.worksheets or [None]:
+                stored = store.load(source.snapshot_key(title))
+                if stored is None:
+                    raise SystemExit(f"No local snapshot of {source.snapshot_key(title)}")
+                tabs.append((source, title or stored[2].get("worksheet_title"), stored[0]))
+    else:
+        from utils.rate_limit import RateLimiter, limited_http_client
+        from utils.sheet_sync import authorize, sync_worksheets
+
+        if "gcp_service_account" not in secrets:
+            raise SystemExit("Missing [gcp_service_account] in the secrets file")
+        limiter = RateLimiter(
+            rate=secrets.get("SHEETS_RATE_PER_SECOND", 1.0),
+            burst=secrets.get("SHEETS_BURST", 10),
+            max_retries=secrets.get("SHEETS_MAX_RETRIES", 5),
+        )
+        client = authorize(dict(secrets["gcp_service_account"]), limited_http_client(limiter))
+        for source in sources:
+            for title, data in sync_worksheets(client, source.url, source.worksheets, incremental=False).items():
+                tabs.append((source, title, data.df))
+    if len(tabs) == 1:
+        return tabs[0][2]
+    teams = team_names([(source, title) for source, title, _ in tabs])
+    return combine_teams([(team, df) for team, (_, _, df) in zip(teams, tabs)])
+
+
+def working_mask(secrets, model):
+    """Returns the working-day mask of the calendar, with the LOCAL_HOLIDAYS of the secrets."""
+    return working_days(model, parse_local_holidays(secrets.get("LOCAL_HOLIDAYS")))
+
+
+def pick_months(model, months):
+    """Returns the requested months, or every month from the current one on."""
+    if months:
+        unknown = sorted(set(months) - set(model.months))
+        if unknown:
+            raise SystemExit(f"Months not in the sheet: {', '.join(unknown)}")
+        return months
+    current_ym = datetime.datetime.now().strftime("%Y-%m")
+    return selectable_months(list(model.months), current_ym)[0]
+
+
+def cmd_report(args, secrets, df, model, overlaps):
+    aggregates = MonthlyAggregates(model, working_mask(secrets, model))
+    reports = [month_report(aggregates, overlaps, month) for month in pick_months(model, args.month)]
+    if not args.output:
+        print(json.dumps(reports, indent=2, ensure_ascii=False))
+        return 0
+    os.makedirs(args.output, exist_ok=True)
+    for report in reports:
+        path = os.path.join(args.output, f"{report['month']}.json")
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+        print(path)
+    return 0
+
+
+def cmd_overlaps(args, secrets, df, model, overlaps):
+    for month in pick_months(model, args.month):
+        print(f"{month}: {format_days(overlaps.get(month, [])) or '-'}")
+    return 0
+
+
+def cmd_email(args, secrets, df, model, overlaps):
+    from utils.email_sender import send_email
+
+    if "email" not in secrets:
+        raise SystemExit("Missing [email] in the secrets file")
+    predefined_recipients = dict(secrets.get("recipient_emails", {}))
+    recipients = args.to or list(predefined_recipients.values())
+    if not recipients:
+        raise SystemExit("No recipients: use --to or set recipient_emails in the secrets file")
+    recipient_names = {email: name for name, email in predefined_recipients.items()}
+
+    failures = 0
+    for month in pick_months(model, args.month):
+        frame = df.iloc[model.month_rows(month)]
+        subject, body_html, attachment_df = month_email(frame, model.month_col, month, overlaps.get(month, []))
+        success, message, _ = send_email(
+            recipients, subject, body_html, attachment_df,
+            recipient_names=recipient_names, smtp_config=secrets["email"],
+        )
+        print(f"{month}: {message}")
+        failures += not success
+    return 1 if failures else 0
+
+
+def cmd_export(args, secrets, df, model, overlaps):
+    from calendar_core.export import export_rows, iter_csv, iter_ics, iter_xlsx, xlsx_available
+
+    for month in filter(None, (args.from_month, args.to_month)):
+        if month not in set(model.months):
+            raise SystemExit(f"Month not in the sheet: {month}")
+    if args.person is not None and args.person not in set(model.persons):
+        raise SystemExit(f"Person not in the sheet: {args.person}")
+    start = args.from_month or (model.months[0] if len(model.months) else None)
+    end = args.to_month or (model.months[-1] if len(model.months) else None)
+
+    if args.format == "ics":
+        if args.person is None:
+            raise SystemExit("--person is required for the ics format")
+        chunks = (text.encode("utf-8") for text in iter_ics(model, args.person, start, end))
+    elif args.format == "xlsx":
+        if not xlsx_available():
+            raise SystemExit("The xlsx format needs openpyxl (pip install openpyxl)")
+        chunks = iter_xlsx(df, export_rows(model, start, end, args.person))
+    else:
+        chunks = (text.encode("utf-8") for text in iter_csv(df, export_rows(model, start, end, args.person)))
+
+    # Written as they are produced, so memory does not grow with the range
+    out = open(args.output, "wb") if args.output else sys.stdout.buffer
+    try:
+        for chunk in chunks:
+            out.write(chunk)
+    finally:
+        if args.output:
+            out.close()
+    return 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--secrets", default=DEFAULT_SECRETS, help="path of the app secrets.toml")
+    parser.add_argument("--sheet-url", help="defaults to SHEET_URL from the secrets")
+    parser.add_argument("--offline", action="store_true", help="use the last local snapshot")
+    parser.add_argument("--team", help="only the rows of this team (with several worksheets)")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    report = commands.add_parser("report", help="stats and overlaps per month, as JSON")
+    report.add_argument("--output", help="write one <month>.json file per month in this directory")
+    commands.add_parser("overlaps", help="overlapping days per month")
+    email = commands.add_parser("email", help="send the monthly calendar email")
+    email.add_argument("--to", nargs="+", help="defaults to all recipient_emails")
+    for command in (report, commands.choices["overlaps"], email):
+        command.add_argument("--month", nargs="+", help="months (YYYY-MM); default: from the current one on")
+    export = commands.add_parser("export", help="stream the calendar as CSV, Excel or iCalendar")
+    export.add_argument("format", choices=("csv", "xlsx", "ics"))
+    export.add_argument("--from", dest="from_month", help="first month (YYYY-MM); default: the first one")
+    export.add_argument("--to", dest="to_month", help="last month (YYYY-MM); default: the last one")
+    export.add_argument("--person", help="only this person (required for ics)")
+    export.add_argument("--output", help="file to write; default: standard output")
+
+    args = parser.parse_args(argv)
+    secrets = read_secrets(args.secrets)
+    if args.sheet_url or not secrets.get("sheets"):
+        sheet_url = args.sheet_url or secrets.get("SHEET_URL")
+        if not sheet_url:
+            parser.error("no sheet URL: use --sheet-url or set SHEET_URL in the secrets")
+        sources = [SheetSource(sheet_url)]
+    else:
+        sources = sources_from_config(secrets["sheets"])
+
+    df = load_frame(secrets, sources, args.offline)
+    if args.team:
+        if TEAM_COLUMN not in df.columns:
+            raise SystemExit("--team needs several worksheets ([[sheets]] in the secrets)")
+        df = df[df[TEAM_COLUMN] == args.team].drop(columns=TEAM_COLUMN).reset_index(drop=True)
+    model = build_calendar_model(df, find_month_column(list(df.columns)))
+    if model.month_col is None:
+        raise SystemExit(f"No month column in the sheet. Columns: {list(df.columns)}")
+    overlaps = overlap_index(model, rule_from_config(secrets.get("overlap_rule")), working_mask(secrets, model))
+
+    handlers = {"report": cmd_report, "overlaps": cmd_overlaps, "email": cmd_email, "export": cmd_export}
+    return handlers[args.command](args, secrets, df, model, overlaps)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,51 @@
+import pandas as pd
+
+from benchmarks.generator import make_calendar
+from calendar_core.diff import calendar_diff, subscriber_changes
+from calendar_core.model import build_calendar_model
+
+
+def model_of(df):
+    return build_calendar_model(df, "mese")
+
+
+def test_identical_calendars_have_no_changes():
+    df = make_calendar(5, 3)
+    assert calendar_diff(model_of(df), model_of(df)).empty
+
+
+def test_absent_person_month_is_not_a_change():
+    df = make_calendar(5, 3)
+    # Persona 001 has no row in the last month: its cube cells are NA
+    df = df[~((df["persona"] == "Persona 001") & (df["mese"] == df["mese"].iloc[-1]))].reset_index(drop=True)
+    assert calendar_diff(model_of(df), model_of(df.copy())).empty
+
+
+def test_one_edit_is_one_change():
+    old = make_calendar(5, 3)
+    new = old.copy()
+    new.loc[len(new) - 1, "31"] = "Trasferta" if new.loc[len(new) - 1, "31"] != "Trasferta" else "Casa"
+    changes = calendar_diff(model_of(old), model_of(new))
+    assert len(changes) == 1
+    assert changes.iloc[0][["Persona", "Giorno", "Dopo"]].tolist() == [new.loc[len(new) - 1, "persona"], "31", new.loc[len(new) - 1, "31"]]
+
+
+def test_empty_and_missing_cells_are_the_same():
+    old = pd.DataFrame({"mese": ["2026-10", "2026-10"], "persona": ["A", "B"], "1": ["", "Casa"]})
+    new = pd.DataFrame({"mese": ["2026-10"], "persona": ["B"], "1": ["Casa"]})
+    assert calendar_diff(model_of(old), model_of(new)).empty
+    assert calendar_diff(model_of(new), model_of(old)).empty
+
+
+def test_new_label_and_removed_row():
+    old = pd.DataFrame({"mese": ["2026-10", "2026-10"], "persona": ["A", "B"], "1": ["Casa", "Ufficio"]})
+    new = pd.DataFrame({"mese": ["2026-10"], "persona": ["A"], "1": ["Malattia"]})
+    changes = calendar_diff(model_of(old), model_of(new))
+    assert changes[["Persona", "Prima", "Dopo"]].values.tolist() == [["A", "Casa", "Malattia"], ["B", "Ufficio", ""]]
+
+
+def test_subscriber_changes_groups_identical_digests():
+    changes = pd.DataFrame({"Mese": ["2026-10"] * 2, "Persona": ["A", "B"], "Giorno": ["1", "2"],
+                            "Prima": ["Casa", "Casa"], "Dopo": ["Ferie", "Ferie"]})
+    groups = subscriber_changes(changes, {"a@x": ["A"], "a2@x": "A", "all@x": "*", "c@x": ["C"]})
+    assert sorted((sorted(emails), len(rows)) for emails, rows in groups) == [(["a2@x", "a@x"], 1), (["all@x"], 2)]
@@ -0,0 +1,54 @@
+import datetime
+
+import pandas as pd
+import pytest
+
+from benchmarks.generator import make_calendar
+from calendar_core.dimension import easter_sunday, italian_holidays, parse_local_holidays, working_days
+from calendar_core.model import build_calendar_model
+
+
+def test_easter_sunday():
+    assert easter_sunday(2024) == datetime.date(2024, 3, 31)
+    assert easter_sunday(2025) == datetime.date(2025, 4, 20)
+    assert easter_sunday(2038) == datetime.date(2038, 4, 25)  # latest possible
+
+
+def test_local_holidays():
+    local = parse_local_holidays(["06-24", {"date": "2026-12-24", "name": "Chiusura aziendale"}, "02-29"])
+    holidays_2026 = italian_holidays(2026, local)
+    assert holidays_2026[datetime.date(2026, 6, 24)] == "Festa locale"
+    assert holidays_2026[datetime.date(2026, 12, 24)] == "Chiusura aziendale"
+    assert datetime.date(2027, 12, 24) not in italian_holidays(2027, local)
+    assert datetime.date(2028, 2, 29) in italian_holidays(2028, local)
+    # A national holiday keeps its name
+    assert italian_holidays(2026, parse_local_holidays(["12-25"]))[datetime.date(2026, 12, 25)] == "Natale"
+    with pytest.raises(ValueError):
+        parse_local_holidays(["24/06"])
+
+
+def test_working_day_mask():
+    df = make_calendar(2, 2, start="2025-04")
+    model = build_calendar_model(df, "mese")
+    mask = working_days(model, parse_local_holidays(["05-02"]))
+    april, may = list(model.months).index("2025-04"), list(model.months).index("2025-05")
+    day = {d: list(model.days).index(str(d)) for d in range(1, 32)}
+
+    assert mask[april, day[1]]                    # Tuesday
+    assert not mask[april, day[5]]                # Saturday
+    assert not mask[april, day[21]]               # Easter Monday
+    assert not mask[april, day[25]]               # Liberazione
+    assert not mask[april, day[31]]               # no April 31st
+    assert not mask[may, day[1]] and not mask[may, day[2]]  # Festa del Lavoro, local holiday
+    assert mask[may, day[5]]
+    assert mask[april].sum() == 20
+
+
+def test_non_dates_stay_working():
+    df = pd.DataFrame({"mese": ["2025-04", "totale"], "persona": ["A", "A"], "5": ["X", "1"], "note": ["", ""]})
+    model = build_calendar_model(df, "mese")
+    mask = working_days(model)
+    row = {month: i for i, month in enumerate(model.months)}
+    col = {d: i for i, d in enumerate(model.days)}
+    assert not mask[row["2025-04"], col["5"]]
+    assert mask[row["totale"], col["5"]] and mask[row["2025-04"], col["note"]]
@@ -0,0 +1,102 @@
+import time
+
+import pytest
+
+import utils.gsheets as gsheets
+from benchmarks.fake_gspread import FakeClient, FakeSpreadsheet
+from benchmarks.generator import make_calendar
+from utils.sheet_sync import SheetSource
+
+
+@pytest.fixture
+def sheet(monkeypatch, tmp_path):
+    spreadsheet = FakeSpreadsheet.from_frame(make_calendar(4, 2, start="2026-10"))
+    client = FakeClient(spreadsheet)
+    warnings = []
+    monkeypatch.setattr(gsheets, "connect_to_gsheets", lambda: client)
+    monkeypatch.setattr(gsheets._snapshots, "path", str(tmp_path / "snapshots.sqlite3"))
+    monkeypatch.setattr(gsheets, "_started", set())
+    monkeypatch.setattr(gsheets.st, "warning", warnings.append)
+    gsheets._data_cache.invalidate()
+    yield spreadsheet, client, [SheetSource(spreadsheet.url)], warnings
+    gsheets._data_cache.invalidate()
+
+
+def wait_for_sync():
+    while gsheets._data_cache.stats()["inflight"]:
+        time.sleep(0.005)
+
+
+def restart():
+    """Forgets everything but the snapshots, like a new process."""
+    gsheets._data_cache.invalidate()
+    gsheets._started.clear()
+
+
+def test_sessions_share_one_download(sheet):
+    _, client, sources, _ = sheet
+    first = gsheets.load_calendar(sources)
+    client.calls.clear()
+    assert gsheets.load_calendar(sources) is first
+    assert client.calls == {}
+
+    gsheets.refresh_data(sources)
+    gsheets.load_calendar(sources)
+    assert client.calls == {"drive_metadata": 1, "values_batch_get": 1}
+
+
+def test_refresh_waits_for_a_fresh_sync(sheet):
+    spreadsheet, _, sources, warnings = sheet
+    gsheets.load_calendar(sources)
+    spreadsheet.set_cell(2, 3, "Ferie")
+
+    gsheets.refresh_data(sources)
+    df = gsheets.load_calendar(sources)
+    assert df.loc[0, "1"] == "Ferie"
+    assert warnings == []
+
+
+def test_cold_start_renders_the_snapshot_with_a_warning(sheet):
+    spreadsheet, client, sources, warnings = sheet
+    gsheets.load_calendar(sources)
+    spreadsheet.set_cell(2, 3, "Ferie")
+    restart()
+
+    assert gsheets.load_calendar(sources).loc[0, "1"] != "Ferie"
+    assert warnings == [gsheets.STALE_WARNING]
+    wait_for_sync()
+    assert gsheets.load_calendar(sources).loc[0, "1"] == "Ferie"
+
+
+def test_failed_reconcile_keeps_warning(sheet):
+    spreadsheet, client, sources, warnings = sheet
+    gsheets.load_calendar(sources)
+    restart()
+    client.spreadsheets.clear()  # Google answers nothing
+
+    gsheets.load_calendar(sources)
+    wait_for_sync()
+    warnings.clear()
+    assert gsheets.load_calendar(sources) is not None
+    assert len(warnings) == 1 and "ultima copia" in warnings[0]
+
+
+def test_offline_mode_decodes_each_snapshot_once(sheet, monkeypatch):
+    spreadsheet, _, sources, warnings = sheet
+    gsheets.load_calendar(sources)
+    restart()
+    monkeypatch.setattr(gsheets, "OFFLINE_MODE", True)
+    reads = []
+    load = gsheets._snapshots.load
+    monkeypatch.setattr(gsheets._snapshots, "load", lambda *args: reads.append(args) or load(*args))
+
+    first = gsheets.load_calendar(sources)
+    assert gsheets.load_calendar(sources) is first
+    assert len(reads) == 1
+
+    # A newer snapshot is picked up
+    df, _, meta = load(spreadsheet.url)
+    gsheets._snapshots.save(spreadsheet.url, "2", df.assign(**{"1": "Ferie"}), meta)
+    assert gsheets.load_calendar(sources).loc[0, "1"] == "Ferie"
+    assert len(reads) == 2
+    assert warnings == []
@@ -0,0 +1,23 @@
+import numpy as np
+import pandas as pd
+
+from calendar_core.model import build_calendar_model
+from calendar_core.stats import MonthlyAggregates, smart_working_stats
+
+
+def test_rows_without_a_person_get_their_own_code():
+    df = pd.DataFrame({
+        "mese": ["2025-04"] * 3,
+        "persona": ["Anna", None, np.nan],
+        "1": ["Casa", "Ufficio", "Ufficio"],
+        "2": ["Casa", "Casa", "Ufficio"],
+    })
+    model = build_calendar_model(df, "mese")
+    assert list(model.persons) == ["Anna", ""]
+    assert list(model.row_person) == [0, 1, 1]
+
+    stats = smart_working_stats(model, np.arange(len(df))).set_index("Persona")
+    assert stats.loc["Anna", "Giorni Casa"] == 2 and stats.loc["Anna", "Giorni Ufficio"] == 0
+    assert stats.loc["", "Giorni Casa"] == 1 and stats.loc["", "Giorni Ufficio"] == 3
+    ranged = MonthlyAggregates(model).sw_stats("2025-04", "2025-04").set_index("Persona")
+    assert ranged.loc["Anna", "Giorni Casa"] == 2 and ranged.loc["", "Giorni Ufficio"] == 3
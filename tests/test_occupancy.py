@@ -0,0 +1,50 @@
+import datetime
+
+import pandas as pd
+
+from calendar_core.dimension import working_days
+from calendar_core.model import build_calendar_model
+from calendar_core.occupancy import OCCUPANCY_LABELS, Occupancy, occupancy_summary
+
+# April 2025: the 1st-3rd are Tuesday-Thursday, the 5th a Saturday
+CALENDAR = pd.DataFrame({
+    "mese": ["2025-05", "2025-04", "2025-04", "2025-04"],
+    "persona": ["Anna", "Anna", "Bruno", "Carla"],
+    "1": ["Ferie", "Ufficio", "Ufficio", "Casa"],
+    "2": ["Ufficio", "Ufficio", "Ufficio", "Ufficio"],
+    "3": ["", "Casa", "Trasferta", "Offsite"],
+    "5": ["X", "X", "Ufficio", "X"],
+})
+
+
+def occupancy():
+    model = build_calendar_model(CALENDAR, "mese")
+    return Occupancy(model, working_days(model))
+
+
+def test_daily_headcount_of_working_days():
+    frame = occupancy().frame("2025-04", "2025-04")
+    assert list(frame.columns) == list(OCCUPANCY_LABELS)
+    assert list(frame.index.day) == [1, 2, 3]
+    assert frame.loc["2025-04-01"].to_dict() == {"Ufficio": 2, "Casa": 1, "Trasferta": 0, "Offsite": 0, "Ferie": 0}
+    assert frame.loc["2025-04-03"].to_dict() == {"Ufficio": 0, "Casa": 1, "Trasferta": 1, "Offsite": 1, "Ferie": 0}
+    assert occupancy().frame("2025-04", "2025-04", working_only=False).loc["2025-04-05", "Ufficio"] == 1
+
+
+def test_ranges_are_sorted_by_date():
+    # May 1st is a holiday and the 3rd a Saturday; the range spans both months in date order
+    frame = occupancy().frame("2025-04", "2025-05")
+    assert [d.isoformat() for d in frame.index.date] == [
+        "2025-04-01", "2025-04-02", "2025-04-03", "2025-05-02", "2025-05-05",
+    ]
+    assert frame.loc["2025-05-02", "Ufficio"] == 1
+    assert occupancy().frame("2025-06", "2025-07").empty
+
+
+def test_capacity_flags():
+    frame = occupancy().frame("2025-04", "2025-05", capacity=2)
+    assert list(frame["Posti liberi"]) == [0, -1, 2, 1, 2]
+    assert list(frame["Oltre capienza"]) == [False, True, False, False, False]
+    assert occupancy_summary(frame, 2) == {"peak": 3, "peak_date": datetime.date(2025, 4, 2), "over_capacity": 1}
+    assert occupancy_summary(frame)["over_capacity"] == 0
+    assert occupancy_summary(frame.iloc[:0]) == {"peak": 0, "peak_date": None, "over_capacity": 0}
@@ -0,0 +1,82 @@
+import sqlite3
+import time
+
+import pytest
+
+from benchmarks.smtp_sink import SMTPSink
+from utils.outbox import FAILED, RETRY, SENT, Outbox, summarize_job
+
+RECIPIENTS = ["mario@example.com", "anna@example.com"]
+
+
+@pytest.fixture
+def sink():
+    with SMTPSink(defer={"anna@example.com": 1}) as sink:
+        yield sink
+
+
+def outbox(tmp_path, sink, **options):
+    return Outbox(str(tmp_path / "outbox.sqlite3"), sink.smtp_config(), base_delay=0.0, **options)
+
+
+def statuses(box, job_id):
+    return {row["recipient"]: row["status"] for row in box.status(job_id)}
+
+
+def test_delivers_and_retries_transient_errors(tmp_path, sink):
+    box = outbox(tmp_path, sink)
+    job_id = box.enqueue(RECIPIENTS + ["not-an-email"], "Calendario", "<p>Ciao {recipient_name}</p>")
+    box.process_due()
+    assert statuses(box, job_id) == {"mario@example.com": SENT, "anna@example.com": RETRY, "not-an-email": "invalid"}
+    box.process_due()
+    progress = summarize_job(box.status(job_id))
+    assert sorted(progress["successful"]) == sorted(RECIPIENTS) and not progress["pending"]
+    assert len(sink.messages) == 2
+
+
+def test_double_click_is_one_job_and_resend_is_another(tmp_path, sink):
+    box = outbox(tmp_path, sink, dedupe_seconds=0.2)
+    job_id = box.enqueue(RECIPIENTS, "Calendario", "<p>Ciao</p>")
+    assert box.enqueue(RECIPIENTS, "Calendario", "<p>Ciao</p>") == job_id
+    assert box.enqueue(RECIPIENTS[:1], "Calendario", "<p>Ciao</p>") != job_id
+
+    # Still being sent (anna is deferred once): still the same job
+    box.process_due()
+    time.sleep(0.3)
+    assert box.enqueue(RECIPIENTS, "Calendario", "<p>Ciao</p>") == job_id
+
+    # Finished and older than the dedupe window: a deliberate resend
+    box.process_due()
+    resend = box.enqueue(RECIPIENTS, "Calendario", "<p>Ciao</p>")
+    assert resend != job_id
+    box.process_due()
+    box.process_due()
+    assert set(statuses(box, resend).values()) == {SENT}
+
+
+def test_broken_job_is_not_left_sending(tmp_path, sink):
+    box = outbox(tmp_path, sink)
+    job_id = box.enqueue(RECIPIENTS, "Calendario", "<p>Ciao</p>")
+    box.smtp_config = {"smtp_server": "127.0.0.1"}  # settings lost after enqueuing
+    box.process_due()
+    assert set(statuses(box, job_id).values()) == {FAILED}
+    assert not summarize_job(box.status(job_id))["pending"]
+
+
+def test_incomplete_settings_fail_at_creation(tmp_path):
+    with pytest.raises(KeyError):
+        Outbox(str(tmp_path / "outbox.sqlite3"), {"smtp_server": "127.0.0.1", "smtp_port": 25})
+
+
+def test_connections_are_closed(tmp_path, sink, monkeypatch):
+    opened = []
+    connect = sqlite3.connect
+    monkeypatch.setattr(sqlite3, "connect", lambda *args, **kwargs: opened.append(connect(*args, **kwargs)) or opened[-1])
+    box = outbox(tmp_path, sink)
+    job_id = box.enqueue(RECIPIENTS, "Calendario", "<p>Ciao</p>")
+    box.process_due()
+    box.status(job_id)
+    assert len(opened) >= 4
+    for conn in opened:
+        with pytest.raises(sqlite3.ProgrammingError):
+            conn.execute("SELECT 1")
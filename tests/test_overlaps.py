@@ -0,0 +1,46 @@
+import pandas as pd
+
+from calendar_core.dimension import working_days
+from calendar_core.model import build_calendar_model
+from calendar_core.overlaps import AllInRule, FewerThanRule, overlap_index, rule_from_config
+
+# April 2025: the 1st-3rd are Tuesday-Thursday, the 5th a Saturday
+CALENDAR = pd.DataFrame({
+    "mese": ["2025-04"] * 3,
+    "persona": ["Anna", "Bruno", "Carla"],
+    "1": ["Ufficio", "Offsite", "Ufficio"],
+    "2": ["Casa", "Ufficio", "Ufficio"],
+    "3": ["Trasferta", None, "Trasferta"],
+    "5": ["X", "X", "X"],
+})
+
+
+def overlaps(rule, working=True):
+    model = build_calendar_model(CALENDAR, "mese")
+    return overlap_index(model, rule, working_days(model) if working else None)["2025-04"]
+
+
+def test_nobody_at_home_by_default():
+    # Empty cells are ignored; the weekend X is not one of the statuses
+    assert overlaps(None) == ["1", "3"]
+    assert overlaps(AllInRule(["Ufficio"])) == []
+
+
+def test_fewer_than_rule():
+    assert overlaps(FewerThanRule("Casa", 1)) == ["1", "3"]
+    assert overlaps(FewerThanRule("Casa", 2)) == ["1", "2", "3"]
+    # Without the working-day mask the weekend has nobody at home too
+    assert overlaps(FewerThanRule("Casa", 1), working=False) == ["1", "3", "5"]
+
+
+def test_rules_from_config():
+    assert rule_from_config(None).key == AllInRule().key
+    assert rule_from_config({"statuses": ["Ufficio"]}).key == ("all_in", ("Ufficio",))
+    rule = rule_from_config({"rule": "fewer_than", "status": "Casa", "count": "2"})
+    assert rule.key == ("fewer_than", "Casa", 2)
+    assert overlaps(rule) == ["1", "2", "3"]
+
+
+def test_without_month_column():
+    model = build_calendar_model(CALENDAR.drop(columns="mese"))
+    assert overlap_index(model) == {None: ["1", "3"]}
@@ -0,0 +1,61 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from gspread.exceptions import APIError
+
+from benchmarks.fake_gspread import FakeSheetsAPI, FakeSpreadsheet
+from benchmarks.generator import make_calendar
+from utils.rate_limit import RateLimiter, limited_http_client
+from utils.sheet_sync import full_sync
+
+
+@pytest.fixture
+def spreadsheet():
+    return FakeSpreadsheet.from_frame(make_calendar(5, 2))
+
+
+def test_quota_errors_are_retried(spreadsheet):
+    api = FakeSheetsAPI(spreadsheet)
+    limiter = RateLimiter(rate=1000, burst=10, base_delay=0.01)
+    api.fail_next(2, 429)
+    data = full_sync(api.client(limited_http_client(limiter)), spreadsheet.url)
+    assert len(data.df) == 10
+    assert api.calls[429] == 2
+    assert limiter.stats()["retried"] == 2
+
+
+def test_retry_after_is_honored(spreadsheet):
+    api = FakeSheetsAPI(spreadsheet)
+    limiter = RateLimiter(rate=1000, burst=10, base_delay=10)
+    api.fail_next(1, 429, retry_after=0)
+    full_sync(api.client(limited_http_client(limiter)), spreadsheet.url)
+    assert limiter.stats()["retried"] == 1
+
+
+def test_client_errors_are_not_retried(spreadsheet):
+    api = FakeSheetsAPI(spreadsheet)
+    limiter = RateLimiter(rate=1000, burst=10, base_delay=0.01)
+    api.fail_next(1, 403)
+    with pytest.raises(APIError):
+        full_sync(api.client(limited_http_client(limiter)), spreadsheet.url)
+    assert limiter.stats()["retried"] == 0
+
+
+def test_retries_give_up(spreadsheet):
+    api = FakeSheetsAPI(spreadsheet)
+    limiter = RateLimiter(rate=1000, burst=10, max_retries=2, base_delay=0.01)
+    api.fail_next(5, 503)
+    with pytest.raises(APIError):
+        full_sync(api.client(limited_http_client(limiter)), spreadsheet.url)
+    assert api.calls[503] == 3
+    assert limiter.stats()["failed"] == 1
+
+
+def test_concurrent_sessions_are_throttled_under_the_quota(spreadsheet):
+    api = FakeSheetsAPI(spreadsheet, quota=(10, 0.5))  # 20 requests/s
+    limiter = RateLimiter(rate=15, burst=1, base_delay=0.01)
+    with ThreadPoolExecutor(max_workers=6) as pool:
+        loaded = list(pool.map(lambda _: full_sync(api.client(limited_http_client(limiter)), spreadsheet.url), range(6)))
+    assert all(len(data.df) == 10 for data in loaded)
+    assert 429 not in api.calls
+    assert limiter.stats()["throttled"] > 0
@@ -0,0 +1,124 @@
+import pytest
+
+import utils.gsheets as gsheets
+from benchmarks.fake_gspread import FakeClient, FakeSheetsAPI, FakeSpreadsheet
+from benchmarks.generator import make_calendar
+from utils.sheet_sync import RevisionConflict, SheetSource, full_sync, write_cells
+
+MONTH = "2026-10"
+
+
+@pytest.fixture
+def sheet(monkeypatch, tmp_path):
+    spreadsheet = FakeSpreadsheet.from_frame(make_calendar(4, 2, start=MONTH))
+    client = FakeClient(spreadsheet)
+    monkeypatch.setattr(gsheets, "connect_to_gsheets", lambda: client)
+    monkeypatch.setattr(gsheets._snapshots, "path", str(tmp_path / "snapshots.sqlite3"))
+    gsheets._data_cache.invalidate()
+    yield spreadsheet, client, [SheetSource(spreadsheet.url)]
+    gsheets._data_cache.invalidate()
+
+
+def row_of(df, person):
+    row = df[(df["mese"] == MONTH) & (df["persona"] == person)]
+    return {day: str(value) for day, value in row.iloc[0].drop(["mese", "persona"]).items()}
+
+
+def save(sources, df, person, values):
+    return gsheets.save_row_edits(sources, df.attrs["revision"], MONTH, person, row_of(df, person), values)
+
+
+def test_save_is_one_batch_update_without_download(sheet):
+    spreadsheet, client, sources = sheet
+    df = gsheets.load_calendar(sources)
+    client.calls.clear()
+
+    assert save(sources, df, "Persona 002", {"1": "Trasferta", "2": "Trasferta", "5": "Ferie"}) == 3
+    assert client.calls == {"drive_metadata": 2, "values_batch_update": 1}
+    assert spreadsheet.worksheets["Foglio1"][2][2:4] == ["Trasferta", "Trasferta"]
+
+    # The cached copy holds the edits and the sheet revision: nothing to download
+    client.calls.clear()
+    reloaded = gsheets.load_calendar(sources)
+    assert row_of(reloaded, "Persona 002")["1"] == "Trasferta"
+    assert reloaded.attrs["revision"] == str(spreadsheet.revision)
+    assert "values_batch_get" not in client.calls
+
+
+def test_consecutive_saves(sheet):
+    spreadsheet, client, sources = sheet
+    save(sources, gsheets.load_calendar(sources), "Persona 002", {"1": "Ferie"})
+    save(sources, gsheets.load_calendar(sources), "Persona 002", {"2": "Ferie"})
+    assert spreadsheet.worksheets["Foglio1"][2][2:4] == ["Ferie", "Ferie"]
+
+
+def test_same_titled_spreadsheets_stay_separate_teams(sheet, monkeypatch):
+    spreadsheet, client, _ = sheet
+    other = FakeSpreadsheet.from_frame(make_calendar(4, 2, start=MONTH), sheet_id="other-sheet")
+    client.spreadsheets[other.id] = other
+    sources = [SheetSource(spreadsheet.url), SheetSource(other.url)]
+    df = gsheets.load_calendar(sources)
+    assert sorted(df["team"].unique()) == sorted([spreadsheet.url, other.url])
+
+    original = row_of(df[df["team"] == other.url].drop(columns="team"), "Persona 002")
+    assert gsheets.save_row_edits(sources, df.attrs["revision"], MONTH, "Persona 002", original, {"1": "Ferie"},
+                                  team=other.url) == 1
+    assert other.worksheets["Foglio1"][2][2] == "Ferie"
+    assert spreadsheet.worksheets["Foglio1"][2][2] != "Ferie"
+
+
+def test_unchanged_values_cost_nothing(sheet):
+    _, client, sources = sheet
+    df = gsheets.load_calendar(sources)
+    client.calls.clear()
+    assert save(sources, df, "Persona 002", row_of(df, "Persona 002")) == 0
+    assert client.calls == {}
+
+
+def test_external_edit_is_a_conflict(sheet):
+    spreadsheet, _, sources = sheet
+    df = gsheets.load_calendar(sources)
+    spreadsheet.set_cell(3, 3, "Offsite")  # not synced yet
+    with pytest.raises(RevisionConflict):
+        save(sources, df, "Persona 002", {"1": "Ferie"})
+    assert spreadsheet.worksheets["Foglio1"][2][2] == "Offsite"
+
+
+def test_edit_from_an_older_revision_is_a_conflict(sheet):
+    spreadsheet, _, sources = sheet
+    shown = gsheets.load_calendar(sources)
+    # Another session syncs someone else's edit before this one saves
+    spreadsheet.set_cell(3, 3, "Offsite")
+    gsheets.refresh_data(sources)
+    gsheets.load_calendar(sources)
+    with pytest.raises(RevisionConflict):
+        save(sources, shown, "Persona 002", {"1": "Ferie"})
+    assert spreadsheet.worksheets["Foglio1"][2][2] == "Offsite"
+
+
+def test_several_worksheets_need_the_team(sheet, monkeypatch):
+    df = make_calendar(2, 1, start=MONTH)
+    spreadsheet = FakeSpreadsheet.from_frames({"A": df, "B": df}, "fake-teams")
+    monkeypatch.setattr(gsheets, "connect_to_gsheets", lambda: FakeClient(spreadsheet))
+    sources = [SheetSource(spreadsheet.url, ["A", "B"])]
+    calendar = gsheets.load_calendar(sources)
+    original = row_of(calendar[calendar["team"] == "B"].drop(columns="team"), "Persona 001")
+    with pytest.raises(LookupError):
+        gsheets.save_row_edits(sources, calendar.attrs["revision"], MONTH, "Persona 001", original, {"1": "Ferie"})
+    gsheets.save_row_edits(sources, calendar.attrs["revision"], MONTH, "Persona 001", original, {"1": "Ferie"}, team="B")
+    assert spreadsheet.worksheets["B"][1][2] == "Ferie"
+    assert spreadsheet.worksheets["A"][1][2] == str(df.loc[0, "1"])
+
+
+def test_write_cells_through_the_sheets_api():
+    spreadsheet = FakeSpreadsheet.from_frame(make_calendar(3, 1, start=MONTH))
+    api = FakeSheetsAPI(spreadsheet)
+    client = api.client()
+    data = full_sync(client, spreadsheet.url)
+    api.calls.clear()
+    edited = write_cells(client, spreadsheet.url, data, {(0, "1"): "Ferie", (0, "2"): "Ferie", (2, "4"): "Casa"})
+    assert api.calls == {"drive_metadata": 2, "values_batch_update": 1}
+    assert spreadsheet.read_range("A2:D2")[0][2:] == ["Ferie", "Ferie"]
+    assert edited.revision == str(spreadsheet.revision)
+    assert edited.df.loc[2, "4"] == "Casa"
+    assert edited.df is not data.df
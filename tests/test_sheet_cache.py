@@ -0,0 +1,104 @@
+import threading
+import time
+
+import pytest
+
+from utils.sheet_cache import SheetCache
+
+
+class Loader:
+    """Counts its calls; each returns the next integer, after `delay` seconds."""
+
+    def __init__(self, delay=0.0, error=None):
+        self.delay = delay
+        self.error = error
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def __call__(self):
+        with self._lock:
+            self.calls += 1
+            value = self.calls
+        time.sleep(self.delay)
+        if self.error is not None:
+            raise self.error
+        return value
+
+
+def wait_for(condition, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.005)
+
+
+def test_concurrent_misses_share_one_load():
+    cache, loader = SheetCache(), Loader(delay=0.1)
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(cache.get("k", loader))) for _ in range(5)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert results == [1] * 5
+    assert loader.calls == 1
+    stats = cache.stats()
+    assert (stats["misses"], stats["coalesced"]) == (1, 4)
+
+
+def test_expired_values_are_reloaded():
+    cache, loader = SheetCache(ttl_seconds=0.05), Loader()
+    assert cache.get("k", loader) == 1
+    assert cache.get("k", loader) == 1
+    assert cache.last_outcome() == "hit"
+    time.sleep(0.06)
+    assert cache.get("k", loader) == 2
+    assert cache.last_outcome() == "miss"
+
+
+def test_stale_while_revalidate_serves_the_old_value():
+    cache, loader = SheetCache(ttl_seconds=0.05, stale_while_revalidate=True), Loader(delay=0.05)
+    assert cache.get("k", loader) == 1
+    time.sleep(0.06)
+    assert cache.get("k", loader) == 1
+    assert cache.last_outcome() == "stale"
+    wait_for(lambda: cache.stats()["inflight"] == 0)
+    assert cache.get("k", loader) == 2
+    assert cache.last_outcome() == "hit"
+
+
+def test_invalidate_forces_a_blocking_reload():
+    cache, loader = SheetCache(stale_while_revalidate=True), Loader()
+    cache.get("k", loader)
+    cache.get("other", loader)
+    cache.invalidate("k")
+    assert cache.peek("k") is None
+    assert cache.get("k", loader) == 3
+    assert cache.last_outcome() == "miss"
+    cache.invalidate()
+    assert cache.stats()["entries"] == 0
+
+
+def test_loader_errors_reach_every_caller_and_are_not_cached():
+    cache = SheetCache()
+    with pytest.raises(ValueError):
+        cache.get("k", Loader(error=ValueError("down")))
+    assert cache.peek("k") is None
+    assert cache.get("k", Loader()) == 1
+
+
+def test_failed_background_reload_is_logged_and_stays_stale(caplog):
+    cache = SheetCache(ttl_seconds=0.05, stale_while_revalidate=True)
+    cache.get("k", Loader())
+    time.sleep(0.06)
+    assert cache.get("k", Loader(error=ConnectionError("down"))) == 1
+    wait_for(lambda: cache.reload_error("k") is not None)
+    assert "Background reload of 'k' failed: down" in caplog.text
+    assert cache.stats()["failed_reloads"] == 1
+
+    # Still expired: the next read retries, and a success clears the error
+    assert cache.get("k", Loader(delay=0.01)) == 1
+    assert cache.last_outcome() == "stale"
+    wait_for(lambda: cache.reload_error("k") is None)
+    assert cache.get("k", Loader()) == 1
+    assert cache.last_outcome() == "hit"
@@ -0,0 +1,83 @@
+import datetime
+
+import pytest
+
+import utils.sheet_sync as sheet_sync
+from benchmarks.fake_gspread import FakeClient, FakeSpreadsheet
+from benchmarks.generator import make_calendar
+from utils.sheet_sync import SheetData, SheetSource, full_sync, incremental_sync, sync_worksheets, team_names
+from utils.snapshot_store import SnapshotStore
+
+
+def months_ago(count):
+    today = datetime.date.today()
+    year, month = divmod(today.year * 12 + today.month - 1 - count, 12)
+    return f"{year:04d}-{month + 1:02d}"
+
+
+def test_incremental_sync_matches_full_sync():
+    spreadsheet = FakeSpreadsheet.from_frame(make_calendar(5, 6, start=months_ago(5)))
+    client = FakeClient(spreadsheet)
+    data = full_sync(client, spreadsheet.url)
+    spreadsheet.set_cell(len(data.df) + 1, 3, "Trasferta")  # current month
+    synced = incremental_sync(client, spreadsheet.url, data)
+    assert synced.revision == str(spreadsheet.revision)
+    assert synced.df.equals(full_sync(client, spreadsheet.url).df)
+
+
+def test_old_month_edited_while_stopped_is_synced_after_restart(tmp_path):
+    spreadsheet = FakeSpreadsheet.from_frame(make_calendar(5, 6, start="2024-01"))
+    client = FakeClient(spreadsheet)
+    data = full_sync(client, spreadsheet.url)
+    store = SnapshotStore(str(tmp_path / "snapshots.sqlite3"))
+    store.save(spreadsheet.url, data.revision, data.df, data.meta())
+
+    # January, a month old enough to be reused by incremental syncs
+    spreadsheet.set_cell(2, 3, "Trasferta")
+    restored = SheetData.from_snapshot(*store.load(spreadsheet.url))
+    synced = incremental_sync(client, spreadsheet.url, restored)
+    assert synced.df.loc[0, "1"] == "Trasferta"
+    assert synced.df.equals(full_sync(client, spreadsheet.url).df)
+
+
+def test_first_worksheet_title_is_fetched_once(monkeypatch):
+    monkeypatch.setattr(sheet_sync, "_first_titles", {})
+    spreadsheet = FakeSpreadsheet.from_frame(make_calendar(3, 1))
+    client = FakeClient(spreadsheet)
+    for _ in range(3):
+        assert list(sync_worksheets(client, spreadsheet.url)) == ["Foglio1"]
+    assert client.calls["spreadsheet_metadata"] == 1
+
+    # A renamed first worksheet fails one load, then its title is asked again
+    spreadsheet.worksheets = {"Calendario": spreadsheet.worksheets["Foglio1"]}
+    with pytest.raises(KeyError):
+        sync_worksheets(client, spreadsheet.url)
+    assert list(sync_worksheets(client, spreadsheet.url)) == ["Calendario"]
+    assert client.calls["spreadsheet_metadata"] == 2
+
+
+def test_team_names_keep_same_titled_spreadsheets_apart():
+    first, second = SheetSource("https://a"), SheetSource("https://b")
+    named = SheetSource("https://c", team="Foglio1")
+    tabs = SheetSource("https://d", worksheets=["Team A", "Team B"])
+    assert team_names([(first, "Foglio1"), (tabs, "Team A"), (tabs, "Team B")]) == ["Foglio1", "Team A", "Team B"]
+    assert team_names([(first, "Foglio1"), (second, "Foglio1"), (tabs, "Team A")]) == ["https://a", "https://b", "Team A"]
+    assert team_names([(first, "Foglio1"), (named, "Dati")]) == ["https://a", "Foglio1"]
+
+
+def test_old_month_edits_wait_for_the_full_sync_interval():
+    spreadsheet = FakeSpreadsheet.from_frame(make_calendar(5, 6, start="2024-01"))
+    client = FakeClient(spreadsheet)
+    data = full_sync(client, spreadsheet.url)
+    spreadsheet.set_cell(2, 3, "Trasferta")  # January, reused while the full sync is recent
+    assert incremental_sync(client, spreadsheet.url, data, full_sync_seconds=600).df.loc[0, "1"] != "Trasferta"
+    assert incremental_sync(client, spreadsheet.url, data, full_sync_seconds=0).df.loc[0, "1"] == "Trasferta"
+
+
+def test_unchanged_spreadsheet_is_never_downloaded_again():
+    spreadsheet = FakeSpreadsheet.from_frame(make_calendar(5, 6, start="2024-01"))
+    client = FakeClient(spreadsheet)
+    data = full_sync(client, spreadsheet.url)
+    client.calls.clear()
+    assert incremental_sync(client, spreadsheet.url, data, full_sync_seconds=0) is data
+    assert client.calls == {"drive_metadata": 1}
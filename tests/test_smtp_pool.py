@@ -0,0 +1,58 @@
+import smtplib
+
+import pytest
+
+from benchmarks.smtp_sink import SMTPSink
+from utils.smtp_pool import SMTPSettings, deliver
+
+RECIPIENTS = [f"persona{i}@example.com" for i in range(20)]
+
+
+def render(recipient):
+    return f"To: {recipient}\r\nSubject: Calendario\r\n\r\nCiao\r\n"
+
+
+def settings(sink, **overrides):
+    return SMTPSettings.from_config(sink.smtp_config(**overrides))
+
+
+def delivered(sink):
+    return sorted(recipient for recipients, _ in sink.messages for recipient in recipients)
+
+
+def test_one_connection_by_default():
+    with SMTPSink() as sink:
+        assert settings(sink).max_connections == 1
+        assert deliver(settings(sink), RECIPIENTS, render) == [None] * len(RECIPIENTS)
+    assert delivered(sink) == sorted(RECIPIENTS)
+
+
+@pytest.mark.parametrize("max_sessions", [1, 2])
+def test_pool_larger_than_the_relay_allows(max_sessions):
+    with SMTPSink(delay=0.01, max_sessions=max_sessions) as sink:
+        errors = deliver(settings(sink, max_connections=4), RECIPIENTS, render)
+    assert errors == [None] * len(RECIPIENTS)
+    assert delivered(sink) == sorted(RECIPIENTS)
+
+
+def test_pool_reconnects_dropped_sessions():
+    with SMTPSink(drop_after=3) as sink:
+        errors = deliver(settings(sink, max_connections=3, max_messages_per_connection=5), RECIPIENTS, render)
+    assert errors == [None] * len(RECIPIENTS)
+    assert delivered(sink) == sorted(RECIPIENTS)
+
+
+def test_refused_recipient_fails_alone():
+    refused = RECIPIENTS[7]
+    with SMTPSink(reject=[refused]) as sink:
+        errors = deliver(settings(sink, max_connections=4), RECIPIENTS, render)
+    assert [RECIPIENTS[i] for i, error in enumerate(errors) if error is not None] == [refused]
+    assert isinstance(errors[7], smtplib.SMTPRecipientsRefused)
+    assert len(sink.messages) == len(RECIPIENTS) - 1
+
+
+def test_unreachable_relay_raises():
+    with SMTPSink(max_sessions=0) as sink:
+        config = sink.smtp_config()
+    with pytest.raises(OSError):
+        deliver(SMTPSettings.from_config(config), RECIPIENTS, render)
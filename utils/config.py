@@ -0,0 +1,13 @@
+import streamlit as st
+
+
+def get_secret(key, default=None):
+    """Reads a value from st.secrets, falling back to `default` when missing.
+
+    Unlike `st.secrets.get`, this also works when no secrets.toml exists at all
+    (e.g. when the utils are used from scripts outside Streamlit).
+    """
+    try:
+        return st.secrets.get(key, default)
+    except Exception:
+        return default
@@ -1,17 +1,99 @@
-import smtplib
 import streamlit as st
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
 from email.mime.base import MIMEBase
 from email import encoders
 import re
+import uuid
+from utils.smtp_pool import SMTPSettings, deliver
+from utils.timing import timed
 
 def validate_email(email):
     """Simple email validation using regex."""
     pattern = r'^[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}$'
     return re.match(pattern, email.strip()) is not None
 
-def send_email(recipient_list, subject, body_html, attachment_df=None, recipient_names=None):
+class BatchMessageBuilder:
+    """Builds the per-recipient messages of one send, doing the shared work once.
+
+    The CSV attachment is serialized and base64-encoded a single time and kept
+    as ready-made MIME text; the HTML body is split once around its
+    `{recipient_name}`-style slots. Building a message then only fills the
+    slots, encodes the body and splices the cached attachment in.
+    """
+
+    def __init__(self, sender, subject, body_html, attachment_df=None, slots=("recipient_name",), attachment_csv=None):
+        self.sender = sender
+        self.subject = subject
+        # Alternating literal text / slot names: [text, slot, text, slot, ..., text]
+        pattern = "|".join(re.escape("{" + slot + "}") for slot in slots)
+        self._body_parts = re.split("(" + pattern + ")", body_html) if slots else [body_html]
+        self._boundary = "===============" + uuid.uuid4().hex + "=="
+
+        if attachment_df is not None:
+            attachment_csv = attachment_df.to_csv(index=False)
+
+        self._attachment_text = None
+        if attachment_csv is not None:
+            part = MIMEBase('application', "octet-stream")
+            part.set_payload(attachment_csv)
+            encoders.encode_base64(part)
+            part.add_header('Content-Disposition', 'attachment; filename="calendario.csv"')
+            self._attachment_text = part.as_string()
+
+    def render_body(self, **values):
+        """Fills the body slots; unknown slots are left as they are."""
+        parts = list(self._body_parts)
+        for i in range(1, len(parts), 2):
+            parts[i] = values.get(parts[i][1:-1], parts[i])
+        return "".join(parts)
+
+    def build(self, recipient, message_id=None, **values):
+        """Returns the full message text for one recipient."""
+        msg = MIMEMultipart(boundary=self._boundary)
+        msg["From"] = self.sender
+        msg["To"] = recipient
+        msg["Subject"] = self.subject
+        if message_id:
+            msg["Message-ID"] = message_id
+        msg.attach(MIMEText(self.render_body(**values), "html"))
+        text = msg.as_string()
+        if self._attachment_text is None:
+            return text
+
+        # Insert the pre-rendered attachment part before the closing delimiter
+        closing = text.rfind("--" + self._boundary + "--")
+        return (
+            text[:closing]
+            + "--" + self._boundary + "\n"
+            + self._attachment_text + "\n"
+            + text[closing:]
+        )
+
+def summarize_results(successful, failed, invalid_recipients):
+    """Builds the (overall_success, message, detailed_results) tuple of a send."""
+    # Build result message
+    results = {
+        "successful": successful,
+        "failed": failed,
+        "invalid": invalid_recipients
+    }
+    
+    if successful and not failed and not invalid_recipients:
+        recipient_word = "destinatario" if len(successful) == 1 else "destinatari"
+        return True, f"Email inviate con successo a {len(successful)} {recipient_word}!", results
+    elif successful:
+        msg_parts = [f"✅ Inviate: {len(successful)}"]
+        if failed:
+            msg_parts.append(f"❌ Fallite: {len(failed)}")
+        if invalid_recipients:
+            msg_parts.append(f"⚠️ Non valide: {len(invalid_recipients)}")
+        return True, " | ".join(msg_parts), results
+    else:
+        return False, "Invio fallito per tutti i destinatari.", results
+
+@timed()
+def send_email(recipient_list, subject, body_html, attachment_df=None, recipient_names=None, smtp_config=None):
     """
     Sends an email to the list of recipients.
     Returns a tuple: (overall_success, message, detailed_results)
@@ -22,6 +104,7 @@ def send_email(recipient_list, subject, body_html, attachment_df=None, recipient
         body_html: Email body HTML template (can contain {recipient_name} placeholder)
         attachment_df: Optional DataFrame to attach as CSV
         recipient_names: Optional dict mapping email -> name for personalization
+        smtp_config: Optional SMTP settings, defaults to st.secrets["email"]
     """
     # Validate all emails first
     valid_recipients = []
@@ -41,66 +124,27 @@ def send_email(recipient_list, subject, body_html, attachment_df=None, recipient
     failed = []
     
     try:
-        smtp_config = st.secrets["email"]
-        sender_email = smtp_config["sender_email"]
-        sender_password = smtp_config["sender_password"]
-        smtp_server = smtp_config["smtp_server"]
-        smtp_port = smtp_config["smtp_port"]
+        settings = SMTPSettings.from_config(smtp_config or st.secrets["email"])
+        sender_email = settings.sender_email
 
-        with smtplib.SMTP(smtp_server, smtp_port) as server:
-            server.starttls()
-            server.login(sender_email, sender_password)
-            
-            for recipient in valid_recipients:
-                try:
-                    # Personalize body for this recipient
-                    recipient_name = "Utente"
-                    if recipient_names and recipient in recipient_names:
-                        recipient_name = recipient_names[recipient]
-                    
-                    personalized_body = body_html.replace("{recipient_name}", recipient_name)
-                    
-                    # Create message for this recipient
-                    msg = MIMEMultipart()
-                    msg["From"] = sender_email
-                    msg["To"] = recipient
-                    msg["Subject"] = subject
-                    
-                    msg.attach(MIMEText(personalized_body, "html"))
+        builder = BatchMessageBuilder(sender_email, subject, body_html, attachment_df)
 
-                    # Optional: Attach DataFrame as CSV
-                    if attachment_df is not None:
-                        csv_data = attachment_df.to_csv(index=False)
-                        part = MIMEBase('application', "octet-stream")
-                        part.set_payload(csv_data)
-                        encoders.encode_base64(part)
-                        part.add_header('Content-Disposition', 'attachment; filename="calendario.csv"')
-                        msg.attach(part)
-                    
-                    server.sendmail(sender_email, recipient, msg.as_string())
-                    successful.append(recipient)
-                except Exception as e:
-                    failed.append((recipient, str(e)))
-        
-        # Build result message
-        results = {
-            "successful": successful,
-            "failed": failed,
-            "invalid": invalid_recipients
-        }
+        def render(recipient):
+            # Personalize body for this recipient
+            recipient_name = "Utente"
+            if recipient_names and recipient in recipient_names:
+                recipient_name = recipient_names[recipient]
+            return builder.build(recipient, recipient_name=recipient_name)
+
+        # Sent in parallel over up to `max_connections` SMTP sessions
+        errors = deliver(settings, valid_recipients, render)
+        for recipient, error in zip(valid_recipients, errors):
+            if error is None:
+                successful.append(recipient)
+            else:
+                failed.append((recipient, str(error)))
         
-        if successful and not failed and not invalid_recipients:
-            recipient_word = "destinatario" if len(successful) == 1 else "destinatari"
-            return True, f"Email inviate con successo a {len(successful)} {recipient_word}!", results
-        elif successful:
-            msg_parts = [f"✅ Inviate: {len(successful)}"]
-            if failed:
-                msg_parts.append(f"❌ Fallite: {len(failed)}")
-            if invalid_recipients:
-                msg_parts.append(f"⚠️ Non valide: {len(invalid_recipients)}")
-            return True, " | ".join(msg_parts), results
-        else:
-            return False, "Invio fallito per tutti i destinatari.", results
+        return summarize_results(successful, failed, invalid_recipients)
             
     except Exception as e:
         return False, f"Errore di connessione: {str(e)}", {"successful": successful, "failed": failed, "invalid": invalid_recipients}
@@ -1,40 +1,455 @@
+import hashlib
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
 import streamlit as st
-import gspread
-from google.oauth2.service_account import Credentials
-import pandas as pd
+from calendar_core.diff import calendar_diff
+from calendar_core.dimension import dimension_for, parse_local_holidays, working_days
+from calendar_core.export import export_rows, iter_csv, iter_ics, iter_xlsx
+from calendar_core.model import TEAM_COLUMN, build_calendar_model, combine_teams
+from calendar_core.months import find_month_column
+from calendar_core.occupancy import Occupancy
+from calendar_core.overlaps import overlap_index
+from calendar_core.stats import MonthlyAggregates
+from utils.config import get_secret
+from utils.rate_limit import RateLimiter, is_quota_error, limited_http_client
+from utils.sheet_cache import SheetCache
+from utils.sheet_sync import RevisionConflict, SheetData, SheetSource, authorize, sync_worksheets, team_names, write_cells
+from utils.snapshot_store import SnapshotStore
+from utils.timing import phase, register_metrics_source, timed
 
-SCOPES = [
-    "https://www.googleapis.com/auth/spreadsheets",
-    "https://www.googleapis.com/auth/drive",
-]
+logger = logging.getLogger(__name__)
 
+# Shared by all sessions of the process: every rerun reuses the last download
+# until it is older than the TTL or someone presses "Aggiorna dati".
+# Concurrent sessions missing the cache share a single download; with
+# SHEET_STALE_WHILE_REVALIDATE the expired frame is served while it reloads.
+_data_cache = SheetCache(
+    ttl_seconds=get_secret("SHEET_CACHE_TTL", 300),
+    max_entries=get_secret("SHEET_CACHE_MAX_ENTRIES", 8),
+    stale_while_revalidate=get_secret("SHEET_STALE_WHILE_REVALIDATE", False),
+)
+
+# "incremental" checks the spreadsheet revision and only downloads the month
+# blocks that may have changed; "full" always downloads the whole worksheet.
+SYNC_MODE = get_secret("SHEET_SYNC_MODE", "incremental")
+# Rows of months older than the lookback are reused when their block keeps its
+# size; a change after FULL_SYNC_SECONDS from the last full download reads all
+SYNC_LOOKBACK_MONTHS = get_secret("SHEET_SYNC_LOOKBACK_MONTHS", 1)
+FULL_SYNC_SECONDS = get_secret("SHEET_FULL_SYNC_SECONDS", 600)
+# Spreadsheets read in parallel by `load_calendar`
+MAX_WORKERS = get_secret("SHEET_MAX_WORKERS", 4)
+
+# Every new revision is also written to a local snapshot: a cold start renders
+# it at once, and OFFLINE_MODE (or SWC_OFFLINE=1) never talks to Google at all.
+OFFLINE_MODE = bool(get_secret("OFFLINE_MODE", False)) or os.environ.get("SWC_OFFLINE") == "1"
+_snapshots = SnapshotStore(
+    get_secret("SNAPSHOT_PATH", ".cache/snapshots.sqlite3"),
+    keep=get_secret("SNAPSHOT_KEEP", 5),
+)
+# Source keys already loaded once by this process: only their first load may
+# render a snapshot, later misses (e.g. after "Aggiorna dati") wait for Google
+_started = set()
+_started_lock = threading.Lock()
+
+STALE_WARNING = "⚠️ Dati non aggiornati: Google Sheets non ha ancora risposto, mostro l'ultima copia disponibile."
+
+# Every Sheets/Drive request of the process goes through one token bucket
+# (SHEETS_RATE_PER_SECOND, bursts of SHEETS_BURST) and is retried with backoff
+# on quota (429) and server errors, so bursts of users queue instead of failing.
+_rate_limiter = RateLimiter(
+    rate=get_secret("SHEETS_RATE_PER_SECOND", 1.0),
+    burst=get_secret("SHEETS_BURST", 10),
+    max_retries=get_secret("SHEETS_MAX_RETRIES", 5),
+)
+
+# Last frame loaded per calendar (tuple of source keys) and the changes found
+# when it replaced the previous revision, shared by every session
+_last_frames = {}
+_last_changes = {}
+_last_frames_lock = threading.Lock()
+
+# Holidays besides the national ones, e.g. ["06-24", "2026-12-24"]: they are
+# left out of the stats and overlaps like weekends
+LOCAL_HOLIDAYS = parse_local_holidays(get_secret("LOCAL_HOLIDAYS", []))
+
+# Coded models and aggregates are derived once per data revision and shared
+# like the frames
+_derived_cache = SheetCache(ttl_seconds=None, max_entries=4 * get_secret("SHEET_CACHE_MAX_ENTRIES", 8))
+
+@st.cache_resource(show_spinner=False)
+def _authorized_client():
+    """Builds the authorized gspread client once per process."""
+    # Create a dictionary from the secrets object
+    return authorize(dict(st.secrets["gcp_service_account"]), limited_http_client(_rate_limiter))
+
+@timed()
 def connect_to_gsheets():
     """Connects to Google Sheets using credentials from st.secrets."""
     try:
-        # Create a dictionary from the secrets object
-        credentials_dict = dict(st.secrets["gcp_service_account"])
-        
-        creds = Credentials.from_service_account_info(
-            credentials_dict, scopes=SCOPES
-        )
-        client = gspread.authorize(creds)
-        return client
+        return _authorized_client()
     except Exception as e:
         st.error(f"Errore nella connessione a Google Sheets: {e}")
         return None
 
+def _load_snapshot(source):
+    """Returns {title: SheetData} from the latest local snapshots of a source, or None.
+
+    Worksheets without a snapshot are left out.
+    """
+    titles = source.worksheets or [None]
+    tabs = {}
+    for title in titles:
+        key = source.snapshot_key(title)
+        try:
+            stored = _snapshots.load(key)
+        except Exception as e:
+            logger.warning("Cannot read snapshot of %s: %s", key, e)
+            continue
+        if stored:
+            data = SheetData.from_snapshot(*stored)
+            tabs[title or data.worksheet_title] = data
+    return tabs or None
+
+def _sync_source(client, source):
+    """Returns fresh {title: SheetData} for a source, reusing the cached copy when possible."""
+    previous = _data_cache.peek(source.key)
+    tabs = sync_worksheets(
+        client,
+        source.url,
+        source.worksheets,
+        previous,
+        lookback_months=SYNC_LOOKBACK_MONTHS,
+        full_sync_seconds=FULL_SYNC_SECONDS,
+        incremental=SYNC_MODE == "incremental",
+    )
+
+    for title, data in tabs.items():
+        old = (previous or {}).get(title)
+        if old is None or data.revision != old.revision:
+            _save_snapshot(source, title, data)
+    return tabs
+
+def _save_snapshot(source, title, data):
+    """Stores a new revision of a worksheet in the local snapshots."""
+    key = source.snapshot_key(title)
+    try:
+        _snapshots.save(key, data.revision, data.df, data.meta())
+    except Exception as e:
+        # The snapshot is only a fallback: never fail a load because of it
+        logger.warning("Cannot save snapshot of %s: %s", key, e)
+
+def _cached_source(client, source):
+    """Returns ({title: SheetData}, cache outcome) for a source; may run in a worker thread."""
+    def loader():
+        return _sync_source(client, source)
+
+    with _started_lock:
+        cold_start = source.key not in _started
+        _started.add(source.key)
+    snapshot = _load_snapshot(source) if cold_start and _data_cache.peek(source.key) is None else None
+    if snapshot is not None and len(snapshot) == len(source.worksheets or [None]):
+        # Cold start: render the local copy now, reconcile in background
+        _data_cache.put(source.key, snapshot, stale=True)
+        tabs = _data_cache.get(source.key, loader, allow_stale=True)
+        return tabs, "snapshot" if tabs is snapshot else _data_cache.last_outcome()
+    tabs = _data_cache.get(source.key, loader)
+    return tabs, _data_cache.last_outcome()
+
+def _offline_source(source):
+    """Returns the latest snapshots of a source, decoded once per snapshot revision."""
+    try:
+        revisions = tuple(_snapshots.latest_revision(source.snapshot_key(t)) for t in source.worksheets or [None])
+    except Exception as e:
+        logger.warning("Cannot read snapshots of %s: %s", source.url, e)
+        return None
+    if not all(revisions):
+        return _load_snapshot(source)
+    return _data_cache.get(("offline", source.key, revisions), lambda: _load_snapshot(source), allow_stale=False)
+
 def load_data(sheet_url):
     """Loads data from the first worksheet of the given Google Sheet URL."""
+    return load_calendar([SheetSource(sheet_url)])
+
+def load_calendar(sources):
+    """Loads the worksheets of several SheetSources as a single calendar frame.
+
+    Spreadsheets are read in parallel (at most SHEET_MAX_WORKERS at a time),
+    the worksheets of each one with batch requests. With more than one
+    worksheet, the rows get a "team" column naming their worksheet/source.
+
+    The result is cached process-wide (see SHEET_CACHE_TTL) and shared between
+    sessions, so it must not be modified in place. When Google cannot be
+    reached, the last local snapshots are returned instead.
+    """
+    with phase("load_data", sources=len(sources)) as timing:
+        loaded = _load_sources(sources, timing)
+        tabs = _team_tabs(sources, loaded)
+        if not tabs:
+            return None
+        df = _combine(tabs)
+        timing["rows"], timing["cols"] = df.shape
+        return df
+
+def _load_sources(sources, timing):
+    """Body of `load_calendar`; records where the data came from in `timing`."""
+    if OFFLINE_MODE:
+        timing["cache"] = "offline"
+        loaded = [_offline_source(source) for source in sources]
+        if not all(loaded):
+            st.error("Modalità offline: nessuna copia locale del foglio disponibile.")
+        return loaded
+
     client = connect_to_gsheets()
     if not client:
-        return None
-    
-    try:
-        sheet = client.open_by_url(sheet_url)
-        worksheet = sheet.get_worksheet(0)
-        data = worksheet.get_all_records()
-        df = pd.DataFrame(data)
+        timing["cache"] = "snapshot"
+        return [_fallback_to_snapshot(source) for source in sources]
+
+    with ThreadPoolExecutor(max_workers=min(MAX_WORKERS, len(sources)) or 1) as pool:
+        futures = [pool.submit(_cached_source, client, source) for source in sources]
+
+    loaded, outcomes = [], []
+    for source, future in zip(sources, futures):
+        try:
+            tabs, outcome = future.result()
+        except Exception as e:
+            if is_quota_error(e):
+                st.warning("⏳ Troppe richieste a Google Sheets in questo momento: riprova tra poco.")
+            else:
+                st.error(f"Errore nel caricamento dei dati: {e}")
+            tabs, outcome = _fallback_to_snapshot(source), "snapshot"
+        else:
+            if outcome == "snapshot" or _data_cache.reload_error(source.key) is not None:
+                st.warning(STALE_WARNING)
+        loaded.append(tabs)
+        outcomes.append(outcome)
+    timing["cache"] = "/".join(sorted(set(outcomes)))
+    return loaded
+
+def _named_tabs(sources, loaded):
+    """Returns (team, source, title, SheetData) for the {title: SheetData} loaded per source."""
+    tabs = [
+        (source, title, data)
+        for source, source_tabs in zip(sources, loaded)
+        for title, data in (source_tabs or {}).items()
+    ]
+    teams = team_names([(source, title) for source, title, _ in tabs])
+    return [(team, source, title, data) for team, (source, title, data) in zip(teams, tabs)]
+
+def _team_tabs(sources, loaded):
+    """Returns the (team, SheetData) pairs of the {title: SheetData} loaded per source."""
+    return [(team, data) for team, _, _, data in _named_tabs(sources, loaded)]
+
+def _calendar_revision(tabs):
+    """Returns the revision of the frame `_combine` builds from (team, SheetData) pairs."""
+    if len(tabs) == 1:
+        return tabs[0][1].revision
+    return hashlib.sha1(
+        repr([(team, data.worksheet_title, data.revision) for team, data in tabs]).encode()
+    ).hexdigest()[:16]
+
+def _combine(tabs):
+    """Concatenates (team, SheetData) pairs into one frame, cached per revision."""
+    if len(tabs) == 1:
+        return tabs[0][1].df
+
+    revision = _calendar_revision(tabs)
+
+    def build():
+        df = combine_teams([(team, data.df) for team, data in tabs])
+        df.attrs["revision"] = revision
         return df
-    except Exception as e:
-        st.error(f"Errore nel caricamento dei dati: {e}")
+
+    return _derived_cache.get(("combined", revision), build)
+
+def _fallback_to_snapshot(source):
+    """Returns the last local snapshots after a failed load, if there are any."""
+    tabs = _load_snapshot(source)
+    if tabs is None:
+        return None
+    st.warning("Google Sheets non raggiungibile: mostro l'ultima copia locale del calendario.")
+    return tabs
+
+def team_frame(df, team):
+    """Returns the rows of one team of a `load_calendar` frame, cached per revision."""
+    def build():
+        frame = df[df[TEAM_COLUMN] == team].drop(columns=TEAM_COLUMN).reset_index(drop=True)
+        if "revision" in df.attrs:
+            frame.attrs["revision"] = f"{df.attrs['revision']}#{team}"
+        return frame
+
+    return cached_per_revision(df, ("team", team), build)
+
+def cached_per_revision(df, kind, build):
+    """Returns `build()` cached per (kind, data revision) of a `load_data` frame.
+
+    `build` must return an object that is never modified afterwards.
+    """
+    revision = df.attrs.get("revision")
+    if revision is None:
+        return build()
+    return _derived_cache.get((kind, revision), build)
+
+def calendar_model(df):
+    """Returns the integer-coded CalendarModel of a frame returned by `load_data`.
+
+    The model is built once per data revision and shared between sessions.
+    """
+    month_col = find_month_column(list(df.columns))
+    return cached_per_revision(df, "model", lambda: build_calendar_model(df, month_col))
+
+def holiday_calendar(df):
+    """Returns the CalendarDimension (holidays) of the months of a `load_data` frame, or None."""
+    return dimension_for(calendar_model(df), LOCAL_HOLIDAYS)
+
+def working_mask(df):
+    """Returns the (month, day) working-day mask of a `load_data` frame, built once per revision."""
+    return cached_per_revision(df, "working", lambda: working_days(calendar_model(df), LOCAL_HOLIDAYS))
+
+def monthly_aggregates(df):
+    """Returns the MonthlyAggregates of a `load_data` frame over working days, built once per revision."""
+    return cached_per_revision(df, "aggregates", lambda: MonthlyAggregates(calendar_model(df), working_mask(df)))
+
+def overlaps_by_month(df, rule):
+    """Returns month -> overlapping working days for `rule`, computed once per revision."""
+    return cached_per_revision(
+        df, ("overlaps", rule.key), lambda: overlap_index(calendar_model(df), rule, working_mask(df))
+    )
+
+def occupancy_frame(df, start_month, end_month, capacity=None):
+    """Returns the daily headcount per status of a month range of a `load_data` frame.
+
+    The per-day counts of the whole calendar are computed once per revision,
+    each range frame once per (range, capacity, revision).
+    """
+    def build():
+        occupancy = cached_per_revision(df, "occupancy", lambda: Occupancy(calendar_model(df), working_mask(df)))
+        return occupancy.frame(start_month, end_month, capacity)
+    return cached_per_revision(df, ("occupancy", start_month, end_month, capacity), build)
+
+def export_file(df, kind, start_month=None, end_month=None, person=None):
+    """Returns the bytes of a "csv", "xlsx" or "ics" export of a `load_data` frame.
+
+    The file is written by the calendar_core.export writers when the download
+    is requested and not cached: the coded model they read is already shared
+    per revision, and keeping multi-MB files around would defeat their
+    constant-memory streaming.
+    """
+    with phase("export", kind=kind) as timing:
+        model = calendar_model(df)
+        if kind == "ics":
+            data = "".join(iter_ics(model, person, start_month, end_month)).encode("utf-8")
+        else:
+            rows = export_rows(model, start_month, end_month, person)
+            if kind == "xlsx":
+                data = b"".join(iter_xlsx(df, rows))
+            else:
+                data = "".join(iter_csv(df, rows)).encode("utf-8")
+        timing["bytes"] = len(data)
+    return data
+
+def calendar_changes(df, sources):
+    """Diffs a freshly loaded frame against the previous revision seen by this process.
+
+    Returns the changes frame (see `calendar_diff`) the first time a new
+    revision of the calendar of `sources` is seen, and None otherwise, so each
+    change is reported once per process whatever the number of sessions. The
+    first revision loaded after a start is only remembered.
+    """
+    key = tuple(source.key for source in sources)
+    revision = df.attrs.get("revision")
+    with _last_frames_lock:
+        previous = _last_frames.get(key)
+        if revision is None or (previous is not None and previous.attrs.get("revision") == revision):
+            return None
+        _last_frames[key] = df
+    if previous is None:
         return None
+
+    with phase("diff") as timing:
+        changes = calendar_diff(calendar_model(previous), calendar_model(df))
+        timing["changes"] = len(changes)
+    with _last_frames_lock:
+        _last_changes[key] = changes
+    return changes
+
+def last_changes(sources):
+    """Returns the changes of the latest revision of the calendar of `sources`, or None."""
+    with _last_frames_lock:
+        return _last_changes.get(tuple(source.key for source in sources))
+
+def _cell_text(value):
+    """Returns a cell as the text shown in the sheet ("" when empty)."""
+    return "" if value is None or (isinstance(value, float) and value != value) else str(value)
+
+def save_row_edits(sources, loaded_revision, month, person, original, values, team=None):
+    """Writes the edited day cells of one person's month back to the sheet.
+
+    `loaded_revision` is the revision of the `load_calendar` frame the editor
+    was shown from and `original` maps its day columns to the values shown;
+    `values` maps day columns to the new statuses, and unchanged cells are
+    left out. The row is looked up in the cached worksheets of `sources` (only
+    those of `team`, when given). Raises RevisionConflict when the calendar
+    changed since it was shown, LookupError when the row is not found exactly
+    once.
+
+    Costs the Drive revision checks around one batch update, whatever the
+    number of cells: the cached copy is updated with the edits instead of
+    being downloaded again. Returns the number of cells written.
+    """
+    loaded = [_data_cache.peek(source.key) for source in sources]
+    if _calendar_revision(_team_tabs(sources, loaded)) != loaded_revision:
+        raise RevisionConflict("The calendar changed since it was shown")
+
+    matches = []
+    for name, source, title, data in _named_tabs(sources, loaded):
+        if team is not None and name != team:
+            continue
+        if data.month_col is None or "persona" not in data.df.columns:
+            continue
+        df = data.df
+        rows = (df[data.month_col].astype(str) == month) & (df["persona"].astype(str) == person)
+        matches += [(source, title, data, int(row)) for row in np.flatnonzero(rows.to_numpy())]
+    if len(matches) != 1:
+        raise LookupError(f"{len(matches)} rows for {person!r} in {month}")
+    source, title, data, row = matches[0]
+    if any(_cell_text(value) != _cell_text(data.df.at[row, column]) for column, value in original.items()):
+        raise RevisionConflict(f"The row of {person!r} in {month} changed since it was shown")
+
+    edits = {
+        (row, column): _cell_text(value)
+        for column, value in values.items()
+        if _cell_text(value) != _cell_text(original.get(column, data.df.at[row, column]))
+    }
+    if not edits:
+        return 0
+    client = connect_to_gsheets()
+    if not client:
+        raise ConnectionError("Google Sheets is not reachable")
+    with phase("save_edits", cells=len(edits)):
+        edited = write_cells(client, source.url, data, edits)
+    tabs = dict(_data_cache.peek(source.key) or {})
+    tabs[title] = edited
+    _data_cache.put(source.key, tabs)
+    _save_snapshot(source, title, edited)
+    return len(edits)
+
+def refresh_data(sources=None):
+    """Forces the next load of the given SheetSources (default: all) to download them again."""
+    if sources is None:
+        _data_cache.invalidate()
+    for source in sources or []:
+        _data_cache.invalidate(source.key)
+
+def cache_stats():
+    """Returns hit/miss counters of the sheet data cache."""
+    return _data_cache.stats()
+
+def api_stats():
+    """Returns the call/throttled/retried counters of the Google API rate limiter."""
+    return _rate_limiter.stats()
+
+register_metrics_source(lambda: {f"sheet_cache_{name}": value for name, value in cache_stats().items()})
+register_metrics_source(lambda: {f"sheets_api_{name}": value for name, value in api_stats().items()})
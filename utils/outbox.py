@@ -0,0 +1,276 @@
+import hashlib
+import json
+import logging
+import os
+import random
+import smtplib
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+import streamlit as st
+from utils.config import get_secret
+from utils.email_sender import BatchMessageBuilder, validate_email
+from utils.smtp_pool import SMTPSettings, deliver
+from utils.timing import phase
+
+logger = logging.getLogger(__name__)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    job_id TEXT PRIMARY KEY,
+    subject TEXT NOT NULL,
+    body_html TEXT NOT NULL,
+    attachment_csv TEXT,
+    created_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS deliveries (
+    job_id TEXT NOT NULL,
+    recipient TEXT NOT NULL,
+    recipient_name TEXT NOT NULL,
+    status TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    next_attempt_at REAL NOT NULL,
+    last_error TEXT,
+    updated_at REAL NOT NULL,
+    PRIMARY KEY (job_id, recipient)
+);
+CREATE INDEX IF NOT EXISTS deliveries_due ON deliveries (status, next_attempt_at);
+"""
+
+# Delivery states: pending -> sending -> sent | retry (-> sending ...) | failed.
+# Invalid addresses are stored as "invalid" and never attempted.
+PENDING, SENDING, SENT, RETRY, FAILED, INVALID = "pending", "sending", "sent", "retry", "failed", "invalid"
+ACTIVE_STATES = (PENDING, SENDING, RETRY)
+
+
+def is_transient(error):
+    """True for SMTP errors worth retrying: dropped connections, timeouts and 4xx replies."""
+    if isinstance(error, smtplib.SMTPRecipientsRefused):
+        return all(400 <= code < 500 for code, _ in error.recipients.values())
+    if isinstance(error, smtplib.SMTPResponseException):
+        return 400 <= error.smtp_code < 500
+    return isinstance(error, (smtplib.SMTPServerDisconnected, smtplib.SMTPConnectError, OSError))
+
+
+class Outbox:
+    """Durable SQLite queue of outgoing emails, drained by a background thread.
+
+    `enqueue` only writes to the database, so it returns immediately. The
+    worker sends due deliveries through the SMTP pool, retries transient
+    failures with exponential backoff and jitter, and records the outcome of
+    every recipient so the UI can poll it.
+
+    Enqueuing is idempotent: the same content for the same recipients returns
+    the job already queued while it is still being sent, or if it was created
+    less than `dedupe_seconds` ago, so a double click or a rerun does not
+    deliver it twice while a deliberate resend does. Each message also carries
+    a Message-ID derived from the job id and recipient.
+    """
+
+    def __init__(self, path, smtp_config, max_attempts=6, base_delay=5.0, max_delay=600.0,
+                 poll_interval=1.0, dedupe_seconds=10):
+        self.path = path
+        self.smtp_config = dict(smtp_config)
+        # Incomplete settings fail here, where the caller can show it, not in the worker
+        SMTPSettings.from_config(self.smtp_config)
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.poll_interval = poll_interval
+        self.dedupe_seconds = dedupe_seconds
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._worker = None
+
+        with self._connect() as conn:
+            conn.executescript(_SCHEMA)
+            # Sends interrupted by a restart are retried
+            conn.execute("UPDATE deliveries SET status = ? WHERE status = ?", (RETRY, SENDING))
+
+    @contextmanager
+    def _connect(self):
+        """Yields a connection, committing on success and always closing it."""
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        conn = sqlite3.connect(self.path, timeout=30)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    @staticmethod
+    def content_key(subject, body_html, recipients, attachment_csv=None):
+        """Returns the key shared by the jobs sending the same content to the same recipients."""
+        payload = json.dumps([subject, body_html, attachment_csv, sorted(recipients)])
+        return hashlib.sha256(payload.encode()).hexdigest()[:32]
+
+    def _duplicate_of(self, conn, key, now):
+        """Returns the id of the job with content `key` that a new send would duplicate, or None."""
+        # Job ids are "<content key>-<creation time in ms>"
+        row = conn.execute(
+            "SELECT j.job_id FROM jobs j WHERE j.job_id LIKE ? AND (j.created_at > ? "
+            "OR EXISTS (SELECT 1 FROM deliveries d WHERE d.job_id = j.job_id AND d.status IN (?, ?, ?))) "
+            "ORDER BY j.created_at DESC LIMIT 1",
+            (f"{key}-%", now - self.dedupe_seconds, *ACTIVE_STATES),
+        ).fetchone()
+        return row[0] if row else None
+
+    def enqueue(self, recipient_list, subject, body_html, attachment_df=None, recipient_names=None):
+        """Queues one message per recipient and returns the job id."""
+        recipients = list(dict.fromkeys(email.strip() for email in recipient_list))
+        attachment_csv = attachment_df.to_csv(index=False) if attachment_df is not None else None
+        key = self.content_key(subject, body_html, recipients, attachment_csv)
+        now = time.time()
+        with self._lock, self._connect() as conn:
+            job_id = self._duplicate_of(conn, key, now)
+            if job_id is None:
+                job_id = f"{key}-{int(now * 1000)}"
+                conn.execute(
+                    "INSERT INTO jobs VALUES (?, ?, ?, ?, ?)",
+                    (job_id, subject, body_html, attachment_csv, now),
+                )
+                conn.executemany(
+                    "INSERT OR IGNORE INTO deliveries "
+                    "(job_id, recipient, recipient_name, status, next_attempt_at, updated_at) "
+                    "VALUES (?, ?, ?, ?, ?, ?)",
+                    [
+                        (
+                            job_id,
+                            recipient,
+                            (recipient_names or {}).get(recipient, "Utente"),
+                            PENDING if validate_email(recipient) else INVALID,
+                            now,
+                            now,
+                        )
+                        for recipient in recipients
+                    ],
+                )
+        self._wakeup.set()
+        return job_id
+
+    def status(self, job_id):
+        """Returns the deliveries of a job as dicts, in insertion order."""
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT recipient, status, attempts, last_error, next_attempt_at "
+                "FROM deliveries WHERE job_id = ? ORDER BY rowid",
+                (job_id,),
+            ).fetchall()
+        keys = ("recipient", "status", "attempts", "last_error", "next_attempt_at")
+        return [dict(zip(keys, row)) for row in rows]
+
+    def _backoff(self, attempts):
+        delay = min(self.max_delay, self.base_delay * 2 ** (attempts - 1))
+        return delay * random.uniform(0.5, 1.0)
+
+    def process_due(self):
+        """Sends every due delivery once. Returns the number of attempts made."""
+        now = time.time()
+        with self._lock, self._connect() as conn:
+            due = conn.execute(
+                "SELECT d.job_id, d.recipient, d.recipient_name, d.attempts "
+                "FROM deliveries d WHERE d.status IN (?, ?) AND d.next_attempt_at <= ? "
+                "ORDER BY d.next_attempt_at",
+                (PENDING, RETRY, now),
+            ).fetchall()
+            conn.executemany(
+                "UPDATE deliveries SET status = ?, updated_at = ? WHERE job_id = ? AND recipient = ?",
+                [(SENDING, now, job_id, recipient) for job_id, recipient, _, _ in due],
+            )
+
+        by_job = {}
+        for job_id, recipient, name, attempts in due:
+            by_job.setdefault(job_id, []).append((recipient, name, attempts))
+        for job_id, deliveries in by_job.items():
+            try:
+                self._send_job(job_id, deliveries)
+            except Exception as e:
+                # Job row or settings missing, message that cannot be built...:
+                # never leave the deliveries in "sending"
+                logger.warning("Outbox job %s failed: %s", job_id, e)
+                self._record(job_id, deliveries, [e] * len(deliveries))
+        return len(due)
+
+    def _send_job(self, job_id, deliveries):
+        with self._connect() as conn:
+            subject, body_html, attachment_csv = conn.execute(
+                "SELECT subject, body_html, attachment_csv FROM jobs WHERE job_id = ?", (job_id,)
+            ).fetchone()
+
+        settings = SMTPSettings.from_config(self.smtp_config)
+        builder = BatchMessageBuilder(settings.sender_email, subject, body_html, attachment_csv=attachment_csv)
+        names = {recipient: name for recipient, name, _ in deliveries}
+        recipients = list(names)
+        domain = settings.sender_email.rpartition("@")[2] or "localhost"
+
+        def render(recipient):
+            message_id = f"<{job_id}.{hashlib.sha1(recipient.encode()).hexdigest()[:12]}@{domain}>"
+            return builder.build(recipient, message_id=message_id, recipient_name=names[recipient])
+
+        with phase("outbox_send", messages=len(recipients)):
+            try:
+                errors = deliver(settings, recipients, render)
+            except Exception as e:
+                # No connection at all: every recipient failed the same way
+                errors = [e] * len(recipients)
+        self._record(job_id, deliveries, errors)
+
+    def _record(self, job_id, deliveries, errors):
+        """Stores the outcome of one attempt per delivery: sent, retry (transient error) or failed."""
+        now = time.time()
+        updates = []
+        for (recipient, _, attempts), error in zip(deliveries, errors):
+            attempts += 1
+            if error is None:
+                updates.append((SENT, attempts, None, now, now, job_id, recipient))
+            elif is_transient(error) and attempts < self.max_attempts:
+                updates.append((RETRY, attempts, str(error), now + self._backoff(attempts), now, job_id, recipient))
+            else:
+                updates.append((FAILED, attempts, str(error), now, now, job_id, recipient))
+        with self._lock, self._connect() as conn:
+            conn.executemany(
+                "UPDATE deliveries SET status = ?, attempts = ?, last_error = ?, "
+                "next_attempt_at = ?, updated_at = ? WHERE job_id = ? AND recipient = ?",
+                updates,
+            )
+
+    def start(self):
+        """Starts the background worker thread if it is not running yet."""
+        if self._worker is None or not self._worker.is_alive():
+            self._worker = threading.Thread(target=self._run, name="outbox-worker", daemon=True)
+            self._worker.start()
+
+    def _run(self):
+        while True:
+            try:
+                self.process_due()
+            except Exception as e:
+                logger.warning("Outbox worker error: %s", e)
+            self._wakeup.wait(self.poll_interval)
+            self._wakeup.clear()
+
+
+@st.cache_resource(show_spinner=False)
+def get_outbox():
+    """Returns the process-wide outbox, with its worker thread running."""
+    outbox = Outbox(
+        get_secret("OUTBOX_PATH", ".cache/outbox.sqlite3"),
+        st.secrets["email"],
+        max_attempts=get_secret("OUTBOX_MAX_ATTEMPTS", 6),
+    )
+    outbox.start()
+    return outbox
+
+
+def summarize_job(rows):
+    """Groups outbox deliveries like the send_email results dict."""
+    return {
+        "successful": [r["recipient"] for r in rows if r["status"] == SENT],
+        "failed": [(r["recipient"], r["last_error"]) for r in rows if r["status"] == FAILED],
+        "invalid": [r["recipient"] for r in rows if r["status"] == INVALID],
+        "pending": [r for r in rows if r["status"] in ACTIVE_STATES],
+    }
@@ -0,0 +1,116 @@
+import random
+import threading
+import time
+
+import requests
+from gspread.exceptions import APIError
+from gspread.http_client import HTTPClient
+
+
+def is_retryable(error):
+    """True for quota errors (429), server errors (5xx) and dropped connections."""
+    if isinstance(error, APIError):
+        return error.code == 429 or 500 <= error.code < 600
+    return isinstance(error, (requests.exceptions.ConnectionError, requests.exceptions.Timeout))
+
+
+def is_quota_error(error):
+    return isinstance(error, APIError) and error.code == 429
+
+
+class TokenBucket:
+    """Thread-safe token bucket: `rate` tokens per second, at most `capacity` saved up.
+
+    `acquire` reserves a token and sleeps until it is due, so concurrent callers
+    are spaced out at `rate` in arrival order instead of all failing at once.
+    """
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now):
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def acquire(self):
+        """Takes one token, waiting for it if needed. Returns the seconds waited."""
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            self._tokens -= 1
+            wait = -self._tokens / self.rate if self._tokens < 0 else 0.0
+        if wait:
+            time.sleep(wait)
+        return wait
+
+    def drain(self):
+        """Drops the saved-up tokens, e.g. after the server reported a quota error."""
+        with self._lock:
+            self._refill(time.monotonic())
+            self._tokens = min(self._tokens, 0)
+
+
+class RateLimiter:
+    """Token bucket plus retries with exponential backoff and jitter.
+
+    Shared by every session of the process, so that all the calls to Google
+    stay under the quota together. A 429 response also empties the bucket,
+    slowing down every caller, not only the one that got it.
+    """
+
+    def __init__(self, rate=1.0, burst=10, max_retries=5, base_delay=1.0, max_delay=32.0):
+        self.bucket = TokenBucket(rate, burst)
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self._lock = threading.Lock()
+        self._stats = {"calls": 0, "throttled": 0, "throttled_seconds": 0.0, "retried": 0, "failed": 0}
+
+    def _count(self, **increments):
+        with self._lock:
+            for name, value in increments.items():
+                self._stats[name] += value
+
+    def _backoff(self, attempt, error):
+        retry_after = getattr(getattr(error, "response", None), "headers", {}).get("Retry-After")
+        if retry_after and retry_after.isdigit():
+            return min(self.max_delay, float(retry_after))
+        delay = min(self.max_delay, self.base_delay * 2 ** attempt)
+        return delay * random.uniform(0.5, 1.0)
+
+    def call(self, func):
+        """Calls `func()` within the rate limit, retrying transient failures."""
+        for attempt in range(self.max_retries + 1):
+            waited = self.bucket.acquire()
+            self._count(calls=1, throttled=int(waited > 0), throttled_seconds=waited)
+            try:
+                return func()
+            except Exception as e:
+                retryable = is_retryable(e)
+                if not retryable or attempt == self.max_retries:
+                    if retryable:
+                        self._count(failed=1)
+                    raise
+                if is_quota_error(e):
+                    self.bucket.drain()
+                self._count(retried=1)
+                time.sleep(self._backoff(attempt, e))
+
+    def stats(self):
+        """Returns the call, throttle and retry counters."""
+        with self._lock:
+            return dict(self._stats, throttled_seconds=round(self._stats["throttled_seconds"], 3))
+
+
+def limited_http_client(limiter):
+    """Returns a gspread HTTPClient class whose requests all go through `limiter`."""
+
+    class LimitedHTTPClient(HTTPClient):
+        def request(self, *args, **kwargs):
+            return limiter.call(lambda: HTTPClient.request(self, *args, **kwargs))
+
+    return LimitedHTTPClient
@@ -0,0 +1,170 @@
+import logging
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+
+logger = logging.getLogger(__name__)
+
+
+class SheetCache:
+    """Process-wide LRU cache with a TTL, shared by every Streamlit session.
+
+    Values are stored as-is (no copy), so callers must treat them as read-only.
+    Loads are single-flight: concurrent misses on the same key wait for the one
+    loader call already running instead of starting their own. With
+    `stale_while_revalidate`, an expired value is returned immediately while a
+    background thread reloads it; when that reload fails, the error is logged
+    and the value stays expired (see `reload_error`).
+    """
+
+    def __init__(self, ttl_seconds=300, max_entries=8, stale_while_revalidate=False):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.stale_while_revalidate = stale_while_revalidate
+        self._entries = OrderedDict()  # key -> (value, loaded_at)
+        self._inflight = {}  # key -> Future of the running load
+        self._errors = {}  # key -> exception of the last failed background reload
+        self._lock = threading.Lock()
+        self._local = threading.local()  # outcome of the calling thread's last get
+        self._hits = 0
+        self._misses = 0
+        self._coalesced = 0
+        self._stale_hits = 0
+        self._evictions = 0
+        self._failed_reloads = 0
+
+    def _is_fresh(self, loaded_at):
+        return self.ttl_seconds is None or time.monotonic() - loaded_at < self.ttl_seconds
+
+    def get(self, key, loader, allow_stale=None):
+        """Returns the cached value for `key`, calling `loader()` on a miss.
+
+        Exceptions raised by the loader are propagated (to every waiting caller)
+        and nothing is cached. `allow_stale` overrides `stale_while_revalidate`
+        for this call.
+        """
+        if allow_stale is None:
+            allow_stale = self.stale_while_revalidate
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and self._is_fresh(entry[1]):
+                self._entries.move_to_end(key)
+                self._hits += 1
+                self._local.outcome = "hit"
+                return entry[0]
+
+            leader = False
+            flight = self._inflight.get(key)
+            if entry is not None and allow_stale:
+                self._stale_hits += 1
+                self._local.outcome = "stale"
+                if flight is None:
+                    self._start_flight(key, loader, background=True)
+                return entry[0]
+
+            if flight is not None:
+                self._coalesced += 1
+                self._local.outcome = "coalesced"
+            else:
+                self._misses += 1
+                self._local.outcome = "miss"
+                flight = self._start_flight(key, loader)
+                leader = True
+
+        if leader:
+            self._run_flight(key, loader, flight)
+        return flight.result()
+
+    def _start_flight(self, key, loader, background=False):
+        """Registers a load for `key`. Must be called with the lock held."""
+        flight = Future()
+        self._inflight[key] = flight
+        if background:
+            threading.Thread(
+                target=self._run_flight, args=(key, loader, flight, True), daemon=True
+            ).start()
+        return flight
+
+    def _run_flight(self, key, loader, flight, background=False):
+        try:
+            value = loader()
+        except BaseException as e:
+            with self._lock:
+                self._inflight.pop(key, None)
+                if background:
+                    # Nobody waits for this flight: the stale value stays served
+                    self._errors[key] = e
+                    self._failed_reloads += 1
+            if background:
+                logger.warning("Background reload of %r failed: %s", key, e)
+            flight.set_exception(e)
+            return
+        with self._lock:
+            self._store(key, value)
+            self._inflight.pop(key, None)
+        flight.set_result(value)
+
+    def peek(self, key):
+        """Returns the cached value for `key` even if expired, or None."""
+        with self._lock:
+            entry = self._entries.get(key)
+            return entry[0] if entry is not None else None
+
+    def put(self, key, value, stale=False):
+        """Stores `value` under `key`, evicting the least recently used entries.
+
+        A `stale` value is kept but already expired, so it is only served by
+        stale-while-revalidate reads until it is reloaded.
+        """
+        with self._lock:
+            self._store(key, value, stale)
+
+    def reload_error(self, key):
+        """Returns the exception of the last failed background reload of `key`, or None.
+
+        It is cleared when a new value is stored, so a non-None result means the
+        cached value is stale and could not be refreshed.
+        """
+        with self._lock:
+            return self._errors.get(key)
+
+    def _store(self, key, value, stale=False):
+        if not stale:
+            self._errors.pop(key, None)
+        self._entries[key] = (value, float("-inf") if stale else time.monotonic())
+        self._entries.move_to_end(key)
+        while self.max_entries and len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self._evictions += 1
+
+    def invalidate(self, key=None):
+        """Drops `key` from the cache, or every entry when `key` is None."""
+        with self._lock:
+            if key is None:
+                self._entries.clear()
+                self._errors.clear()
+            else:
+                self._entries.pop(key, None)
+                self._errors.pop(key, None)
+
+    def last_outcome(self):
+        """Returns how the calling thread's last `get` was served.
+
+        One of "hit", "stale", "coalesced" or "miss"; None before any `get`.
+        """
+        return getattr(self._local, "outcome", None)
+
+    def stats(self):
+        """Returns hit/miss counters and the current size of the cache."""
+        with self._lock:
+            return {
+                "hits": self._hits,
+                "misses": self._misses,
+                "coalesced": self._coalesced,
+                "stale_hits": self._stale_hits,
+                "evictions": self._evictions,
+                "failed_reloads": self._failed_reloads,
+                "entries": len(self._entries),
+                "inflight": len(self._inflight),
+            }
@@ -0,0 +1,419 @@
+import threading
+import time
+from datetime import datetime
+
+import gspread
+import numpy as np
+import pandas as pd
+from google.oauth2.service_account import Credentials
+from gspread.http_client import HTTPClient
+from gspread.utils import (
+    absolute_range_name,
+    extract_id_from_url,
+    fill_gaps,
+    numericise_all,
+    rowcol_to_a1,
+    to_records,
+)
+
+from calendar_core.months import find_month_column
+
+SCOPES = [
+    "https://www.googleapis.com/auth/spreadsheets",
+    "https://www.googleapis.com/auth/drive",
+]
+
+
+def authorize(credentials_dict, http_client=HTTPClient):
+    """Returns a gspread client for a service account info dict."""
+    creds = Credentials.from_service_account_info(credentials_dict, scopes=SCOPES)
+    return gspread.authorize(creds, http_client=http_client)
+
+
+class SheetData:
+    """A downloaded worksheet plus the bookkeeping needed to sync it incrementally.
+
+    `revision` is the Drive `modifiedTime` of the spreadsheet when the data was
+    read; `blocks` lists the (month label, first row position, row count) runs of
+    consecutive rows in `df`.
+    """
+
+    def __init__(self, df, revision, worksheet_title, header, month_col, blocks, full_synced_at):
+        self.df = df
+        self.revision = revision
+        self.worksheet_title = worksheet_title
+        self.header = header
+        self.month_col = month_col
+        self.blocks = blocks
+        self.full_synced_at = full_synced_at
+        df.attrs["revision"] = revision
+
+    def meta(self):
+        """Returns the JSON-serializable bookkeeping stored with snapshots."""
+        return {
+            "worksheet_title": self.worksheet_title,
+            "header": self.header,
+            "month_col": self.month_col,
+            "blocks": self.blocks,
+        }
+
+    @classmethod
+    def from_snapshot(cls, df, revision, meta):
+        """Rebuilds SheetData from a stored snapshot.
+
+        The first sync after it is a full one: old months edited while the app
+        was not running would otherwise be reused from the snapshot.
+        """
+        blocks = meta.get("blocks")
+        return cls(
+            df,
+            revision,
+            meta.get("worksheet_title"),
+            meta.get("header", list(df.columns)),
+            meta.get("month_col"),
+            [tuple(b) for b in blocks] if blocks is not None else None,
+            float("-inf"),
+        )
+
+
+def _month_blocks(month_values):
+    """Groups consecutive equal month labels into (label, start, length) runs.
+
+    Returns None when a month label appears in more than one run, since such a
+    layout cannot be matched block by block.
+    """
+    blocks = []
+    seen = set()
+    for pos, value in enumerate(month_values):
+        if blocks and blocks[-1][0] == value:
+            label, start, length = blocks[-1]
+            blocks[-1] = (label, start, length + 1)
+            continue
+        if value in seen:
+            return None
+        seen.add(value)
+        blocks.append((value, pos, 1))
+    return blocks
+
+
+def _records_frame(header, rows):
+    """Builds a DataFrame the same way `Worksheet.get_all_records` does."""
+    rows = fill_gaps(rows, cols=len(header)) if rows else []
+    values = [numericise_all(row, False, "", False, []) for row in rows]
+    return pd.DataFrame(to_records(header, values), columns=header)
+
+
+def _is_frozen(month_label, lookback_months):
+    """True for month blocks old enough to be reused without re-downloading them."""
+    try:
+        month = datetime.strptime(str(month_label), "%Y-%m")
+    except ValueError:
+        return False
+    now = datetime.now()
+    age = (now.year - month.year) * 12 + (now.month - month.month)
+    return age > lookback_months
+
+
+class SheetSource:
+    """A spreadsheet and the worksheets to read from it (None: the first one).
+
+    `team` names the rows of a single-worksheet source; otherwise each
+    worksheet title is its team.
+    """
+
+    def __init__(self, url, worksheets=None, team=None):
+        self.url = url
+        self.worksheets = tuple(worksheets) if worksheets else None
+        self.team = team
+
+    @property
+    def key(self):
+        return (self.url, self.worksheets)
+
+    def team_of(self, title):
+        return self.team or title
+
+    def snapshot_key(self, title):
+        """Key of a worksheet in the snapshot store (the bare URL for the first one)."""
+        return self.url if self.worksheets is None else f"{self.url}#{title}"
+
+
+def team_names(tabs):
+    """Returns the team of each (SheetSource, worksheet title) pair of `tabs`.
+
+    Rows are named after their worksheet unless the source sets `team`. When
+    spreadsheets without `team` would share a name (e.g. two first worksheets
+    called "Foglio1"), each of them is named after its URL instead, so that
+    their rows are not merged into one team.
+    """
+    names = [source.team_of(title) for source, title in tabs]
+    urls = {}
+    for (source, _), name in zip(tabs, names):
+        urls.setdefault(name, set()).add(source.url)
+    return [
+        source.snapshot_key(title) if source.team is None and len(urls[name]) > 1 else name
+        for (source, title), name in zip(tabs, names)
+    ]
+
+
+def sources_from_config(config):
+    """Builds SheetSources from a secrets list such as
+    [{"url": "...", "worksheets": ["Team A", "Team B"]}, {"url": "...", "team": "Team C"}].
+    """
+    return [
+        SheetSource(entry["url"], entry.get("worksheets"), entry.get("team"))
+        for entry in map(dict, config)
+    ]
+
+
+_first_titles = {}  # spreadsheet id -> title of its first worksheet
+_first_titles_lock = threading.Lock()
+
+
+def _first_worksheet_title(client, sheet_id):
+    """Returns the title of the first worksheet, asking Google once per spreadsheet."""
+    with _first_titles_lock:
+        title = _first_titles.get(sheet_id)
+        if title is None:
+            metadata = client.http_client.fetch_sheet_metadata(sheet_id, params={"fields": "sheets.properties.title"})
+            title = _first_titles[sheet_id] = metadata["sheets"][0]["properties"]["title"]
+    return title
+
+
+def _sheet_data(title, values, revision):
+    """Builds SheetData from the raw values of a whole worksheet (header first)."""
+    header = values[0] if values else []
+    df = _records_frame(header, values[1:])
+    month_col = find_month_column(header)
+    blocks = _month_blocks([str(v) for v in df[month_col]]) if month_col else None
+    return SheetData(df, revision, title, header, month_col, blocks, time.monotonic())
+
+
+def _needs_full_sync(previous, full_sync_seconds):
+    # Rows without a month label are trimmed from the end of the month column
+    # by the API, so their layout cannot be checked cheaply.
+    return (
+        previous is None
+        or previous.blocks is None
+        or any(label == "" for label, _, _ in previous.blocks)
+        or time.monotonic() - previous.full_synced_at > full_sync_seconds
+    )
+
+
+def sync_worksheets(client, sheet_url, worksheets=None, previous=None, lookback_months=1,
+                    full_sync_seconds=600, incremental=True):
+    """Brings several worksheets of one spreadsheet up to date: returns {title: SheetData}.
+
+    One Drive metadata request tells whether the spreadsheet changed. The
+    worksheets that must be downloaded entirely are read together in a single
+    batch request; with `incremental`, the others only fetch their changed
+    month blocks (see `incremental_sync`), unless their last full download is
+    older than `full_sync_seconds`. `worksheets=None` means the first
+    worksheet; `previous` maps titles to the last SheetData.
+    """
+    previous = previous or {}
+    sheet_id = extract_id_from_url(sheet_url)
+    # Read the change marker first: edits made during the download show up as a
+    # newer revision at the next sync.
+    revision = client.http_client.get_file_drive_metadata(sheet_id)["modifiedTime"]
+    first = worksheets is None and not previous
+    if worksheets is None:
+        worksheets = list(previous) or [_first_worksheet_title(client, sheet_id)]
+
+    result = {}
+    changed = []
+    for title in worksheets:
+        old = previous.get(title)
+        if not incremental or old is None:
+            continue
+        if old.revision == revision:
+            result[title] = old
+        elif not _needs_full_sync(old, full_sync_seconds):
+            changed.append(old)
+    if changed:
+        result.update(_update_tabs(client, sheet_id, changed, revision, lookback_months))
+
+    to_download = [title for title in worksheets if title not in result]
+    if to_download:
+        try:
+            value_ranges = client.http_client.values_batch_get(
+                sheet_id, [absolute_range_name(title) for title in to_download]
+            )["valueRanges"]
+        except Exception:
+            if first:
+                # The first worksheet may have been renamed: ask again next time
+                _first_titles.pop(sheet_id, None)
+            raise
+        for title, value_range in zip(to_download, value_ranges):
+            result[title] = _sheet_data(title, value_range.get("values", []), revision)
+    return {title: result[title] for title in worksheets}
+
+
+def full_sync(client, sheet_url, worksheet=None):
+    """Downloads a whole worksheet (the first one by default)."""
+    tabs = sync_worksheets(client, sheet_url, [worksheet] if worksheet else None, incremental=False)
+    return next(iter(tabs.values()))
+
+
+def incremental_sync(client, sheet_url, previous, lookback_months=1, full_sync_seconds=600):
+    """Brings `previous` up to date, downloading as little as possible.
+
+    Costs one Drive metadata request when the spreadsheet is unchanged. After an
+    edit, it reads the header and month column, reuses the cached rows of month
+    blocks older than `lookback_months` whose size did not change, and fetches
+    every other block in a single batch request. The Sheets API has no cheap
+    checksum of a range, so an edit inside an old month that keeps its size is
+    only picked up by the next change of the spreadsheet after `full_sync_seconds`
+    from the last full download (or by "Aggiorna dati"); an unchanged
+    spreadsheet never needs one.
+    """
+    if previous is None:
+        return full_sync(client, sheet_url)
+    tabs = sync_worksheets(
+        client,
+        sheet_url,
+        [previous.worksheet_title],
+        {previous.worksheet_title: previous},
+        lookback_months=lookback_months,
+        full_sync_seconds=full_sync_seconds,
+    )
+    return tabs[previous.worksheet_title]
+
+
+def _update_tabs(client, sheet_id, previous_tabs, revision, lookback_months):
+    """Incremental part of `sync_worksheets`, with two batch requests in total.
+
+    The first request reads the header and month column of every worksheet, the
+    second every month block that may have changed. Returns {title: SheetData}
+    without the worksheets whose layout changed too much (they need a full sync).
+    """
+    layout_ranges = []
+    for previous in previous_tabs:
+        title = previous.worksheet_title
+        col_letter = rowcol_to_a1(1, previous.header.index(previous.month_col) + 1)[:-1]
+        layout_ranges += [absolute_range_name(title, "1:1"), absolute_range_name(title, f"{col_letter}2:{col_letter}")]
+    layout = client.http_client.values_batch_get(sheet_id, layout_ranges)["valueRanges"]
+
+    plans = []
+    for i, previous in enumerate(previous_tabs):
+        header_rows = layout[2 * i].get("values", [[]])
+        if header_rows[0] != previous.header:
+            continue
+        month_values = [row[0] if row else "" for row in layout[2 * i + 1].get("values", [])]
+        blocks = _month_blocks(month_values)
+        if blocks is None:
+            continue
+        old_blocks = {label: (start, length) for label, start, length in previous.blocks}
+        to_fetch = []
+        for label, start, length in blocks:
+            old = old_blocks.get(label)
+            if old is None or old[1] != length or not _is_frozen(label, lookback_months):
+                to_fetch.append((label, start, length))
+        plans.append((previous, blocks, to_fetch))
+
+    ranges = [
+        absolute_range_name(previous.worksheet_title, f"{start + 2}:{start + length + 1}")
+        for previous, _, to_fetch in plans
+        for _, start, length in to_fetch
+    ]
+    value_ranges = iter(client.http_client.values_batch_get(sheet_id, ranges)["valueRanges"] if ranges else [])
+
+    result = {}
+    for previous, blocks, to_fetch in plans:
+        fetched = {}
+        for label, _, length in to_fetch:
+            rows = next(value_ranges).get("values", [])
+            rows = rows + [[]] * (length - len(rows))
+            fetched[label] = _records_frame(previous.header, rows)
+        result[previous.worksheet_title] = _assemble(previous, blocks, to_fetch, fetched, revision)
+    return result
+
+
+def _assemble(previous, blocks, to_fetch, fetched, revision):
+    """Builds the updated SheetData from the previous frame and the fetched blocks."""
+    # Assemble with one concat and one take instead of slicing every block:
+    # fetched rows are appended after the previous frame and `positions` picks
+    # every row of the new layout from there.
+    old_blocks = {label: (start, length) for label, start, length in previous.blocks}
+    positions = []
+    offset = len(previous.df)
+    for label, start, length in blocks:
+        if label in fetched:
+            positions.append(np.arange(offset, offset + length))
+            offset += length
+        else:
+            old_start, _ = old_blocks[label]
+            positions.append(np.arange(old_start, old_start + length))
+    combined = pd.concat([previous.df] + [fetched[label] for label, _, _ in to_fetch], ignore_index=True)
+    positions = np.concatenate(positions) if positions else np.array([], dtype=int)
+    df = combined.take(positions).reset_index(drop=True)
+
+    return SheetData(
+        df, revision, previous.worksheet_title, previous.header, previous.month_col, blocks,
+        previous.full_synced_at,
+    )
+
+
+class RevisionConflict(Exception):
+    """The spreadsheet changed after the data being edited was read."""
+
+
+def _cell_ranges(data, edits):
+    """Groups edited cells into A1 ranges of consecutive columns of the same row."""
+    columns = {column: data.header.index(column) for _, column in edits}
+    cells = sorted((row, columns[column], value) for (row, column), value in edits.items())
+    runs = []
+    for row, col, value in cells:
+        if runs and runs[-1][0] == row and runs[-1][1] + len(runs[-1][2]) == col:
+            runs[-1][2].append(value)
+        else:
+            runs.append((row, col, [value]))
+    # Sheet rows are 1-based and the header is the first one
+    return [
+        {
+            "range": absolute_range_name(
+                data.worksheet_title,
+                f"{rowcol_to_a1(row + 2, col + 1)}:{rowcol_to_a1(row + 2, col + len(values))}",
+            ),
+            "values": [values],
+        }
+        for row, col, values in runs
+    ]
+
+
+def write_cells(client, sheet_url, data, edits):
+    """Writes edited cells of a worksheet back with a single batch update.
+
+    `edits` maps (row position in `data.df`, column) to the new value. The
+    Drive revision is checked first: if the spreadsheet changed since `data`
+    was read, RevisionConflict is raised and nothing is written. Returns a new
+    SheetData with the edits applied to a copy of the frame, so the sheet is
+    not downloaded again, and the revision read right after the write, which
+    the next save is checked against. An edit made by someone else between
+    the write and that read would be taken for ours: it shows up at the next
+    change of the spreadsheet (or full sync).
+    """
+    sheet_id = extract_id_from_url(sheet_url)
+    revision = client.http_client.get_file_drive_metadata(sheet_id)["modifiedTime"]
+    if revision != data.revision:
+        raise RevisionConflict(
+            f"{data.worksheet_title!r} changed since it was read (revision {revision}, expected {data.revision})"
+        )
+    if not edits:
+        return data
+    client.http_client.values_batch_update(
+        sheet_id, {"valueInputOption": "USER_ENTERED", "data": _cell_ranges(data, edits)}
+    )
+    revision = client.http_client.get_file_drive_metadata(sheet_id)["modifiedTime"]
+
+    df = data.df.copy()
+    for (row, column), value in edits.items():
+        col = df.columns.get_loc(column)
+        try:
+            df.iat[row, col] = value
+        except (TypeError, ValueError):  # text in a numeric column
+            df[column] = df[column].astype(object)
+            df.iat[row, col] = value
+    return SheetData(
+        df, revision, data.worksheet_title, data.header, data.month_col, data.blocks, data.full_synced_at,
+    )
@@ -0,0 +1,150 @@
+import queue
+import smtplib
+import threading
+
+
+class SMTPSettings:
+    """Connection settings of the SMTP relay, read from the [email] secrets section."""
+
+    def __init__(self, smtp_server, smtp_port, sender_email, sender_password,
+                 max_connections=1, max_messages_per_connection=100, starttls=True, timeout=30):
+        self.smtp_server = smtp_server
+        self.smtp_port = smtp_port
+        self.sender_email = sender_email
+        self.sender_password = sender_password
+        self.max_connections = max(1, int(max_connections))
+        self.max_messages_per_connection = int(max_messages_per_connection)
+        self.starttls = starttls
+        self.timeout = timeout
+
+    @classmethod
+    def from_config(cls, smtp_config):
+        return cls(
+            smtp_config["smtp_server"],
+            smtp_config["smtp_port"],
+            smtp_config["sender_email"],
+            smtp_config["sender_password"],
+            # Parallel sessions are opt-in: not every relay accepts them
+            max_connections=smtp_config.get("max_connections", 1),
+            max_messages_per_connection=smtp_config.get("max_messages_per_connection", 100),
+            starttls=smtp_config.get("starttls", True),
+            timeout=smtp_config.get("timeout", 30),
+        )
+
+
+class PooledConnection:
+    """An authenticated SMTP session that reconnects when needed.
+
+    The session is (re)opened lazily, renewed after `max_messages_per_connection`
+    messages, and reopened once if the server dropped it between two messages.
+    """
+
+    def __init__(self, settings):
+        self.settings = settings
+        self.server = None
+        self.sent = 0
+
+    def open(self):
+        self.close()
+        s = self.settings
+        server = smtplib.SMTP(s.smtp_server, s.smtp_port, timeout=s.timeout)
+        try:
+            if s.starttls:
+                server.starttls()
+            server.login(s.sender_email, s.sender_password)
+        except Exception:
+            server.close()
+            raise
+        self.server = server
+        self.sent = 0
+
+    def close(self):
+        if self.server is not None:
+            try:
+                self.server.quit()
+            except Exception:
+                self.server.close()
+            self.server = None
+
+    def send(self, recipient, message_text):
+        limit = self.settings.max_messages_per_connection
+        if self.server is None or (limit and self.sent >= limit):
+            self.open()
+        try:
+            self.server.sendmail(self.settings.sender_email, recipient, message_text)
+        except smtplib.SMTPServerDisconnected:
+            self.open()
+            self.server.sendmail(self.settings.sender_email, recipient, message_text)
+        self.sent += 1
+
+
+def deliver(settings, recipients, render):
+    """Sends one message per recipient over a bounded pool of SMTP connections.
+
+    `render(recipient)` returns the message text. Up to `max_connections`
+    worker threads each hold their own connection and take recipients from a
+    shared queue. Returns the exception raised for each recipient (None on
+    success), in the order of `recipients`.
+
+    The first connection is opened before any worker starts, so an unreachable
+    server or wrong credentials raise here instead of failing every recipient.
+    A worker that cannot open (or renew) its connection, e.g. because the
+    relay limits concurrent sessions, hands its recipient back and stops as
+    long as another worker is running; the last one fails recipients instead.
+    """
+    errors = [None] * len(recipients)
+    if not recipients:
+        return errors
+
+    first = PooledConnection(settings)
+    first.open()
+
+    work = queue.Queue()
+    for i in range(len(recipients)):
+        work.put(i)
+
+    connections = [first] + [
+        PooledConnection(settings)
+        for _ in range(min(settings.max_connections, len(recipients)) - 1)
+    ]
+    lock = threading.Lock()
+    running = [len(connections)]
+
+    def worker(connection):
+        try:
+            while True:
+                try:
+                    i = work.get_nowait()
+                except queue.Empty:
+                    return
+                try:
+                    message_text = render(recipients[i])
+                except Exception as e:
+                    errors[i] = e
+                    continue
+                try:
+                    connection.send(recipients[i], message_text)
+                except Exception as e:
+                    # No session left: it could not be (re)opened
+                    if connection.server is None:
+                        with lock:
+                            if running[0] > 1:
+                                work.put(i)
+                                return
+                    errors[i] = e
+        finally:
+            connection.close()
+            with lock:
+                running[0] -= 1
+
+    threads = [threading.Thread(target=worker, args=(c,), daemon=True) for c in connections[1:]]
+    for t in threads:
+        t.start()
+    worker(first)
+    for t in threads:
+        t.join()
+    if not work.empty():
+        # Handed back by a worker that stopped after the others had finished
+        running[0] = 1
+        worker(PooledConnection(settings))
+    return errors
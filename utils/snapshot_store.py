@@ -0,0 +1,91 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+import pandas as pd
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS snapshots (
+    sheet_url TEXT NOT NULL,
+    revision TEXT NOT NULL,
+    saved_at REAL NOT NULL,
+    meta TEXT NOT NULL,
+    columns TEXT NOT NULL,
+    PRIMARY KEY (sheet_url, revision)
+)
+"""
+
+
+class SnapshotStore:
+    """Local SQLite store of downloaded sheets, keyed by sheet URL and revision.
+
+    Frames are stored column by column as JSON lists, which keeps the mixed
+    str/int cells returned by gspread exactly as they were. Only the `keep`
+    most recent revisions of each sheet are retained.
+    """
+
+    def __init__(self, path, keep=5):
+        self.path = path
+        self.keep = keep
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def _connect(self):
+        """Yields a connection, committing on success and always closing it."""
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        conn = sqlite3.connect(self.path)
+        try:
+            with conn:
+                conn.execute(_SCHEMA)
+                yield conn
+        finally:
+            conn.close()
+
+    def save(self, sheet_url, revision, df, meta=None):
+        """Stores `df` as the snapshot of `sheet_url` at `revision`."""
+        columns = {"names": [str(c) for c in df.columns], "values": [df[c].tolist() for c in df.columns]}
+        with self._lock, self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO snapshots VALUES (?, ?, ?, ?, ?)",
+                (sheet_url, revision, time.time(), json.dumps(meta or {}), json.dumps(columns)),
+            )
+            conn.execute(
+                """DELETE FROM snapshots WHERE sheet_url = ? AND revision NOT IN (
+                       SELECT revision FROM snapshots WHERE sheet_url = ?
+                       ORDER BY saved_at DESC LIMIT ?)""",
+                (sheet_url, sheet_url, self.keep),
+            )
+
+    def load(self, sheet_url, revision=None):
+        """Returns (df, revision, meta) for the latest (or given) revision, or None."""
+        if not os.path.exists(self.path):
+            return None
+        query = "SELECT revision, meta, columns FROM snapshots WHERE sheet_url = ?"
+        params = [sheet_url]
+        if revision is not None:
+            query += " AND revision = ?"
+            params.append(revision)
+        query += " ORDER BY saved_at DESC LIMIT 1"
+        with self._lock, self._connect() as conn:
+            row = conn.execute(query, params).fetchone()
+        if row is None:
+            return None
+        columns = json.loads(row[2])
+        df = pd.DataFrame(dict(zip(columns["names"], columns["values"])), columns=columns["names"])
+        return df, row[0], json.loads(row[1])
+
+    def latest_revision(self, sheet_url):
+        """Returns the revision of the latest snapshot of `sheet_url`, or None, without reading it."""
+        if not os.path.exists(self.path):
+            return None
+        with self._lock, self._connect() as conn:
+            row = conn.execute(
+                "SELECT revision FROM snapshots WHERE sheet_url = ? ORDER BY saved_at DESC LIMIT 1",
+                (sheet_url,),
+            ).fetchone()
+        return row[0] if row else None
@@ -0,0 +1,129 @@
+import contextvars
+import functools
+import math
+import os
+import tempfile
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+# Records of the rerun being executed (each Streamlit script run has its own
+# thread, hence its own context); None outside of a rerun.
+_rerun_records = contextvars.ContextVar("rerun_records", default=None)
+
+ROLLING_WINDOW = 500
+QUANTILES = (0.5, 0.9, 0.99)
+
+_lock = threading.Lock()
+_durations = {}  # phase -> deque of recent durations (seconds)
+_totals = {}     # phase -> [count, sum of seconds]
+_metric_sources = []
+
+
+def begin_rerun():
+    """Starts collecting phase records for the current script run."""
+    _rerun_records.set([])
+
+
+def rerun_records():
+    """Returns the phases recorded so far in the current run."""
+    return list(_rerun_records.get() or [])
+
+
+def _record(name, seconds, fields):
+    with _lock:
+        _durations.setdefault(name, deque(maxlen=ROLLING_WINDOW)).append(seconds)
+        totals = _totals.setdefault(name, [0, 0.0])
+        totals[0] += 1
+        totals[1] += seconds
+    records = _rerun_records.get()
+    if records is not None:
+        records.append({"phase": name, "ms": round(seconds * 1000, 2), **fields})
+
+
+@contextmanager
+def phase(name, **fields):
+    """Times the enclosed block as `name`.
+
+    Yields a dict where the block can add details (rows, cache outcome...)
+    that are stored with the duration.
+    """
+    start = time.perf_counter()
+    try:
+        yield fields
+    finally:
+        _record(name, time.perf_counter() - start, fields)
+
+
+def timed(name=None):
+    """Decorator version of `phase`, named after the function by default."""
+    def decorator(func):
+        phase_name = name or func.__name__
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with phase(phase_name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def register_metrics_source(source):
+    """Adds a callable returning {metric name: value} to the exported metrics."""
+    _metric_sources.append(source)
+
+
+def _quantile(values, q):
+    """Linearly interpolated quantile of sorted `values` (numpy's default method)."""
+    position = (len(values) - 1) * q
+    lo = math.floor(position)
+    hi = min(lo + 1, len(values) - 1)
+    return values[lo] + (values[hi] - values[lo]) * (position - lo)
+
+
+def rolling_percentiles():
+    """Returns {phase: {"count", "p50", "p90", "p99"}} over the recent window, in ms."""
+    with _lock:
+        windows = {name: sorted(values) for name, values in _durations.items()}
+    result = {}
+    for name, values in sorted(windows.items()):
+        result[name] = {"count": len(values)}
+        for q in QUANTILES:
+            result[name][f"p{int(q * 100)}"] = round(_quantile(values, q) * 1000, 2)
+    return result
+
+
+def prometheus_text(prefix="swc"):
+    """Renders the rolling timings and registered metrics in Prometheus text format."""
+    with _lock:
+        windows = {name: sorted(values) for name, values in _durations.items()}
+        totals = {name: tuple(values) for name, values in _totals.items()}
+
+    metric = f"{prefix}_phase_duration_seconds"
+    lines = [
+        f"# HELP {metric} Duration of app phases over the last {ROLLING_WINDOW} runs.",
+        f"# TYPE {metric} summary",
+    ]
+    for name in sorted(windows):
+        for q in QUANTILES:
+            lines.append(f'{metric}{{phase="{name}",quantile="{q}"}} {_quantile(windows[name], q):.6f}')
+        count, total = totals[name]
+        lines.append(f'{metric}_sum{{phase="{name}"}} {total:.6f}')
+        lines.append(f'{metric}_count{{phase="{name}"}} {count}')
+
+    for source in _metric_sources:
+        for name, value in sorted(source().items()):
+            lines.append(f"# TYPE {prefix}_{name} gauge")
+            lines.append(f"{prefix}_{name} {value}")
+    return "\n".join(lines) + "\n"
+
+
+def write_textfile(path):
+    """Atomically writes `prometheus_text()` to `path` (textfile collector format)."""
+    directory = os.path.dirname(path) or "."
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+    with os.fdopen(fd, "w") as f:
+        f.write(prometheus_text())
+    os.replace(tmp_path, path)